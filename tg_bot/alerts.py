@@ -0,0 +1,485 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from dataclasses import astuple, dataclass
+from pathlib import Path
+
+from config import ALERT_SYNC_SECONDS, ALERTS_PATH, MAX_ALERTS_PER_CHAT
+from executor import run_io
+from locks import file_lock
+
+# Направления пересечения уровня
+ABOVE = "above"
+BELOW = "below"
+
+# Записи журнала уведомлений: добавление и удаление
+ADD = "add"
+DELETE = "del"
+
+# Журнал сжимается, когда записей в нем больше, чем уведомлений,
+# плюс этот запас
+COMPACT_SLACK = 1000
+
+
+class AlertLimitError(Exception):
+    """
+    У чата слишком много уведомлений; текст можно показать пользователю.
+    """
+
+
+@dataclass
+class Alert:
+    """
+    Одноразовое уведомление: цена тикера поднялась до уровня (`ABOVE`)
+    или опустилась до него (`BELOW`).
+    """
+
+    id: int
+    chat_id: int
+    ticker: str
+    level: float
+    direction: str
+
+
+class LevelIndex:
+    """
+    Уровни одного направления в отсортированном списке и id уведомлений
+    в параллельном списке на тех же позициях.
+    """
+
+    def __init__(self, levels=None, ids=None):
+        self.levels = levels if levels is not None else []
+        self.ids = ids if ids is not None else []
+
+    def __len__(self):
+        return len(self.levels)
+
+    @classmethod
+    def build(cls, pairs):
+        """
+        Индекс из списка `(уровень, id)` одной сортировкой.
+        """
+        pairs.sort()
+        return cls([level for level, _ in pairs], [alert_id for _, alert_id in pairs])
+
+    def add(self, level, alert_id):
+        position = bisect_right(self.levels, level)
+        self.levels.insert(position, level)
+        self.ids.insert(position, alert_id)
+
+    def remove(self, level, alert_id):
+        # Среди равных уровней ищем нужный id
+        position = bisect_left(self.levels, level)
+        while self.ids[position] != alert_id:
+            position += 1
+        del self.levels[position]
+        del self.ids[position]
+
+    def pop_below(self, price):
+        """
+        Убирает и возвращает id с уровнем не выше `price`.
+        """
+        position = bisect_right(self.levels, price)
+        if not position:
+            return []
+        triggered = self.ids[:position]
+        del self.levels[:position]
+        del self.ids[:position]
+        return triggered
+
+    def pop_above(self, price):
+        """
+        Убирает и возвращает id с уровнем не ниже `price`.
+        """
+        position = bisect_left(self.levels, price)
+        if position == len(self.levels):
+            return []
+        triggered = self.ids[position:]
+        del self.levels[position:]
+        del self.ids[position:]
+        return triggered
+
+
+class AlertBook:
+    """
+    Подписки на пересечение ценой уровня. Для каждого тикера уровни
+    "вверх" и "вниз" лежат в отсортированных индексах, поэтому проверка
+    тика - два бинарных поиска и срез сработавших уведомлений, без
+    перебора всех подписчиков.
+
+    Уведомления хранятся в журнале JSONL, общем для воркеров: первая строка -
+    снимок `{"next_id", "alerts"}`, дальше - записи `["add", ...]`
+    и `["del", id]`. Изменения дописывают одну строку под блокировкой между
+    процессами, предварительно дочитав строки других воркеров; когда записей
+    становится больше, чем уведомлений (плюс `COMPACT_SLACK`), журнал
+    сжимается до снимка. Перечитывание и запись файла - блокирующие, в app
+    они идут через `run_io`, а процесс, проверяющий тики, дочитывает журнал
+    в фоне (`run`), и `check` файла не касается. Сработавшее уведомление
+    остается в журнале, пока сообщение не доставлено (`resolve`); после
+    ошибки отправки оно снова ждет пересечения (`rearm`), а после
+    перезапуска - восстанавливается.
+    """
+
+    def __init__(
+        self,
+        max_per_chat=MAX_ALERTS_PER_CHAT,
+        path=None,
+        sync_interval=ALERT_SYNC_SECONDS,
+    ):
+        """
+        :param max_per_chat: Сколько уведомлений может быть у одного чата;
+        :param path: Путь к журналу уведомлений (None - только в памяти);
+        :param sync_interval: Как часто `run` дочитывает журнал, секунд.
+        """
+        self.max_per_chat = max_per_chat
+        self.path = Path(path) if path else None
+        self.lock_path = self.path.with_suffix(".lock") if self.path else None
+        self.sync_interval = sync_interval
+        self.alerts = {}
+        # Индексы `(тикер, направление) -> LevelIndex`
+        self._indexes = {}
+        self._by_chat = {}
+        self._next_id = 1
+        # Сработавшие уведомления, ожидающие отправки сообщения
+        self._pending = set()
+        # Прочитанная часть журнала: inode (меняется при сжатии), смещение
+        # в байтах и число записей после снимка
+        self._inode = None
+        self._offset = 0
+        self._records = 0
+        # В конце журнала недописанная после сбоя строка
+        self._partial = False
+        # `_lock` защищает книгу в памяти и держится недолго: его ждет
+        # проверка тиков; `_io_lock` - чтение и запись журнала в потоках
+        self._lock = threading.Lock()
+        self._io_lock = threading.RLock()
+        self.checks = 0
+        self.triggered = 0
+        self.reloads = 0
+        self.compactions = 0
+        self.sync()
+
+    def __len__(self):
+        # Без чтения журнала: изменения других воркеров приносит `sync`
+        return len(self.alerts)
+
+    def add(self, chat_id, ticker, level, direction):
+        """
+        Новое уведомление.
+
+        :param chat_id: Чат, в который придет уведомление;
+        :param ticker: Акция;
+        :param level: Уровень цены;
+        :param direction: `ABOVE` или `BELOW`;
+        :return: `Alert`.
+        """
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f"Unknown direction {direction!r}")
+        with self._locked():
+            with self._lock:
+                if len(self._by_chat.get(chat_id, ())) >= self.max_per_chat:
+                    raise AlertLimitError(
+                        f"Можно создать не больше {self.max_per_chat} уведомлений."
+                    )
+                alert = Alert(self._next_id, chat_id, ticker, float(level), direction)
+                self._next_id += 1
+                self._insert(alert)
+            self._append([ADD, *astuple(alert)])
+        return alert
+
+    def remove(self, alert_id, chat_id=None):
+        """
+        Удаление уведомления.
+
+        :param alert_id: Id уведомления;
+        :param chat_id: Если задан, удаляются только уведомления этого чата;
+        :return: Удаленный `Alert` или None, если его нет.
+        """
+        with self._locked():
+            with self._lock:
+                alert = self.alerts.get(alert_id)
+                if alert is None or (
+                    chat_id is not None and alert.chat_id != chat_id
+                ):
+                    return None
+                self._delete(alert)
+            self._append([DELETE, alert_id])
+        return alert
+
+    def for_chat(self, chat_id):
+        """
+        Ожидающие уведомления чата в порядке создания.
+        """
+        self.sync()
+        with self._lock:
+            ids = self._by_chat.get(chat_id, set()) - self._pending
+            return [self.alerts[i] for i in sorted(ids)]
+
+    def check(self, ticker, price):
+        """
+        Сработавшие на цене `price` уведомления. Они убираются из индексов
+        и ждут `resolve` или `rearm`. Журнал не читается: изменения других
+        воркеров приносит `run`.
+
+        :param ticker: Акция;
+        :param price: Новая цена;
+        :return: Список `Alert`.
+        """
+        with self._lock:
+            self.checks += 1
+            ids = []
+            index = self._indexes.get((ticker, ABOVE))
+            if index:
+                ids += index.pop_below(price)
+            index = self._indexes.get((ticker, BELOW))
+            if index:
+                ids += index.pop_above(price)
+            if not ids:
+                return []
+
+            self._pending.update(ids)
+            self.triggered += len(ids)
+            return [self.alerts[alert_id] for alert_id in ids]
+
+    def resolve(self, alert_id):
+        """
+        Сообщение о сработавшем уведомлении доставлено (или чат недоступен):
+        уведомление удаляется.
+        """
+        with self._locked():
+            with self._lock:
+                alert = self.alerts.get(alert_id)
+                if alert is not None:
+                    self._delete(alert)
+                self._pending.discard(alert_id)
+            if alert is not None:
+                self._append([DELETE, alert_id])
+
+    def rearm(self, alert_id):
+        """
+        Сообщение о сработавшем уведомлении не отправлено: уведомление
+        снова ждет пересечения уровня.
+        """
+        with self._lock:
+            if alert_id not in self._pending:
+                return
+            self._pending.discard(alert_id)
+            alert = self.alerts.get(alert_id)
+            if alert is not None:
+                self._index(alert.ticker, alert.direction).add(alert.level, alert.id)
+
+    def sync(self):
+        """
+        Дочитывает записи, которые другие воркеры добавили в журнал. Если
+        журнал сжат (новый inode), книга строится заново: индексы -
+        сортировкой, без блокировки, которую ждет `check`.
+        """
+        if self.path is None:
+            return
+        with self._io_lock:
+            try:
+                f = self.path.open("rb")
+            except FileNotFoundError:
+                return
+            with f:
+                stat = os.fstat(f.fileno())
+                reload = stat.st_ino != self._inode or stat.st_size < self._offset
+                offset = 0 if reload else self._offset
+                if stat.st_size == offset:
+                    return
+                f.seek(offset)
+                records, offset, partial = read_records(f, offset)
+
+            if reload:
+                self._reload(records)
+                self._records = 0
+            else:
+                with self._lock:
+                    for record in records:
+                        self._apply(record)
+            self._records += sum(not isinstance(record, dict) for record in records)
+            self._inode, self._offset, self._partial = stat.st_ino, offset, partial
+
+    async def run(self):
+        """
+        Фоновое дочитывание журнала в процессе, проверяющем тики.
+        """
+        while True:
+            try:
+                await run_io(self.sync)
+            except Exception:
+                logging.exception("Alert log sync failed")
+            await asyncio.sleep(self.sync_interval)
+
+    def stats(self):
+        """
+        Число подписок, проверок и сработавших уведомлений.
+        """
+        return {
+            "alerts": len(self.alerts),
+            "pending": len(self._pending),
+            "checks": self.checks,
+            "triggered": self.triggered,
+            "reloads": self.reloads,
+            "compactions": self.compactions,
+        }
+
+    @contextmanager
+    def _locked(self):
+        # Изменение: дочитать журнал, изменить книгу и дописать запись
+        # под блокировкой, чтобы не пропустить изменения других воркеров
+        if self.path is None:
+            yield
+            return
+        with file_lock(self.lock_path), self._io_lock:
+            self.sync()
+            if self._partial:
+                self._compact()
+            yield
+
+    def _append(self, record):
+        # Вызывается внутри `_locked`
+        if self.path is None:
+            return
+        line = (json.dumps(record) + "\n").encode()
+        with self.path.open("ab") as f:
+            f.write(line)
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._offset += len(line)
+        self._records += 1
+        if self._records > len(self.alerts) + COMPACT_SLACK:
+            self._compact()
+
+    def _compact(self):
+        # Вызывается внутри `_locked` после `sync`: в памяти все записи журнала
+        with self._lock:
+            state = {
+                "next_id": self._next_id,
+                "alerts": [astuple(alert) for alert in self.alerts.values()],
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state) + "\n")
+        os.replace(tmp, self.path)
+        stat = os.stat(self.path)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+        self._records = 0
+        self._partial = False
+        self.compactions += 1
+
+    def _reload(self, records):
+        """
+        Книга из журнала целиком: уведомления - проходом по записям,
+        индексы - одной сортировкой каждого.
+        """
+        alerts, next_id = {}, 1
+        for record in records:
+            if isinstance(record, dict):
+                alerts = {row[0]: Alert(*row) for row in record["alerts"]}
+                next_id = max(next_id, record["next_id"])
+            elif record[0] == ADD:
+                alert = Alert(*record[1:])
+                alerts[alert.id] = alert
+                next_id = max(next_id, alert.id + 1)
+            elif record[0] == DELETE:
+                alerts.pop(record[1], None)
+
+        pending = set(self._pending)
+        by_chat, pairs = {}, {}
+        for alert in alerts.values():
+            by_chat.setdefault(alert.chat_id, set()).add(alert.id)
+            if alert.id not in pending:
+                key = (alert.ticker, alert.direction)
+                pairs.setdefault(key, []).append((alert.level, alert.id))
+        indexes = {key: LevelIndex.build(items) for key, items in pairs.items()}
+
+        with self._lock:
+            # Уведомления, сработавшие во время построения, - из индексов
+            for alert_id in self._pending - pending:
+                alert = alerts.get(alert_id)
+                if alert is not None:
+                    indexes[(alert.ticker, alert.direction)].remove(
+                        alert.level, alert_id
+                    )
+            self.alerts, self._indexes, self._by_chat = alerts, indexes, by_chat
+            self._pending &= set(alerts)
+            self._next_id = max(self._next_id, next_id)
+            self.reloads += 1
+
+    def _apply(self, record):
+        # Запись другого воркера; вызывается под `_lock`
+        if record[0] == ADD:
+            alert = Alert(*record[1:])
+            if alert.id not in self.alerts:
+                self._insert(alert)
+            self._next_id = max(self._next_id, alert.id + 1)
+        elif record[0] == DELETE:
+            alert = self.alerts.get(record[1])
+            if alert is not None:
+                self._delete(alert)
+            self._pending.discard(record[1])
+
+    def _index(self, ticker, direction):
+        index = self._indexes.get((ticker, direction))
+        if index is None:
+            index = self._indexes[(ticker, direction)] = LevelIndex()
+        return index
+
+    def _insert(self, alert):
+        self.alerts[alert.id] = alert
+        self._by_chat.setdefault(alert.chat_id, set()).add(alert.id)
+        self._index(alert.ticker, alert.direction).add(alert.level, alert.id)
+
+    def _delete(self, alert):
+        if alert.id not in self._pending:
+            self._index(alert.ticker, alert.direction).remove(alert.level, alert.id)
+        del self.alerts[alert.id]
+        chat_alerts = self._by_chat[alert.chat_id]
+        chat_alerts.discard(alert.id)
+        if not chat_alerts:
+            del self._by_chat[alert.chat_id]
+
+
+def read_records(f, offset):
+    """
+    Полные строки журнала от текущей позиции файла `f`.
+
+    :param f: Файл, открытый в двоичном режиме;
+    :param offset: Текущая позиция;
+    :return: `(записи, позиция после последней полной строки, осталась ли
+     недописанная строка)`.
+    """
+    records = []
+    for line in f:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            if not line.endswith(b"\n"):
+                # Строку еще дописывают (или запись оборвалась)
+                return records, offset, True
+            offset += len(line)
+            continue
+        # Запись заканчивается скобкой, поэтому разобранная строка полная,
+        # даже без перевода строки (как в файле до появления журнала);
+        # перед следующей записью такой журнал сжимается
+        records.append(record)
+        offset += len(line)
+        if not line.endswith(b"\n"):
+            return records, offset, True
+    return records, offset, False
+
+
+def direction_for(level, price):
+    """
+    Направление уведомления по текущей цене: уровень выше цены -
+    ждем роста, ниже - падения.
+    """
+    return ABOVE if level > price else BELOW
+
+
+# Общая книга уведомлений, проверяется на каждом тике живого потока
+alert_book = AlertBook(path=ALERTS_PATH)
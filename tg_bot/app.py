@@ -5,30 +5,64 @@ import re
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher, F, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.filters.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from dotenv import load_dotenv
 
-from models import arima_model
-from plots import plot_history, plot_predict, viz_avg, viz_candle
+import engines
+import executor
+import metrics
+from alerts import ABOVE, BELOW, AlertLimitError, alert_book, direction_for
+from broadcast import (FAILED, DigestItem, MessageQueue, SendLimiter,
+                       create_broadcaster)
+from config import BOT_MODE, DIGEST_HORIZON, MAX_CANDLES, METRICS_PORT
+from file_ids import file_id_cache
+from forecasts import ForecastCache
+from fsm_storage import create_isolation, create_storage
+from live import live_feed
+from locks import leader
+from market_data import DAILY, MarketDataError, candle_count, source_interval
+from metrics import span
+from models import fit_flights, model_cache
+from plots import (chart_cache, chart_flights, plot_history, plot_predict,
+                   viz_avg, viz_candle)
 from post_processing import get_data_for_plot, post_processing_data
-from pre_processing import data_all, data_grp, data_loader
+from pre_processing import (data_all, data_candles, data_flights, data_grp,
+                            data_loader)
+from price_store import day_range, market_data, price_store
+from webhook import run_webhook
 
 load_dotenv()
 
 # Колонка для парсинга с yfinance
 COL_VALUE = "Adj Close"
 
+# Периоды усреднения графика средней стоимости (см. `data_grp`)
+AVG_FREQUENCIES = {"W": "Неделя", "M": "Месяц", "Q": "Квартал", "Y": "Год"}
+
 # Последнее кол-во дней для отображения на графике совместно с предсказанием
 BACK_DAYS = 15
 
-# Прогноз криптовалют
-TICKERS_PREDICT = []
-
-# Тикеры криптовалют
-TICKERS = []
+# Время начала рассмотрения данных для прогноза
+PREDICT_START_DATE = "2023-01-01"
+
+# Заранее рассчитанные прогнозы популярных тикеров
+forecast_cache = ForecastCache(PREDICT_START_DATE, COL_VALUE)
+
+# Статистика кэшей и объединения запросов на `/metrics`
+metrics.registry.register_stats("price_store", price_store.stats)
+metrics.registry.register_stats("market_data", market_data.stats)
+metrics.registry.register_stats("model_cache", model_cache.stats)
+metrics.registry.register_stats("chart_cache", chart_cache.stats)
+metrics.registry.register_stats("file_ids", file_id_cache.stats)
+metrics.registry.register_stats("forecast_cache", forecast_cache.stats)
+metrics.registry.register_stats("engines", engines.latency_tracker.stats)
+metrics.registry.register_stats("live_feed", live_feed.stats)
+metrics.registry.register_stats("alerts", alert_book.stats)
+for flights in [data_flights, fit_flights, chart_flights, forecast_cache.flights]:
+    metrics.registry.register_stats(f"singleflight_{flights.name}", flights.stats)
 
 # Включаем логирование, чтобы не пропустить важные сообщения
 logging.basicConfig(level=logging.INFO)
@@ -36,8 +70,50 @@ logging.basicConfig(level=logging.INFO)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 # Объект бота
 bot = Bot(token=BOT_TOKEN)
+# Хранилище состояний FSM: в памяти или общее для всех воркеров
+storage = create_storage()
 # Диспетчер
-dp = Dispatcher()
+dp = Dispatcher(storage=storage, events_isolation=create_isolation(storage))
+# Лимиты Telegram на отправку сообщений, общие для рассылки и уведомлений
+send_limiter = SendLimiter()
+# Ежедневная рассылка прогнозов подписчикам
+broadcaster = create_broadcaster(bot, send_limiter)
+metrics.registry.register_stats("broadcast", broadcaster.stats)
+# Очередь сообщений о сработавших уведомлениях о цене
+alert_queue = MessageQueue(bot, send_limiter)
+metrics.registry.register_stats("alert_queue", alert_queue.stats)
+
+
+def coin_ticker(coin):
+    """
+    Тикер из данных кнопки выбора монеты, сохраненных в FSM
+    (например, 'BTC-USD avg' или 'BTC-USD_predict' -> 'BTC-USD').
+    """
+    return re.split(r"[ _]", coin)[0]
+
+
+def request_id(message):
+    """
+    Id запроса для метрик и логов: чат и номер сообщения пользователя.
+    """
+    return f"{message.chat.id}-{message.message_id}"
+
+
+def check_chart_request(start_date, end_date, interval):
+    """
+    Проверка запроса графика до загрузки: провайдер хранит бары нужного
+    интервала за период, а свечей не больше `MAX_CANDLES`.
+
+    :raise MarketDataError: С текстом для пользователя.
+    """
+    start, end = day_range(start_date, end_date)
+    market_data.check_range(start, end, source_interval(interval))
+    count = candle_count(start, end, interval)
+    if count > MAX_CANDLES:
+        raise MarketDataError(
+            f"Слишком много свечей ({count}). "
+            "Выберите свечи крупнее или период короче."
+        )
 
 
 class Form(StatesGroup):
@@ -46,6 +122,7 @@ class Form(StatesGroup):
     time_ranger = State()
     time_rangers = State()
     horizon_predict = State()
+    alert_level = State()
     review = State()
     expect = State()
 
@@ -77,7 +154,6 @@ async def get_name_ticker(message: types.Message) -> None:
 @dp.callback_query(lambda query: query.data in ["BTC-USD", "ETH-USD"])
 async def get_find_ticker(callback: types.CallbackQuery, state: FSMContext):
     selected_coin = callback.data
-    TICKERS.append(selected_coin)
 
     await bot.answer_callback_query(callback.id)
     await state.update_data(coin=selected_coin)
@@ -94,6 +170,11 @@ async def get_find_ticker(callback: types.CallbackQuery, state: FSMContext):
         "Введите временной интервал для построения графика в формате: "
         "YYYY-MM-DD YYYY-MM-DD (например, 2023-01-01 2023-12-31):",
     )
+    await bot.send_message(
+        callback.from_user.id,
+        "Для внутридневного графика добавьте через пробел размер свечи: "
+        "1m, 5m, 15m, 1h, 4h (например, 2024-01-01 2024-01-08 15m).",
+    )
 
 
 # История цен на криптовалюты
@@ -114,7 +195,8 @@ async def send_stock_history(message: types.Message, state: FSMContext):
     Если произошла ошибка при загрузке данных или построении графика,
     будет отправлено сообщение с описанием ошибки пользователю.
     """
-    pattern = re.compile(r"^\d{4}-\d{2}-\d{2} \d{4}-\d{2}-\d{2}$")
+    # Необязательный размер свечи: 5m, 1h, 4h...
+    pattern = re.compile(r"^\d{4}-\d{2}-\d{2} \d{4}-\d{2}-\d{2}( [1-9]\d*[mhd])?$")
 
     time_range = await state.update_data(time_range=message.text)
     if not pattern.match(time_range["time_range"]):
@@ -123,21 +205,43 @@ async def send_stock_history(message: types.Message, state: FSMContext):
         )
         return
 
-    start_date, end_date = time_range["time_range"].split()
+    start_date, end_date, *interval = time_range["time_range"].split()
+    interval = interval[0] if interval else DAILY
+    tickers = [coin_ticker(time_range["coin"])]
 
     await state.clear()
     try:
-        data = await data_loader(start_date, end_date, TICKERS, COL_VALUE)
-        image = await plot_history(data, TICKERS)
-        TICKERS.pop()
-        await bot.send_photo(message.chat.id, photo=image)
+        with metrics.request("send_stock_history", request_id(message), tickers[0]):
+            check_chart_request(start_date, end_date, interval)
+            # Свечи собираются из баров самого крупного подходящего интервала
+            source = source_interval(interval)
+            with span("download") as stage:
+                data = await data_loader(
+                    start_date, end_date, tickers, COL_VALUE, source
+                )
+                stage.size = len(data)
+            # Последние бары - из живого потока, без повторной загрузки
+            data = live_feed.extend(
+                data, tickers, source, end=day_range(start_date, end_date)[1]
+            )
+            if interval != source:
+                with span("aggregate", size=len(data)):
+                    data = await data_candles(data, interval)
+            with span("render"):
+                image = await plot_history(data, tickers)
+            with span("upload"):
+                await file_id_cache.send_photo(bot, message.chat.id, image)
+    except MarketDataError as e:
+        # Понятное пользователю сообщение о недоступности котировок
+        await message.reply(str(e))
     except Exception as e:
         await message.reply(f"An error occurred: {e}")
 
     await state.set_state(Form.expect)
 
 
-# Формирует среднемесячную стоимость крипт. в заданном временном интервале
+# Формирует среднюю стоимость крипт. по неделям, месяцам, кварталам или годам
+# в заданном временном интервале
 
 
 @dp.message(F.text.lower() == "динамика среднемесячной стоимости")
@@ -156,7 +260,6 @@ async def get_name_ticker_01(message: types.Message) -> None:
 @dp.callback_query(lambda query: query.data in ["BTC-USD avg", "ETH-USD avg"])
 async def get_find_ticker_01(callback: types.CallbackQuery, state: FSMContext):
     selected_coin = callback.data
-    TICKERS.append(selected_coin[:-4])
 
     await bot.answer_callback_query(callback.id)
     await state.update_data(coin=selected_coin)
@@ -167,6 +270,33 @@ async def get_find_ticker_01(callback: types.CallbackQuery, state: FSMContext):
     elif selected_coin == "ETH-USD avg":
         await bot.send_message(callback.from_user.id, "Вы выбрали ETH-USD.")
 
+    builder = InlineKeyboardBuilder()
+    for freq, name in AVG_FREQUENCIES.items():
+        builder.add(types.InlineKeyboardButton(text=name, callback_data=f"avg {freq}"))
+    await bot.send_message(
+        callback.from_user.id,
+        "Выберите период усреднения:",
+        reply_markup=builder.as_markup(),
+    )
+
+
+@dp.callback_query(
+    lambda query: query.data in [f"avg {freq}" for freq in AVG_FREQUENCIES]
+)
+async def get_avg_freq(callback: types.CallbackQuery, state: FSMContext):
+    freq = callback.data.split()[1]
+
+    await bot.answer_callback_query(callback.id)
+    # Кнопка периода остается в чате и после построения графика,
+    # когда монета из состояния уже удалена
+    if "coin" not in await state.get_data():
+        await bot.send_message(callback.from_user.id, "Сначала выберите монету.")
+        return
+    await state.update_data(freq=freq)
+    await bot.send_message(
+        callback.from_user.id, f"Период усреднения: {AVG_FREQUENCIES[freq].lower()}."
+    )
+
     await state.set_state(Form.time_ranger)
     await bot.send_message(
         callback.from_user.id,
@@ -192,15 +322,23 @@ async def send_crypto_avg(message: types.Message, state: FSMContext):
         return
 
     start_date, end_date = time_ranger["time_ranger"].split()
+    freq = time_ranger.get("freq") or "M"
 
     await state.clear()
     try:
-
-        data = await data_loader(start_date, end_date, TICKERS, COL_VALUE)
-        data_gr = await data_grp(data, TICKERS)
-        image = await viz_avg(data_gr, TICKERS)
-        TICKERS.pop()
-        await bot.send_photo(message.chat.id, photo=image)
+        tickers = [coin_ticker(time_ranger["coin"])]
+        with metrics.request("send_crypto_avg", request_id(message), tickers[0]):
+            with span("download") as stage:
+                data = await data_loader(start_date, end_date, tickers, COL_VALUE)
+                stage.size = len(data)
+            with span("aggregate"):
+                data_gr = await data_grp(data, tickers, freq)
+            with span("render"):
+                image = await viz_avg(data_gr, tickers, freq)
+            with span("upload"):
+                await file_id_cache.send_photo(bot, message.chat.id, image)
+    except MarketDataError as e:
+        await message.reply(str(e))
     except Exception as e:
         await message.reply(f"An error occurred: {e}")
 
@@ -230,7 +368,6 @@ async def get_name_ticker_02(message: types.Message) -> None:
 @dp.callback_query(lambda query: query.data in ["BTC-USD candle", "ETH-USD candle"])
 async def get_find_ticker_02(callback: types.CallbackQuery, state: FSMContext):
     selected_coin = callback.data
-    TICKERS.append(selected_coin[:-7])
 
     await bot.answer_callback_query(callback.id)
     await state.update_data(coin=selected_coin)
@@ -247,6 +384,11 @@ async def get_find_ticker_02(callback: types.CallbackQuery, state: FSMContext):
         "Введите временной интервал для построения свечного графика стоимости в формате: "
         "YYYY-MM-DD YYYY-MM-DD (например, 2023-01-01 2023-12-31):",
     )
+    await bot.send_message(
+        callback.from_user.id,
+        "Для внутридневного графика добавьте через пробел размер свечи: "
+        "1m, 5m, 15m, 1h, 4h (например, 2024-01-01 2024-01-08 15m).",
+    )
 
 
 @dp.message(Form.time_rangers)
@@ -256,7 +398,7 @@ async def send_crypto_candle(message: types.Message, state: FSMContext):
      в указанном временном диапазоне в виде свечного графика.
 
     """
-    pattern = re.compile(r"^\d{4}-\d{2}-\d{2} \d{4}-\d{2}-\d{2}$")
+    pattern = re.compile(r"^\d{4}-\d{2}-\d{2} \d{4}-\d{2}-\d{2}( [1-9]\d*[mhd])?$")
 
     time_rangers = await state.update_data(time_rangers=message.text)
     if not pattern.match(time_rangers["time_rangers"]):
@@ -265,15 +407,30 @@ async def send_crypto_candle(message: types.Message, state: FSMContext):
         )
         return
 
-    start_date, end_date = time_rangers["time_rangers"].split()
+    start_date, end_date, *interval = time_rangers["time_rangers"].split()
+    interval = interval[0] if interval else DAILY
+    tickers = [coin_ticker(time_rangers["coin"])]
 
     await state.clear()
     try:
-
-        data = await data_all(start_date, end_date, TICKERS)
-        image = await viz_candle(data)
-        TICKERS.pop()
-        await bot.send_photo(message.chat.id, photo=image)
+        with metrics.request("send_crypto_candle", request_id(message), tickers[0]):
+            check_chart_request(start_date, end_date, interval)
+            source = source_interval(interval)
+            with span("download") as stage:
+                data = await data_all(start_date, end_date, tickers, source)
+                stage.size = len(data)
+            data = live_feed.extend(
+                data, tickers, source, end=day_range(start_date, end_date)[1]
+            )
+            if interval != source:
+                with span("aggregate", size=len(data)):
+                    data = await data_candles(data, interval)
+            with span("render"):
+                image = await viz_candle(data)
+            with span("upload"):
+                await file_id_cache.send_photo(bot, message.chat.id, image)
+    except MarketDataError as e:
+        await message.reply(str(e))
     except Exception as e:
         await message.reply(f"An error occurred: {e}")
 
@@ -299,7 +456,6 @@ async def get_name_ticker_predict(message: types.Message) -> None:
 @dp.callback_query(lambda query: query.data in ["BTC-USD_predict", "ETH-USD_predict"])
 async def get_find_ticker_predict(callback: types.CallbackQuery, state: FSMContext):
     selected_coin = callback.data
-    TICKERS_PREDICT.append(selected_coin[:-8])
 
     await bot.answer_callback_query(callback.id)
     await state.update_data(coin=selected_coin)
@@ -324,11 +480,6 @@ async def predict_next_days(message: types.Message, state: FSMContext):
     Прогноз стоимости криптовалют в виде графика на следующий период времени.
 
     """
-    # Время начала рассмотрения данных
-    start_date = "2023-01-01"
-    # Время окончания рассмотрения данных
-    end_date = datetime.now()
-
     if not message.text.isdigit():
         await message.reply(
             "Пожалуйста,"
@@ -338,22 +489,49 @@ async def predict_next_days(message: types.Message, state: FSMContext):
 
     # Горизонт предсказаний
     horizon_predict = await state.update_data(horizon_predict=message.text)
+    tickers = [coin_ticker(horizon_predict["coin"])]
     horizon_predict = int(horizon_predict["horizon_predict"])
 
     try:
-        data = await data_loader(start_date, end_date, TICKERS_PREDICT, COL_VALUE)
-        predict_model, conf = await arima_model(
-            data, TICKERS_PREDICT[0], horizon_predict
-        )
-        predict_df = await post_processing_data(
-            predict_model, end_date, horizon_predict, conf
-        )
-        concat_data = await get_data_for_plot(
-            data, BACK_DAYS, TICKERS_PREDICT[0], predict_df
-        )
-        image = await plot_predict(concat_data)
-        await bot.send_photo(message.chat.id, photo=image)
-        TICKERS_PREDICT.pop()
+        with metrics.request("predict_next_days", request_id(message), tickers[0]):
+            engine = engines.select_engine()
+            forecast = None
+            if engine == "arima":
+                # Прогнозы ARIMA рассчитываются заранее; при пересчете
+                # по запросу этапы "download" и "forecast", а также задержку
+                # движка для `select_engine` замеряет кэш
+                forecast = await forecast_cache.get(tickers[0], horizon_predict)
+            if forecast is not None:
+                data, predict_model, conf, end_date = forecast
+            else:
+                # Горизонт больше заранее рассчитанного или другой движок -
+                # обучаем по запросу
+                end_date = datetime.now()
+                with span("download") as stage:
+                    data = await data_loader(
+                        PREDICT_START_DATE, end_date, tickers, COL_VALUE
+                    )
+                    stage.size = len(data)
+                # Прогноз - только по сохраненной истории, без живого бара:
+                # иначе каждый тик менял бы данные и обучение не попадало
+                # бы в кэш моделей
+                with span("forecast", size=len(data)):
+                    predict_model, conf = await engines.forecast(
+                        data, tickers[0], horizon_predict, engine
+                    )
+            with span("prepare"):
+                predict_df = await post_processing_data(
+                    predict_model, end_date, horizon_predict, conf
+                )
+                concat_data = await get_data_for_plot(
+                    data, BACK_DAYS, tickers[0], predict_df
+                )
+            with span("render"):
+                image = await plot_predict(concat_data)
+            with span("upload"):
+                await file_id_cache.send_photo(bot, message.chat.id, image)
+    except MarketDataError as e:
+        await message.reply(str(e))
     except Exception as e:
         await message.reply(f"An error occurred: {e}")
 
@@ -363,6 +541,182 @@ async def predict_next_days(message: types.Message, state: FSMContext):
     await state.set_state(Form.expect)
 
 
+# Уведомления о пересечении ценой уровня (проверяются на каждом тике
+# живого потока)
+
+
+@dp.message(Command("alert"))
+async def get_name_ticker_alert(message: types.Message) -> None:
+    if not live_feed.enabled:
+        await message.answer("Уведомления недоступны: поток котировок не подключен.")
+        return
+    builder = InlineKeyboardBuilder()
+    builder.add(
+        types.InlineKeyboardButton(text="BTC-USD", callback_data="BTC-USD alert")
+    )
+    builder.add(
+        types.InlineKeyboardButton(text="ETH-USD", callback_data="ETH-USD alert")
+    )
+    await message.answer("Выберите монету:", reply_markup=builder.as_markup())
+
+
+@dp.callback_query(lambda query: query.data in ["BTC-USD alert", "ETH-USD alert"])
+async def get_find_ticker_alert(callback: types.CallbackQuery, state: FSMContext):
+    await bot.answer_callback_query(callback.id)
+    await state.update_data(coin=callback.data)
+    await state.set_state(Form.alert_level)
+    await bot.send_message(
+        callback.from_user.id,
+        "Введите уровень цены (например, 50000). Чтобы задать направление "
+        "явно, добавьте > или < (например, >50000).",
+    )
+
+
+@dp.message(Form.alert_level)
+async def set_price_alert(message: types.Message, state: FSMContext):
+    """
+    Создает уведомление о том, что цена поднялась или опустилась до уровня.
+    Направление без > или < выбирается по последней цене потока.
+    """
+    match = re.fullmatch(r"\s*([<>]?)\s*(\d+(?:[.,]\d+)?)\s*", message.text or "")
+    if match is None:
+        await message.reply("Пожалуйста, введите уровень цены числом.")
+        return
+
+    sign, level = match.group(1), float(match.group(2).replace(",", "."))
+    ticker = coin_ticker((await state.get_data())["coin"])
+    latest = live_feed.latest(ticker)
+    if sign:
+        direction = ABOVE if sign == ">" else BELOW
+    elif latest is not None:
+        direction = direction_for(level, latest[1])
+    else:
+        await message.reply(
+            "Текущая цена пока неизвестна, укажите направление: >уровень или <уровень."
+        )
+        return
+
+    try:
+        alert = await executor.run_io(
+            alert_book.add, message.chat.id, ticker, level, direction
+        )
+    except AlertLimitError as e:
+        await message.reply(str(e))
+    else:
+        action = "поднимется" if direction == ABOVE else "опустится"
+        await message.reply(
+            f"Уведомление #{alert.id}: сообщу, когда {ticker} {action} до {level:g}."
+        )
+    await state.update_data(coin=None)
+    await state.set_state(Form.expect)
+
+
+@dp.message(Command("alerts"))
+async def list_price_alerts(message: types.Message) -> None:
+    alerts = await executor.run_io(alert_book.for_chat, message.chat.id)
+    if not alerts:
+        await message.answer("Уведомлений нет. Создать: /alert")
+        return
+    lines = [
+        f"#{alert.id} {alert.ticker} {'>' if alert.direction == ABOVE else '<'}"
+        f" {alert.level:g}"
+        for alert in alerts
+    ]
+    await message.answer("\n".join(lines + ["Удалить: /unalert <номер>"]))
+
+
+@dp.message(Command("unalert"))
+async def remove_price_alert(message: types.Message, command: CommandObject):
+    args = (command.args or "").strip().lstrip("#")
+    if not args.isdigit():
+        await message.reply("Укажите номер уведомления, например: /unalert 3")
+        return
+    removed = await executor.run_io(
+        alert_book.remove, int(args), chat_id=message.chat.id
+    )
+    if removed is None:
+        await message.reply(f"Уведомления #{args} нет.")
+    else:
+        await message.reply(f"Уведомление #{args} удалено.")
+
+
+def alert_delivered(alert_id):
+    """
+    Итог отправки сообщения об уведомлении: после ошибки уведомление снова
+    ждет пересечения уровня, иначе удаляется.
+    """
+
+    async def on_done(status):
+        if status == FAILED:
+            alert_book.rearm(alert_id)
+        else:
+            # Запись в журнал уведомлений - вне цикла событий
+            await executor.run_io(alert_book.resolve, alert_id)
+
+    return on_done
+
+
+def check_alerts(ticker, timestamp, price):
+    """
+    Обработчик тика живого потока: сообщения о сработавших уведомлениях
+    ставятся в очередь с лимитами отправки.
+    """
+    for alert in alert_book.check(ticker, price):
+        action = "поднялся" if alert.direction == ABOVE else "опустился"
+        alert_queue.put(
+            alert.chat_id,
+            f"{alert.ticker} {action} до {alert.level:g}: сейчас {price:.2f}.",
+            alert_delivered(alert.id),
+        )
+
+
+live_feed.listeners.append(check_alerts)
+
+
+# Ежедневный дайджест прогнозов
+
+
+@dp.message(Command("digest"))
+async def subscribe_digest(message: types.Message) -> None:
+    if await executor.run_io(broadcaster.subscribers.add, message.chat.id):
+        await message.answer(
+            "Вы подписались на ежедневный дайджест прогнозов. Отписаться: /stopdigest"
+        )
+    else:
+        await message.answer("Вы уже подписаны. Отписаться: /stopdigest")
+
+
+@dp.message(Command("stopdigest"))
+async def unsubscribe_digest(message: types.Message) -> None:
+    if await executor.run_io(broadcaster.subscribers.remove, message.chat.id):
+        await message.answer("Вы отписались от дайджеста.")
+    else:
+        await message.answer("Вы не подписаны. Подписаться: /digest")
+
+
+async def render_digest():
+    """
+    Графики прогноза на `DIGEST_HORIZON` дней для заранее рассчитываемых
+    тикеров - отрисовываются один раз на всю рассылку.
+
+    :return: Список `DigestItem`.
+    """
+    items = []
+    for ticker in forecast_cache.tickers:
+        data, predict_model, conf, end_date = await forecast_cache.get(
+            ticker, DIGEST_HORIZON
+        )
+        predict_df = await post_processing_data(
+            predict_model, end_date, DIGEST_HORIZON, conf
+        )
+        concat_data = await get_data_for_plot(data, BACK_DAYS, ticker, predict_df)
+        image = await plot_predict(concat_data)
+        items.append(
+            DigestItem(ticker, image, f"{ticker}: прогноз на {DIGEST_HORIZON} дней")
+        )
+    return items
+
+
 # Реализация логики оставления отзыва
 
 
@@ -388,13 +742,51 @@ async def get_feedback(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(Form.expect)
 
 
+# Фоновые задачи, запущенные вместе с диспетчером
+background_tasks = set()
+
+
+def start_background_jobs():
+    """
+    Фоновые задачи ведущего процесса.
+    """
+    jobs = [forecast_cache.run(), broadcaster.run_daily(render_digest)]
+    if live_feed.enabled:
+        jobs += [live_feed.run(), alert_queue.run(), alert_book.run()]
+    for job in jobs:
+        background_tasks.add(asyncio.create_task(job))
+
+
+@dp.startup()
+async def on_startup():
+    # В режиме вебхука с несколькими воркерами фоновые задачи выполняет
+    # только один из них
+    background_tasks.add(asyncio.create_task(leader.run(start_background_jobs)))
+
+
+@dp.shutdown()
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    leader.release()
+    executor.shutdown()
+
+
 # Start polling
 async def main():
+    # В режиме вебхука метрики отдает веб-сервер бота
+    metrics_runner = await metrics.start_server() if METRICS_PORT else None
     try:
         await dp.start_polling(bot, skip_updates=True)
     finally:
         await dp.storage.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        run_webhook(dp, bot)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,225 @@
+"""
+Walk-forward бэктест движков прогноза на сохраненных или синтетических
+ценах (без сети).
+
+Запуск:
+    python tg_bot/backtest.py --engine arima --train 730 --horizon 14 --windows 20
+    python tg_bot/backtest.py --engine ets --store .price_store --ticker BTC-USD
+
+История проигрывается по скользящим точкам отсечения: модель обучается
+на `--train` барах до точки и прогнозирует `--horizon` дней после нее
+тем же путем, что и в боте (`engines`, затем `post_processing_data`).
+Окна распределяются по пулу процессов; для каждого окна и в сумме
+печатаются MAE, MAPE, покрытие 95% доверительным интервалом и время
+обучения.
+"""
+
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import executor
+from engines import FORECASTERS, arima_forecast
+from executor import run_cpu
+from post_processing import post_processing_data
+
+# Синхронные прогнозы для бэктеста: ARIMA без кэша моделей и быстрые движки
+BACKTEST_FORECASTERS = {"arima": arima_forecast, **FORECASTERS}
+
+
+@dataclass
+class WindowResult:
+    """
+    Точность и стоимость прогноза от одной точки отсечения.
+    """
+
+    # Первая прогнозируемая дата
+    origin: object
+    # Обучение и прогноз в процессе пула, секунд
+    fit_seconds: float
+    mae: float
+    mape: float
+    # Доля фактических цен внутри доверительного интервала
+    coverage: float
+
+
+def walk_forward_origins(n_bars, train, horizon, step=None, windows=None):
+    """
+    Позиции точек отсечения: перед каждой не меньше `train` баров,
+    после - не меньше `horizon`.
+
+    :param n_bars: Длина ряда;
+    :param train: Баров истории для обучения;
+    :param horizon: Горизонт прогноза;
+    :param step: Шаг между точками (по умолчанию `horizon`);
+    :param windows: Сколько последних точек оставить (по умолчанию все);
+    :return: Список позиций.
+    """
+    origins = list(range(train, n_bars - horizon + 1, step or horizon))
+    if windows is not None:
+        origins = origins[-windows:] if windows else []
+    return origins
+
+
+def fit_window(forecaster, values, periods):
+    """
+    Обучение и прогноз одного окна (синхронно, для пула вычислений).
+
+    :param forecaster: Синхронный прогноз `forecaster(values, periods, state)`;
+    :param values: История до точки отсечения;
+    :param periods: Горизонт прогноза;
+    :return: `(предсказание, доверительный интервал, секунд)`.
+    """
+    started = time.perf_counter()
+    predict, conf, _ = forecaster(values, periods, None)
+    return np.asarray(predict), np.asarray(conf), time.perf_counter() - started
+
+
+async def backtest_window(series, origin, train, horizon, forecaster):
+    """
+    Прогноз от точки `origin` и его сравнение с фактом.
+
+    :param series: Ряд стоимости с индексом дат;
+    :param origin: Позиция точки отсечения в `series`;
+    :param train: Баров истории для обучения;
+    :param horizon: Горизонт прогноза;
+    :param forecaster: Синхронный прогноз;
+    :return: `WindowResult`.
+    """
+    history = series.iloc[origin - train : origin].to_numpy(dtype="f8")
+    predict, conf, seconds = await run_cpu(fit_window, forecaster, history, horizon)
+    # Даты прогноза строятся так же, как в боте: от дня после истории
+    predict_df = await post_processing_data(
+        predict, series.index[origin], horizon, conf
+    )
+    actual = series.reindex(predict_df.index).to_numpy(dtype="f8")
+    errors = predict_df["prediction"].to_numpy() - actual
+    covered = (actual >= predict_df["left_int"].to_numpy()) & (
+        actual <= predict_df["right_int"].to_numpy()
+    )
+    return WindowResult(
+        origin=predict_df.index[0],
+        fit_seconds=seconds,
+        mae=float(np.nanmean(np.abs(errors))),
+        mape=float(np.nanmean(np.abs(errors / actual)) * 100),
+        coverage=float(covered[~np.isnan(actual)].mean() * 100),
+    )
+
+
+async def backtest(
+    series, engine="arima", train=730, horizon=14, step=None, windows=None
+):
+    """
+    Walk-forward бэктест движка: окна обучаются параллельно в пуле
+    вычислений.
+
+    :param series: Дневной ряд стоимости с индексом дат без пропусков;
+    :param engine: Имя движка из `BACKTEST_FORECASTERS`;
+    :param train: Баров истории для обучения;
+    :param horizon: Горизонт прогноза;
+    :param step: Шаг между точками отсечения (по умолчанию `horizon`);
+    :param windows: Сколько последних окон проверить (по умолчанию все);
+    :return: Список `WindowResult` в порядке точек отсечения.
+    """
+    if engine not in BACKTEST_FORECASTERS:
+        raise ValueError(
+            f"Unknown engine {engine!r}, expected one of {list(BACKTEST_FORECASTERS)}"
+        )
+    series = series.dropna()
+    origins = walk_forward_origins(len(series), train, horizon, step, windows)
+    return await asyncio.gather(
+        *(
+            backtest_window(
+                series, origin, train, horizon, BACKTEST_FORECASTERS[engine]
+            )
+            for origin in origins
+        )
+    )
+
+
+def summarize(results):
+    """
+    Сводка по окнам: средние ошибки и покрытие, время обучения.
+
+    :param results: Список `WindowResult`;
+    :return: Словарь метрик.
+    """
+    fit_seconds = np.array([result.fit_seconds for result in results])
+    return {
+        "windows": len(results),
+        "mae": float(np.mean([result.mae for result in results])),
+        "mape": float(np.mean([result.mape for result in results])),
+        "coverage": float(np.mean([result.coverage for result in results])),
+        "fit_seconds_median": float(np.median(fit_seconds)),
+        "fit_seconds_total": float(fit_seconds.sum()),
+    }
+
+
+def load_series(args):
+    """
+    Ряд для бэктеста: из локального хранилища котировок или синтетический.
+    """
+    if args.store:
+        from market_data import MarketDataError
+        from price_store import PriceStore
+
+        def offline(ticker, start, end, interval):
+            raise MarketDataError("Бэктест работает без сети.")
+
+        data = PriceStore(args.store, fetch=offline).stored(args.ticker)
+        # Ряд должен идти по дням без пропусков, как в `data_loader`
+        return data[args.column].asfreq("D").ffill()
+
+    from synthetic import make_ohlc
+
+    n_days = args.train + args.horizon * (args.windows or 20)
+    return make_ohlc(n_days, seed=args.seed)[args.column]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--engine", default="arima", choices=list(BACKTEST_FORECASTERS))
+    parser.add_argument("--train", type=int, default=730, help="баров истории")
+    parser.add_argument("--horizon", type=int, default=14)
+    parser.add_argument("--step", type=int, default=None)
+    parser.add_argument("--windows", type=int, default=20)
+    parser.add_argument("--store", default=None, help="каталог PriceStore")
+    parser.add_argument("--ticker", default="BTC-USD")
+    parser.add_argument("--column", default="Adj Close")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    series = load_series(args)
+    started = time.perf_counter()
+    try:
+        results = asyncio.run(
+            backtest(
+                series, args.engine, args.train, args.horizon, args.step, args.windows
+            )
+        )
+    finally:
+        executor.shutdown()
+    elapsed = time.perf_counter() - started
+
+    print(f"{'origin':<12}{'fit, ms':>10}{'MAE':>10}{'MAPE, %':>10}{'cover, %':>10}")
+    for result in results:
+        print(
+            f"{result.origin:%Y-%m-%d}  {result.fit_seconds * 1000:>10.1f}"
+            f"{result.mae:>10.2f}{result.mape:>10.2f}{result.coverage:>10.1f}"
+        )
+    summary = summarize(results)
+    print(
+        f"{args.engine}: {summary['windows']} windows in {elapsed:.2f}s"
+        f" (fit {summary['fit_seconds_total']:.2f}s),"
+        f" MAE {summary['mae']:.2f}, MAPE {summary['mape']:.2f}%,"
+        f" coverage {summary['coverage']:.1f}%"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Бенчмарк уведомлений о цене на файловой книге, как в боте (без сети).
+
+Запуск:
+    python tg_bot/bench_alerts.py --alerts 300000 --ticks 100000
+
+Журнал `alerts.AlertBook` во временном каталоге заполняется снимком из
+`--alerts` уведомлений с уровнями вокруг текущей цены. Печатаются время
+загрузки книги воркером, перцентили `add` и `remove` (блокировка файла,
+дочитывание журнала и запись строки), дочитывания одной записи другого
+воркера, проверки одного тика при случайном блуждании цены и, для
+сравнения, время перебора всех уведомлений на части тиков.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from alerts import ABOVE, AlertBook, direction_for
+
+
+def percentiles(timings):
+    timings = np.asarray(timings) * 1e6
+    return (
+        f"p50 {np.percentile(timings, 50):.1f}"
+        f"  p99 {np.percentile(timings, 99):.1f}  max {timings.max():.1f}"
+    )
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--alerts", type=int, default=300000)
+    parser.add_argument("--ticks", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=2000, help="замеров add/remove")
+    parser.add_argument("--spread", type=float, default=0.2, help="разброс уровней")
+    parser.add_argument("--volatility", type=float, default=0.0005)
+    parser.add_argument("--scan-ticks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    price = 40000.0
+    levels = price * (1 + rng.uniform(-args.spread, args.spread, args.alerts))
+    directory = tempfile.TemporaryDirectory()
+    path = Path(directory.name) / "alerts.json"
+    path.write_text(
+        json.dumps(
+            {
+                "next_id": args.alerts + 1,
+                "alerts": [
+                    [i + 1, i, "BTC-USD", level, direction_for(level, price)]
+                    for i, level in enumerate(levels.tolist())
+                ],
+            }
+        )
+        + "\n"
+    )
+
+    # Воркер, проверяющий тики, и воркер, принимающий команды
+    checker, load = timed(AlertBook, args.alerts, path)
+    handler = AlertBook(max_per_chat=args.alerts, path=path)
+
+    adds, removes, syncs = [], [], []
+    for level in (price * (1 + rng.uniform(-0.5, 0.5, args.ops))).tolist():
+        alert, elapsed = timed(
+            handler.add, 0, "ETH-USD", level, direction_for(level, price)
+        )
+        adds.append(elapsed)
+        syncs.append(timed(checker.sync)[1])
+        removes.append(timed(handler.remove, alert.id)[1])
+        checker.sync()
+
+    prices = price * np.exp(np.cumsum(rng.normal(0, args.volatility, args.ticks)))
+    timings = np.empty(args.ticks)
+    triggered = 0
+    for i, tick in enumerate(prices.tolist()):
+        started = time.perf_counter()
+        alerts = checker.check("BTC-USD", tick)
+        timings[i] = time.perf_counter() - started
+        # Сообщения "доставлены" - уведомления удаляются из журнала
+        # (в боте - в пуле ввода-вывода, вне проверки тиков)
+        for alert in alerts:
+            checker.resolve(alert.id)
+        triggered += len(alerts)
+
+    # Перебор всех уведомлений на каждом тике - то, что заменяет индекс
+    alerts = list(checker.alerts.values())
+    started = time.perf_counter()
+    for tick in prices[: args.scan_ticks].tolist():
+        [
+            alert
+            for alert in alerts
+            if (
+                tick >= alert.level if alert.direction == ABOVE else tick <= alert.level
+            )
+        ]
+    scan = (time.perf_counter() - started) / max(args.scan_ticks, 1) * 1e6
+
+    print(f"alerts        {args.alerts} loaded in {load:.2f}s")
+    print(f"add, us       {percentiles(adds)}")
+    print(f"remove, us    {percentiles(removes)}")
+    print(f"sync, us      {percentiles(syncs)}")
+    print(f"check, us     {percentiles(timings)}")
+    print(f"triggered     {triggered} over {args.ticks} ticks, {len(checker)} left")
+    print(f"linear scan   {scan:.1f} us per tick over {len(alerts)} alerts")
+    print(f"log           {path.stat().st_size / 1e6:.1f} MB, {checker.stats()}")
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Сравнение задержки отрисовки свечного графика по способам отрисовки.
+
+Запуск: `python tg_bot/bench_candle.py [--repeat 20]`.
+"""
+
+import argparse
+import importlib.util
+import time
+
+import numpy as np
+
+from plots import CANDLE_RENDERERS
+from synthetic import make_ohlc
+
+# Число дневных свечей на графике
+SIZES = [30, 365, 365 * 4]
+
+
+def available_backends():
+    backends = ["agg"]
+    if importlib.util.find_spec("kaleido") is not None:
+        backends.append("kaleido")
+    return backends
+
+
+def bench(render, data, repeat):
+    """
+    Время первой (холодной) отрисовки и медиана последующих, мс.
+    """
+    started = time.perf_counter()
+    render(data)
+    cold = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(data)
+        timings.append((time.perf_counter() - started) * 1000)
+    return cold, float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'backend':<10}{'candles':>8}{'cold, ms':>12}{'p50, ms':>10}{'p95, ms':>10}"
+    )
+    for backend in available_backends():
+        for size in SIZES:
+            cold, p50, p95 = bench(
+                CANDLE_RENDERERS[backend], make_ohlc(size), args.repeat
+            )
+            print(f"{backend:<10}{size:>8}{cold:>12.1f}{p50:>10.1f}{p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
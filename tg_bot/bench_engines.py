@@ -0,0 +1,77 @@
+"""
+Сравнение движков прогноза по времени обучения и точности на синтетических
+ценах (без сети).
+
+Запуск:
+    python tg_bot/bench_engines.py --days 730 --horizon 14 --origins 5
+
+Для каждого движка из `engines.ENGINES` модель обучается на `--days`
+барах, заканчивающихся в одной из `--origins` точек отсечения, и
+прогнозирует `--horizon` дней вперед. Печатается таблица: медиана времени
+обучения с прогнозом, MAE, MAPE и доля фактических цен внутри 95%
+доверительного интервала.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from engines import FORECASTERS, arima_forecast
+from synthetic import make_prices
+
+
+def evaluate(forecaster, prices, days, horizon, origins):
+    """
+    Прогнозы от нескольких точек отсечения.
+
+    :return: `(медиана времени, секунд, MAE, MAPE %, покрытие интервалом %)`.
+    """
+    timings, errors, actuals, covered = [], [], [], []
+    state = None
+    for origin in origins:
+        history = prices[origin - days : origin]
+        actual = prices[origin : origin + horizon]
+        started = time.perf_counter()
+        mean, conf, state = forecaster(history, horizon, state)
+        timings.append(time.perf_counter() - started)
+        conf = np.asarray(conf)
+        errors.append(np.asarray(mean) - actual)
+        actuals.append(actual)
+        covered.append((actual >= conf[:, 0]) & (actual <= conf[:, 1]))
+    errors, actuals = np.concatenate(errors), np.concatenate(actuals)
+    return (
+        float(np.median(timings)),
+        float(np.abs(errors).mean()),
+        float(np.abs(errors / actuals).mean() * 100),
+        float(np.concatenate(covered).mean() * 100),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--days", type=int, default=730, help="баров истории")
+    parser.add_argument("--horizon", type=int, default=14)
+    parser.add_argument("--origins", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    n_days = args.days + args.horizon * args.origins
+    prices = make_prices(n_days, seed=args.seed)["BTC-USD"].to_numpy()
+    origins = range(args.days, n_days - args.horizon + 1, args.horizon)
+
+    print(f"{'engine':<10}{'fit, ms':>10}{'MAE':>10}{'MAPE, %':>10}{'cover, %':>10}")
+    for name, forecaster in {"arima": arima_forecast, **FORECASTERS}.items():
+        seconds, mae, mape, coverage = evaluate(
+            forecaster, prices, args.days, args.horizon, origins
+        )
+        print(
+            f"{name:<10}{seconds * 1000:>10.1f}{mae:>10.2f}"
+            f"{mape:>10.2f}{coverage:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Задержка чтения и записи FSM для хранилища в памяти и общего хранилища.
+
+Запуск: `python tg_bot/bench_fsm.py [--n 2000] [--redis-url redis://localhost:6379/0]`.
+Без `--redis-url` общее хранилище измеряется на локальной замене Redis
+(fakeredis): она показывает накладные расходы клиента и сериализации,
+но не сетевую задержку.
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from fakeredis.aioredis import FakeRedis
+
+from fsm_storage import create_isolation, create_storage
+
+
+async def bench_storage(storage, n):
+    """
+    Время операций FSM (мкс) по `n` пользователям.
+    """
+    isolation = create_isolation(storage)
+    timings = {"set_state": [], "get_state": [], "update_data": [], "get_data": []}
+    if isolation is not None:
+        timings["lock"] = []
+
+    for user_id in range(n):
+        state = FSMContext(
+            storage, StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        )
+        operations = [
+            ("set_state", lambda: state.set_state("Form:time_range")),
+            ("get_state", state.get_state),
+            ("update_data", lambda: state.update_data(coin="BTC-USD")),
+            ("get_data", state.get_data),
+        ]
+        for name, operation in operations:
+            started = time.perf_counter()
+            await operation()
+            timings[name].append((time.perf_counter() - started) * 1e6)
+
+        if isolation is not None:
+            started = time.perf_counter()
+            async with isolation.lock(state.key):
+                pass
+            timings["lock"].append((time.perf_counter() - started) * 1e6)
+
+    await storage.close()
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args()
+
+    backends = {
+        "memory": create_storage(url=""),
+        "fakeredis": create_storage(redis=FakeRedis()),
+    }
+    if args.redis_url:
+        backends["redis"] = create_storage(url=args.redis_url)
+
+    print(f"{'backend':<12}{'operation':<14}{'p50, us':>10}{'p95, us':>10}")
+    for backend, storage in backends.items():
+        timings = await bench_storage(storage, args.n)
+        for name, values in timings.items():
+            p50, p95 = np.percentile(values, [50, 95])
+            print(f"{backend:<12}{name:<14}{p50:>10.1f}{p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Бенчмарк слоя загрузки котировок на локальном HTTP-источнике (без сети).
+
+Запуск:
+    python tg_bot/bench_market_data.py --requests 200 --latency 0.02 --fail-rate 0.1
+
+Параллельные запросы проходят через общий лимит частоты и повторы
+`market_data.MarketData`; печатаются перцентили задержки, число повторов
+и время ожидания лимита.
+"""
+
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fake_market import FakeMarketServer
+from market_data import HttpProvider, MarketData, TokenBucket
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="секунд")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="доля 503")
+    parser.add_argument("--rate", type=float, default=50, help="запросов в секунду")
+    parser.add_argument("--burst", type=int, default=10)
+    args = parser.parse_args()
+
+    with FakeMarketServer(latency=args.latency) as server:
+        # Ошибки раскиданы по запросам случайно, но воспроизводимо
+        rng = random.Random(0)
+        server.fail_next(
+            *(503 for _ in range(args.requests) if rng.random() < args.fail_rate)
+        )
+        market_data = MarketData(
+            HttpProvider(server.url), bucket=TokenBucket(args.rate, args.burst)
+        )
+
+        def fetch(i):
+            started = time.perf_counter()
+            market_data.fetch("BTC-USD", "2020-01-01", "2024-01-01")
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            timings = np.array(list(pool.map(fetch, range(args.requests)))) * 1000
+        elapsed = time.perf_counter() - started
+
+    stats = market_data.stats()
+    print(f"requests      {args.requests} in {elapsed:.2f}s")
+    print(
+        f"latency, ms   p50 {np.percentile(timings, 50):.1f}"
+        f"  p95 {np.percentile(timings, 95):.1f}  max {timings.max():.1f}"
+    )
+    print(f"http calls    {stats['requests']}  retries {stats['retries']}")
+    print(f"throttled     {stats['throttled_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Офлайн-бенчмарк горячих путей бота на синтетических ценах (без сети).
+
+Запуск:
+    python tg_bot/bench_suite.py --json baseline.json
+    python tg_bot/bench_suite.py --compare baseline.json
+
+Для каждой функции и размера истории (от месяцев до десятилетий дневных
+баров) печатаются медиана и минимум времени, а также пик памяти
+(tracemalloc). С `--compare` выводится отношение к сохраненному прогону
+и отмечаются замедления больше порога.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import executor
+from models import search_model, search_model_parallel
+from plots import render_avg, render_candle_agg, render_history, render_predict
+from post_processing import get_data_for_plot, post_processing_data
+from pre_processing import data_grp
+from synthetic import make_ohlc, make_prices
+
+# Размеры истории: метка -> число дневных баров
+SIZES = {"3m": 90, "2y": 730, "10y": 3650, "30y": 10950}
+
+# Горизонт прогноза в бенчмарке
+PERIODS = 30
+
+TICKERS = ["BTC-USD"]
+
+
+def make_cases(n_days, loop):
+    """
+    Замеряемые функции для истории из `n_days` баров.
+
+    :param n_days: Число дневных баров;
+    :param loop: Event loop для асинхронных функций;
+    :return: Список `(имя, функция без аргументов, тяжелая ли)`.
+    """
+    data = make_prices(n_days, TICKERS)
+    ohlc = make_ohlc(n_days)
+    end_date = data.index[-1].to_pydatetime()
+    predict = pd.Series(np.linspace(1.0, 2.0, PERIODS))
+    conf = np.column_stack([predict.values - 0.5, predict.values + 0.5])
+    predict_df = loop.run_until_complete(
+        post_processing_data(predict, end_date, PERIODS, conf)
+    )
+    # На графике прогноза вся история, чтобы размер данных рос с n_days
+    plot_data = loop.run_until_complete(
+        get_data_for_plot(data, n_days, TICKERS[0], predict_df)
+    )
+    data_gr = loop.run_until_complete(data_grp(data, TICKERS))
+
+    def arima():
+        model = search_model(data[TICKERS[0]])
+        return model.predict(n_periods=PERIODS, return_conf_int=True)
+
+    def arima_parallel():
+        # Пошаговый подбор в пуле процессов с бюджетом ARIMA_SEARCH_BUDGET
+        result = loop.run_until_complete(search_model_parallel(data[TICKERS[0]]))
+        return result.model.predict(n_periods=PERIODS, return_conf_int=True)
+
+    cases = [
+        ("data_grp", lambda: loop.run_until_complete(data_grp(data, TICKERS)), False),
+        (
+            "post_processing_data",
+            lambda: loop.run_until_complete(
+                post_processing_data(predict, end_date, PERIODS, conf)
+            ),
+            False,
+        ),
+        (
+            "get_data_for_plot",
+            lambda: loop.run_until_complete(
+                get_data_for_plot(data, n_days, TICKERS[0], predict_df)
+            ),
+            False,
+        ),
+        ("arima_model", arima, True),
+        ("arima_search_parallel", arima_parallel, True),
+        ("plot_history", lambda: render_history(data, TICKERS), False),
+        ("plot_predict", lambda: render_predict(plot_data), False),
+        ("viz_candle", lambda: render_candle_agg(ohlc), False),
+    ]
+    # Экспорт plotly требует kaleido
+    if importlib.util.find_spec("kaleido") is not None:
+        cases.append(("viz_avg", lambda: render_avg(data_gr, TICKERS), False))
+    return cases
+
+
+def measure(func, repeat):
+    """
+    Медиана и минимум времени (мс) и пик памяти (КБ) вызова `func`.
+    """
+    func()  # прогрев: импорты, кэши шрифтов, пул фигур
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(np.median(timings)), float(np.min(timings)), peak / 1024
+
+
+def run(sizes, repeat, heavy_repeat, only):
+    """
+    Прогон всех замеров.
+
+    :return: Словарь `"имя/размер" -> результаты`.
+    """
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for label in sizes:
+            n_days = SIZES[label]
+            for name, func, heavy in make_cases(n_days, loop):
+                if only and only not in name:
+                    continue
+                median, best, peak = measure(func, heavy_repeat if heavy else repeat)
+                results[f"{name}/{label}"] = {
+                    "n_days": n_days,
+                    "median_ms": median,
+                    "min_ms": best,
+                    "peak_kb": peak,
+                }
+                print(
+                    f"{name:<22}{label:>5}{n_days:>8}"
+                    f"{median:>12.2f}{best:>12.2f}{peak:>12.0f}",
+                    flush=True,
+                )
+    finally:
+        loop.close()
+        executor.shutdown()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Сравнение с сохраненным прогоном.
+
+    :return: Число замедлений больше порога.
+    """
+    regressions = 0
+    print(f"\n{'case':<28}{'base, ms':>12}{'now, ms':>12}{'ratio':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]["median_ms"]
+        ratio = result["median_ms"] / base if base else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions += 1
+            mark = "  REGRESSION"
+        print(f"{key:<28}{base:>12.2f}{result['median_ms']:>12.2f}{ratio:>8.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--heavy-repeat",
+        type=int,
+        default=1,
+        help="повторы для тяжелых замеров (подбор ARIMA)",
+    )
+    parser.add_argument("--only", default="", help="подстрока имени функции")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", help="сравнить с сохраненными результатами")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="допустимое замедление, доля"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'case':<22}{'size':>5}{'days':>8}{'median, ms':>12}{'min, ms':>12}"
+        f"{'peak, KB':>12}"
+    )
+    results = run(args.sizes, args.repeat, args.heavy_repeat, args.only)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"created_at": datetime.now().isoformat(), "results": results},
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
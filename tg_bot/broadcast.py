@@ -0,0 +1,589 @@
+import asyncio
+import inspect
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from config import (BROADCAST_CHAT_RATE, BROADCAST_RATE, BROADCAST_RETRIES,
+                    BROADCAST_WORKERS, DIGEST_DIR, DIGEST_HOUR)
+from executor import run_io
+from file_ids import FileIdCache, content_hash, file_id_cache
+from locks import file_lock
+from market_data import TokenBucket
+
+# Итог отправки одного сообщения
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+# Пауза перед повтором несостоявшегося дайджеста, секунд
+DIGEST_RETRY_SECONDS = 60
+
+# Сколько чатов помнит `SendLimiter`, прежде чем забыть давно отправленные
+MAX_CHAT_SLOTS = 10000
+
+# Доля общего лимита, которую использует `SendLimiter`: токены выдаются
+# в момент начала запроса, а Telegram считает сообщения по их приходу,
+# и задержки сети сдвигают запросы друг к другу
+RATE_HEADROOM = 0.9
+
+
+def write_json(path, value):
+    """
+    Атомарная запись JSON: через временный файл и `os.replace`, чтобы
+    после сбоя на диске оставалась старая или новая версия целиком.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(value))
+    os.replace(tmp, path)
+
+
+def read_json(path, default):
+    if not path.exists():
+        return default
+    return json.loads(path.read_text())
+
+
+class SubscriberStore:
+    """
+    Чаты, подписанные на дайджест, в JSON-файле (отсортированный
+    список id). Переживает перезапуск бота. Файл - единственная копия
+    списка: каждое изменение перечитывает его под блокировкой между
+    процессами, поэтому подписки из разных воркеров не затирают друг друга.
+    Методы блокируются на файле и в асинхронном коде вызываются через
+    `executor.run_io`.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Путь к файлу подписчиков.
+        """
+        self.path = Path(path)
+        self.lock_path = self.path.with_suffix(".lock")
+        # Число подписчиков при последнем обращении к файлу - для метрик,
+        # которые не должны читать файл в event loop
+        self.count = 0
+        self._read()
+
+    def __len__(self):
+        return len(self._read())
+
+    def __contains__(self, chat_id):
+        return chat_id in self._read()
+
+    def add(self, chat_id):
+        """
+        :return: False, если чат уже подписан.
+        """
+        with file_lock(self.lock_path):
+            chats = self._read()
+            if chat_id in chats:
+                return False
+            chats.add(chat_id)
+            write_json(self.path, sorted(chats))
+            self.count = len(chats)
+        return True
+
+    def remove(self, chat_id):
+        """
+        :return: False, если чат не был подписан.
+        """
+        with file_lock(self.lock_path):
+            chats = self._read()
+            if chat_id not in chats:
+                return False
+            chats.discard(chat_id)
+            write_json(self.path, sorted(chats))
+            self.count = len(chats)
+        return True
+
+    def chats(self, after=None):
+        """
+        Подписчики по возрастанию id.
+
+        :param after: Только чаты с id больше этого;
+        :return: Список id.
+        """
+        return sorted(
+            chat_id for chat_id in self._read() if after is None or chat_id > after
+        )
+
+    def _read(self):
+        # Файл заменяется целиком через `os.replace`, поэтому читать
+        # можно без блокировки
+        chats = set(read_json(self.path, []))
+        self.count = len(chats)
+        return chats
+
+
+class BroadcastCursor:
+    """
+    Прогресс рассылки в JSON-файле: id дайджеста и наибольший id чата,
+    до которого (включительно) все подписчики уже обработаны. После
+    перезапуска рассылка того же дайджеста продолжается с этого места.
+    Пишет курсор только ведущий процесс, но роль может перейти к другому
+    воркеру, поэтому состояние перечитывается из файла.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Путь к файлу курсора.
+        """
+        self.path = Path(path)
+        self._load()
+
+    def start(self, digest):
+        """
+        Начало рассылки `digest`: курсор другого дайджеста сбрасывается,
+        курсор того же - сохраняется.
+        """
+        self._load()
+        if self.digest != digest:
+            self.digest, self.after, self.done = digest, None, False
+            self._save()
+
+    def advance(self, chat_id):
+        self.after = chat_id
+        self._save()
+
+    def finish(self):
+        self.done = True
+        self._save()
+
+    def finished(self, digest):
+        self._load()
+        return self.digest == digest and self.done
+
+    def _load(self):
+        state = read_json(self.path, {})
+        self.digest = state.get("digest")
+        self.after = state.get("after")
+        self.done = state.get("done", False)
+
+    def _save(self):
+        write_json(
+            self.path, {"digest": self.digest, "after": self.after, "done": self.done}
+        )
+
+
+@dataclass
+class DigestItem:
+    """
+    Одно изображение дайджеста, отрисованное один раз для всех подписчиков.
+    """
+
+    # Ключ изображения (например, тикер)
+    key: str
+    # `BufferedInputFile` с изображением
+    photo: object
+    caption: str = None
+
+
+@dataclass
+class BroadcastReport:
+    """
+    Итоги рассылки дайджеста.
+    """
+
+    digest: str
+    # Чатов в очереди (без обработанных до перезапуска)
+    chats: int
+    # Отправлено и не отправлено сообщений
+    sent: int = 0
+    failed: int = 0
+    # Чатов, заблокировавших бота (отписаны)
+    blocked: int = 0
+    # Повторов после ответа 429
+    retried: int = 0
+    elapsed: float = 0.0
+    # Ожидание токенов лимитов и пауз после 429, секунд (сумма по воркерам)
+    throttled: float = 0.0
+    flood_wait: float = 0.0
+
+    @property
+    def rate(self):
+        """
+        Сообщений в секунду.
+        """
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"digest {self.digest}: {self.sent} sent to {self.chats} chats"
+            f" in {self.elapsed:.1f}s ({self.rate:.1f} msg/s), {self.failed} failed,"
+            f" {self.blocked} blocked, {self.retried} retried after 429,"
+            f" throttled {self.throttled:.1f}s, flood wait {self.flood_wait:.1f}s"
+        )
+
+
+class SendLimiter:
+    """
+    Лимиты Telegram на отправку сообщений одним ботом: общий token bucket
+    с запасом `RATE_HEADROOM`, пауза между сообщениями одного чата и общая
+    пауза всех отправок после ответа 429 с повтором сообщения. Пауза чата
+    отсчитывается от окончания предыдущего запроса в чат, а не от его
+    начала: долгая загрузка файла и следующая за ней быстрая отправка по
+    `file_id` не приходят в Telegram ближе лимита. Один экземпляр на процесс
+    делят рассылка дайджеста и уведомления о цене.
+    """
+
+    def __init__(
+        self,
+        rate=BROADCAST_RATE,
+        chat_rate=BROADCAST_CHAT_RATE,
+        retries=BROADCAST_RETRIES,
+        sleep=asyncio.sleep,
+    ):
+        """
+        :param rate: Общий лимит, сообщений в секунду;
+        :param chat_rate: Лимит одного чата, сообщений в секунду;
+        :param retries: Сколько раз повторять сообщение после ответа 429;
+        :param sleep: Асинхронная функция ожидания.
+        """
+        self.bucket = TokenBucket(rate * RATE_HEADROOM, 1)
+        self.chat_interval = 1 / chat_rate
+        self.retries = retries
+        self.sleep = sleep
+        # Последний запрос каждого чата: future, которая получает время
+        # (по `time.monotonic`) окончания запроса
+        self._chat_slots = {}
+        # До какого момента отправки приостановлены
+        self._paused_until = 0.0
+        # Повторов после 429 и ожидания пауз после них, секунд (сумма)
+        self.retried = 0
+        self.flood_wait = 0.0
+
+    async def send(self, chat_id, send, description="Message"):
+        """
+        Отправка с соблюдением лимитов и повторами после 429.
+
+        :param chat_id: Чат;
+        :param send: Корутинная функция без аргументов, отправляющая сообщение;
+        :param description: Что отправляется (для лога ошибок);
+        :return: `SENT`, `FAILED` или `BLOCKED` (бот заблокирован в чате).
+        """
+        for _ in range(self.retries + 1):
+            async with self._turn(chat_id):
+                try:
+                    await send()
+                except TelegramRetryAfter as e:
+                    # Лимит общий для бота: приостанавливаем все отправки
+                    self.retried += 1
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + e.retry_after
+                    )
+                    continue
+                except TelegramForbiddenError:
+                    return BLOCKED
+                except Exception as e:
+                    logging.warning(
+                        "%s to chat %s failed: %s", description, chat_id, e
+                    )
+                    return FAILED
+                return SENT
+        return FAILED
+
+    @asynccontextmanager
+    async def _turn(self, chat_id):
+        """
+        Очередь запросов чата: запрос начинается не раньше, чем через
+        `chat_interval` после окончания предыдущего запроса в тот же чат.
+        """
+        # Место в очереди занимается без ожидания между чтением и записью,
+        # поэтому сообщения одного чата из разных корутин не уходят вместе
+        previous = self._chat_slots.get(chat_id)
+        done = asyncio.get_running_loop().create_future()
+        self._chat_slots[chat_id] = done
+        self._forget_chats()
+        try:
+            finished = None
+            if previous is not None:
+                # shield: отмена ожидающего не должна отменять чужой запрос
+                finished = await asyncio.shield(previous)
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                self.flood_wait += delay
+                await self.sleep(delay)
+            await self.bucket.wait(self.sleep)
+            # Пауза чата - сразу перед запросом, чтобы ожидание общего
+            # токена не сокращало ее
+            if finished is not None:
+                delay = finished + self.chat_interval - time.monotonic()
+                if delay > 0:
+                    await self.sleep(delay)
+            yield
+        finally:
+            done.set_result(time.monotonic())
+
+    def _forget_chats(self):
+        if len(self._chat_slots) <= MAX_CHAT_SLOTS:
+            return
+        now = time.monotonic()
+        self._chat_slots = {
+            chat: slot
+            for chat, slot in self._chat_slots.items()
+            if not slot.done() or slot.result() + self.chat_interval > now
+        }
+
+
+class MessageQueue:
+    """
+    Очередь текстовых сообщений (уведомлений о цене), которые воркеры
+    отправляют через `SendLimiter`. Постановка в очередь не ждет отправки,
+    поэтому ее можно вызывать из синхронного обработчика тика.
+    """
+
+    def __init__(self, bot, limiter, workers=BROADCAST_WORKERS):
+        """
+        :param bot: `aiogram.Bot`;
+        :param limiter: `SendLimiter`;
+        :param workers: Сколько сообщений отправляется одновременно.
+        """
+        self.bot = bot
+        self.limiter = limiter
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.counts = {SENT: 0, FAILED: 0, BLOCKED: 0}
+
+    def put(self, chat_id, text, on_done=None):
+        """
+        :param chat_id: Чат;
+        :param text: Текст сообщения;
+        :param on_done: Функция или корутинная функция, которая получит итог
+         отправки (`SENT`, `FAILED` или `BLOCKED`).
+        """
+        self.queue.put_nowait((chat_id, text, on_done))
+
+    async def run(self):
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def _worker(self):
+        while True:
+            chat_id, text, on_done = await self.queue.get()
+            try:
+                status = await self.limiter.send(
+                    chat_id, lambda: self.bot.send_message(chat_id, text)
+                )
+                self.counts[status] += 1
+                if on_done is not None:
+                    result = on_done(status)
+                    if inspect.isawaitable(result):
+                        await result
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Message to chat %s failed", chat_id)
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        """
+        Длина очереди и итоги отправок.
+        """
+        return {"queued": self.queue.qsize(), **self.counts}
+
+
+class Broadcaster:
+    """
+    Рассылка дайджеста всем подписчикам в пределах лимитов Telegram.
+
+    Изображения отрисовываются один раз; после первой загрузки каждое
+    отправляется по `file_id` из `FileIdCache`. Лимиты частоты, паузы
+    после 429 и повторы - в `SendLimiter`. Прогресс сохраняется
+    в `BroadcastCursor`.
+    """
+
+    def __init__(
+        self,
+        bot,
+        subscribers,
+        cursor,
+        limiter=None,
+        workers=BROADCAST_WORKERS,
+        save_every=100,
+        file_ids=None,
+        sleep=asyncio.sleep,
+    ):
+        """
+        :param bot: `aiogram.Bot`;
+        :param subscribers: `SubscriberStore`;
+        :param cursor: `BroadcastCursor`;
+        :param limiter: `SendLimiter` (None - свой с лимитами из конфигурации);
+        :param workers: Сколько чатов обслуживается одновременно;
+        :param save_every: Через сколько обработанных чатов сохранять курсор;
+        :param file_ids: `FileIdCache` (None - кэш в памяти на время работы);
+        :param sleep: Асинхронная функция ожидания.
+        """
+        self.bot = bot
+        self.subscribers = subscribers
+        self.cursor = cursor
+        self.limiter = limiter if limiter is not None else SendLimiter()
+        self.workers = workers
+        self.save_every = save_every
+        self.file_ids = file_ids if file_ids is not None else FileIdCache(None)
+        self.sleep = sleep
+        self.last_report = None
+
+    async def run(self, digest, items):
+        """
+        Рассылка дайджеста; если рассылка `digest` была прервана,
+        продолжается с курсора.
+
+        :param digest: Id дайджеста (например, дата);
+        :param items: Список `DigestItem`;
+        :return: `BroadcastReport`.
+        """
+        self.cursor.start(digest)
+        chats = await run_io(self.subscribers.chats, after=self.cursor.after)
+        report = BroadcastReport(digest, len(chats))
+        started = time.perf_counter()
+        limiter = self.limiter
+        waited, retried, flood_wait = (
+            limiter.bucket.waited,
+            limiter.retried,
+            limiter.flood_wait,
+        )
+        # Хэши изображений считаются один раз на рассылку
+        items = [(item, content_hash(item.photo.data)) for item in items]
+
+        # Курсор двигается только по непрерывному префиксу обработанных
+        # чатов: воркеры завершают чаты не по порядку
+        done = [False] * len(chats)
+        position = saved = 0
+
+        def mark(index):
+            nonlocal position, saved
+            done[index] = True
+            while position < len(chats) and done[position]:
+                position += 1
+            if position - saved >= self.save_every or (
+                position == len(chats) and position > saved
+            ):
+                self.cursor.advance(chats[position - 1])
+                saved = position
+
+        indexes = iter(range(len(chats)))
+        # Пока не получены file_id всех изображений, чаты обслуживаются
+        # по одному - иначе каждый воркер загрузил бы изображения заново
+        for index in indexes:
+            if all(digest in self.file_ids for _, digest in items):
+                # Итератор общий: чат с этим индексом обслужит воркер
+                indexes = itertools.chain([index], indexes)
+                break
+            await self._deliver(chats[index], items, report)
+            mark(index)
+
+        async def worker():
+            for index in indexes:
+                await self._deliver(chats[index], items, report)
+                mark(index)
+
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        self.cursor.finish()
+
+        report.elapsed = time.perf_counter() - started
+        report.throttled = limiter.bucket.waited - waited
+        report.retried = limiter.retried - retried
+        report.flood_wait = limiter.flood_wait - flood_wait
+        self.last_report = report
+        logging.info("Broadcast %s", report)
+        return report
+
+    async def _deliver(self, chat_id, items, report):
+        for item, digest in items:
+            status = await self.limiter.send(
+                chat_id,
+                lambda: self.file_ids.send_photo(
+                    self.bot, chat_id, item.photo, digest, caption=item.caption
+                ),
+                f"Digest {item.key}",
+            )
+            if status == SENT:
+                report.sent += 1
+            elif status == FAILED:
+                report.failed += 1
+            else:
+                # Бот заблокирован или удален из чата - отписываем
+                await run_io(self.subscribers.remove, chat_id)
+                report.blocked += 1
+                return
+
+    async def run_daily(self, render, hour=DIGEST_HOUR):
+        """
+        Ежедневная рассылка в `hour` часов UTC; запускается только
+        в ведущем процессе (`locks.leader`), чтобы подписчики получали
+        дайджест один раз. Прерванная рассылка сегодняшнего дайджеста
+        продолжается сразу после перезапуска.
+
+        :param render: Корутина без аргументов, возвращающая список `DigestItem`.
+        """
+        while True:
+            now = datetime.now(timezone.utc)
+            digest = now.strftime("%Y-%m-%d")
+            if now.hour >= hour and not self.cursor.finished(digest):
+                try:
+                    # Без подписчиков дайджест не отрисовывается
+                    subscribed = await run_io(len, self.subscribers)
+                    items = await render() if subscribed else []
+                    await self.run(digest, items)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logging.exception("Digest %s failed", digest)
+                    await self.sleep(DIGEST_RETRY_SECONDS)
+                    continue
+            await self.sleep(seconds_until_digest(datetime.now(timezone.utc), hour))
+
+    def stats(self):
+        """
+        Число подписчиков и итоги последней рассылки.
+        """
+        stats = {"subscribers": self.subscribers.count}
+        report = self.last_report
+        if report is not None:
+            stats.update(
+                chats=report.chats,
+                sent=report.sent,
+                failed=report.failed,
+                blocked=report.blocked,
+                retried=report.retried,
+                elapsed_seconds=report.elapsed,
+                rate=report.rate,
+            )
+        return stats
+
+
+def seconds_until_digest(now, hour):
+    """
+    Пауза до ближайших `hour` часов UTC.
+    """
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def create_broadcaster(bot, limiter, directory=DIGEST_DIR):
+    """
+    Рассылка с подписчиками и курсором в каталоге `directory`
+    и общим кэшем `file_id` обработчиков.
+
+    :param limiter: `SendLimiter`, общий с другими отправками бота.
+    """
+    directory = Path(directory)
+    return Broadcaster(
+        bot,
+        SubscriberStore(directory / "subscribers.json"),
+        BroadcastCursor(directory / "cursor.json"),
+        limiter=limiter,
+        file_ids=file_id_cache,
+    )
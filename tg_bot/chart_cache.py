@@ -0,0 +1,86 @@
+import hashlib
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import CHART_CACHE_BYTES
+
+
+def chart_key(kind, ticker, data):
+    """
+    Ключ изображения: тип графика, тикер, диапазон дат и хэш данных.
+
+    :param kind: Тип графика (имя функции отрисовки);
+    :param ticker: Акция;
+    :param data: Данные, по которым строится график;
+    :return: Кортеж-ключ для `ChartCache`.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    date_range = (data.index[0], data.index[-1]) if len(data) else (None, None)
+    return kind, ticker, date_range, digest.hexdigest()
+
+
+class ChartCache:
+    """
+    LRU-кэш закодированных изображений графиков с ограничением
+    по суммарному размеру в байтах.
+    """
+
+    def __init__(self, max_bytes=CHART_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Байты изображений, отданных из кэша вместо повторной отрисовки
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._images)
+
+    def get(self, key):
+        """
+        Изображение по ключу или None.
+        """
+        img_bytes = self._images.get(key)
+        if img_bytes is None:
+            self.misses += 1
+            return None
+        self._images.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += len(img_bytes)
+        return img_bytes
+
+    def put(self, key, img_bytes):
+        """
+        Сохраняет изображение, вытесняя давно не запрошенные.
+        Изображение больше всего бюджета не кэшируется.
+        """
+        if len(img_bytes) > self.max_bytes:
+            return
+        if key in self._images:
+            self.bytes -= len(self._images.pop(key))
+        self._images[key] = img_bytes
+        self.bytes += len(img_bytes)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Доля попаданий и сэкономленные байты отрисовки.
+        """
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._images),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "evictions": self.evictions,
+        }
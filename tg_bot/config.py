@@ -0,0 +1,156 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Каталог локального хранилища котировок
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", ".price_store")
+
+# Сколько секунд последний (незакрытый) день считается актуальным
+PRICE_STORE_TTL = int(os.getenv("PRICE_STORE_TTL", "300"))
+
+# Потоки для блокирующего ввода-вывода (загрузка котировок)
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+
+# Воркеры для CPU-задач (обучение моделей, отрисовка графиков)
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+# Тип пула для CPU-задач: "process" или "thread"
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "process")
+
+# Бюджет памяти кэша обученных моделей ARIMA, байт
+MODEL_CACHE_BYTES = int(os.getenv("MODEL_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Через сколько дней новых данных заново подбирать порядок ARIMA
+ARIMA_RESEARCH_DAYS = int(os.getenv("ARIMA_RESEARCH_DAYS", "7"))
+
+# Тикеры, прогноз которых пересчитывается в фоне
+FORECAST_TICKERS = os.getenv("FORECAST_TICKERS", "BTC-USD,ETH-USD").split(",")
+
+# Максимальный горизонт фонового прогноза, дней
+FORECAST_MAX_HORIZON = int(os.getenv("FORECAST_MAX_HORIZON", "30"))
+
+# Период фонового пересчета прогнозов и максимальный возраст прогноза, секунд
+FORECAST_REFRESH_SECONDS = int(os.getenv("FORECAST_REFRESH_SECONDS", "3600"))
+FORECAST_MAX_AGE = int(os.getenv("FORECAST_MAX_AGE", "7200"))
+
+# Задержка пересчета после закрытия дневного бара (00:00 UTC), секунд
+FORECAST_CLOSE_DELAY = int(os.getenv("FORECAST_CLOSE_DELAY", "300"))
+
+# Бюджет памяти кэша готовых изображений графиков, байт
+CHART_CACHE_BYTES = int(os.getenv("CHART_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# Число переиспользуемых фигур matplotlib в каждом процессе отрисовки
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "4"))
+
+# Отрисовка свечного графика: "agg" (matplotlib) или "kaleido" (plotly)
+CANDLE_BACKEND = os.getenv("CANDLE_BACKEND", "agg")
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Публичный адрес бота и путь, на который Telegram присылает обновления
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+# Адрес веб-сервера и число процессов-воркеров на одном порту
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", "8080"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+
+# Адрес Redis для общего хранилища FSM (пусто - состояние в памяти процесса)
+FSM_STORAGE_URL = os.getenv("FSM_STORAGE_URL", "")
+
+# Время жизни состояния и данных FSM в Redis, секунд
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 60 * 60)))
+
+# Файл блокировки ведущего процесса: фоновые задачи выполняет один воркер,
+# остальные раз в LEADER_RETRY_SECONDS секунд проверяют, не освободилась ли роль
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", ".leader.lock")
+LEADER_RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "10"))
+
+# Адрес HTTP-сервера метрик Prometheus в режиме long polling (порт 0 - выключен);
+# в режиме вебхука метрики отдаются на `/metrics` веб-сервера бота
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Источник котировок: "yahoo" (yfinance) или "http" (API по адресу MARKET_DATA_URL)
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "yahoo")
+MARKET_DATA_URL = os.getenv("MARKET_DATA_URL", "")
+
+# Общий лимит запросов к источнику: запросов в секунду и запас подряд
+MARKET_DATA_RATE = float(os.getenv("MARKET_DATA_RATE", "5"))
+MARKET_DATA_BURST = int(os.getenv("MARKET_DATA_BURST", "10"))
+
+# Таймаут одного запроса и общий срок загрузки с повторами, секунд
+MARKET_DATA_TIMEOUT = float(os.getenv("MARKET_DATA_TIMEOUT", "10"))
+MARKET_DATA_DEADLINE = float(os.getenv("MARKET_DATA_DEADLINE", "30"))
+
+# Число повторов и пауза перед ними: база и предел экспоненты, секунд
+MARKET_DATA_RETRIES = int(os.getenv("MARKET_DATA_RETRIES", "4"))
+MARKET_DATA_BACKOFF = float(os.getenv("MARKET_DATA_BACKOFF", "0.5"))
+MARKET_DATA_BACKOFF_CAP = float(os.getenv("MARKET_DATA_BACKOFF_CAP", "8"))
+
+# Подбор порядка ARIMA: "stepwise" (auto_arima) или "parallel" (перебор сетки
+# в пуле вычислений с бюджетом времени ARIMA_SEARCH_BUDGET секунд)
+ARIMA_SEARCH = os.getenv("ARIMA_SEARCH", "stepwise")
+ARIMA_SEARCH_BUDGET = float(os.getenv("ARIMA_SEARCH_BUDGET", "10"))
+
+# Движок прогноза: "arima", "sarimax", "ets", "theta", "drift" или "auto" -
+# самый точный из движков, чья задержка укладывается в FORECAST_BUDGET секунд
+FORECAST_ENGINE = os.getenv("FORECAST_ENGINE", "arima")
+FORECAST_BUDGET = float(os.getenv("FORECAST_BUDGET", "2"))
+# Движок вне бюджета заново замеряется на каждом ENGINE_REPROBE_EVERY-м
+# запросе, который он пропустил (0 - не замерять)
+ENGINE_REPROBE_EVERY = int(os.getenv("ENGINE_REPROBE_EVERY", "50"))
+
+# Наибольшее число свечей на графике: запросы с более мелкими свечами
+# (например, минутными за год) отклоняются до отрисовки
+MAX_CANDLES = int(os.getenv("MAX_CANDLES", "20000"))
+
+# Поток живых цен по WebSocket (пустой адрес - поток выключен)
+LIVE_FEED_URL = os.getenv("LIVE_FEED_URL", "")
+LIVE_TICKERS = os.getenv("LIVE_TICKERS", "BTC-USD,ETH-USD").split(",")
+
+# Размер кольцевого буфера тиков каждого тикера и через сколько секунд
+# без тиков живой хвост перестает дописываться к истории
+LIVE_BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", "100000"))
+LIVE_STALE_SECONDS = float(os.getenv("LIVE_STALE_SECONDS", "60"))
+
+# Каталог буферов тиков: поток принимает ведущий процесс, а остальные
+# воркеры читают тики из тех же файлов
+LIVE_DIR = os.getenv("LIVE_DIR", ".live")
+
+# Сколько уведомлений о цене может создать один чат
+MAX_ALERTS_PER_CHAT = int(os.getenv("MAX_ALERTS_PER_CHAT", "20"))
+
+# Журнал уведомлений о цене, общий для воркеров, и как часто процесс,
+# проверяющий тики, дочитывает его, секунд
+ALERTS_PATH = os.getenv("ALERTS_PATH", ".alerts.json")
+ALERT_SYNC_SECONDS = float(os.getenv("ALERT_SYNC_SECONDS", "1"))
+
+# Каталог подписчиков дайджеста и курсора рассылки; час ежедневной рассылки
+# (UTC) и горизонт прогнозов в ней, дней (не больше FORECAST_MAX_HORIZON)
+DIGEST_DIR = os.getenv("DIGEST_DIR", ".digest")
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "9"))
+DIGEST_HORIZON = int(os.getenv("DIGEST_HORIZON", "7"))
+if DIGEST_HORIZON > FORECAST_MAX_HORIZON:
+    # Дайджест берет прогнозы из кэша, который дальше не считает
+    raise ValueError(
+        f"DIGEST_HORIZON={DIGEST_HORIZON} exceeds "
+        f"FORECAST_MAX_HORIZON={FORECAST_MAX_HORIZON}"
+    )
+
+# Лимиты рассылки: сообщений в секунду всего и в один чат (у Telegram -
+# около 30 и 1), число одновременно обслуживаемых чатов и повторов после 429
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "30"))
+BROADCAST_RETRIES = int(os.getenv("BROADCAST_RETRIES", "3"))
+
+# Файл `file_id` загруженных изображений по хэшу содержимого (повторные
+# отправки тех же изображений идут без загрузки) и сколько записей хранить
+FILE_ID_PATH = os.getenv("FILE_ID_PATH", ".file_ids.jsonl")
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", "10000"))
@@ -0,0 +1,254 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.exponential_smoothing.ets import ETSModel
+from statsmodels.tsa.forecasting.theta import ThetaModel
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from config import ENGINE_REPROBE_EVERY, FORECAST_BUDGET, FORECAST_ENGINE
+from executor import run_cpu
+from models import arima_model, search_model
+
+# Уровень доверительного интервала, как у pmdarima по умолчанию
+ALPHA = 0.05
+
+# Порядок SARIMAX с дрейфом для быстрого прогноза
+SARIMAX_ORDER = (1, 1, 1)
+
+
+def arima_forecast(values, periods, state=None):
+    """
+    AUTO ARIMA без кэша моделей (синхронно, для пула вычислений):
+    тот же подбор и прогноз, что и в `models.arima_model`.
+
+    :param values: Ряд стоимости;
+    :param periods: Горизонт предсказания;
+    :param state: Не используется;
+    :return: `(предсказание, доверительный интервал, состояние)`.
+    """
+    model = search_model(values)
+    predict, conf = model.predict(n_periods=periods, return_conf_int=True)
+    return predict, conf, None
+
+
+def ets_forecast(values, periods, state=None):
+    """
+    Экспоненциальное сглаживание с затухающим трендом (синхронно, для пула
+    вычислений).
+
+    :param values: Ряд стоимости;
+    :param periods: Горизонт предсказания;
+    :param state: Не используется;
+    :return: `(предсказание, доверительный интервал, состояние)`.
+    """
+    series = pd.Series(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result = ETSModel(series, error="add", trend="add", damped_trend=True).fit(
+            disp=False
+        )
+    frame = result.get_prediction(
+        start=len(series), end=len(series) + periods - 1
+    ).summary_frame(alpha=ALPHA)
+    conf = frame[["pi_lower", "pi_upper"]].to_numpy()
+    return frame["mean"].to_numpy(), conf, None
+
+
+def theta_forecast(values, periods, state=None):
+    """
+    Метод Theta без сезонности (синхронно, для пула вычислений).
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result = ThetaModel(pd.Series(values), period=1, deseasonalize=False).fit()
+    conf = result.prediction_intervals(periods, alpha=ALPHA).to_numpy()
+    return result.forecast(periods).to_numpy(), conf, None
+
+
+def drift_forecast(values, periods, state=None):
+    """
+    Случайное блуждание с дрейфом: прогноз продолжает средний прирост
+    ряда, интервал растет с горизонтом (синхронно, для пула вычислений).
+    """
+    values = np.asarray(values, dtype="f8")
+    diffs = np.diff(values)
+    n = len(diffs)
+    drift = diffs.mean()
+    sigma = diffs.std(ddof=1) if n > 1 else 0.0
+    steps = np.arange(1, periods + 1)
+    mean = values[-1] + steps * drift
+    # Ошибка прогноза учитывает и неопределенность оценки дрейфа
+    width = 1.96 * sigma * np.sqrt(steps * (1 + steps / max(n, 1)))
+    return mean, np.column_stack([mean - width, mean + width]), None
+
+
+def sarimax_forecast(values, periods, state=None):
+    """
+    SARIMAX фиксированного порядка `SARIMAX_ORDER`. Оптимизация стартует
+    с параметров прошлого обучения, поэтому повторное обучение на ряде
+    с новыми барами сходится за несколько итераций.
+
+    :param state: Параметры предыдущей модели или None;
+    :return: `(предсказание, доверительный интервал, параметры модели)`.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result = SARIMAX(
+            np.asarray(values, dtype="f8"), order=SARIMAX_ORDER, trend="c"
+        ).fit(start_params=state, disp=False)
+    forecast = result.get_forecast(periods)
+    return forecast.predicted_mean, forecast.conf_int(alpha=ALPHA), result.params
+
+
+# Состояние движков между вызовами: `(движок, тикер) -> состояние`
+_states = {}
+
+
+def pooled(name, forecaster):
+    """
+    Асинхронный движок из синхронного `forecaster(values, periods, state)`,
+    выполняемого в пуле вычислений.
+    """
+
+    async def engine(data, ticker, periods):
+        mean, conf, state = await run_cpu(
+            forecaster,
+            data[ticker].to_numpy(dtype="f8"),
+            periods,
+            _states.get((name, ticker)),
+        )
+        if state is not None:
+            _states[(name, ticker)] = state
+        return pd.Series(np.asarray(mean)), np.asarray(conf)
+
+    return engine
+
+
+# Синхронные прогнозы `forecaster(values, periods, state)` быстрых движков
+FORECASTERS = {
+    "sarimax": sarimax_forecast,
+    "ets": ets_forecast,
+    "theta": theta_forecast,
+    "drift": drift_forecast,
+}
+
+# Движки прогноза `engine(data, ticker, periods) -> (предсказание, интервал)`,
+# от более точных к более быстрым
+ENGINES = {
+    "arima": arima_model,
+    **{name: pooled(name, forecaster) for name, forecaster in FORECASTERS.items()},
+}
+
+# Начальная оценка задержки движков до первых замеров, секунд: время
+# обучения и прогноза на 730 днях истории (bench_engines.py --days 730)
+PRIOR_LATENCY = {
+    "arima": 0.625,
+    "sarimax": 0.039,
+    "ets": 0.014,
+    "theta": 0.042,
+    "drift": 0.001,
+}
+
+
+class LatencyTracker:
+    """
+    Скользящее среднее (EWMA) времени прогноза каждого движка. Первый замер
+    заменяет начальную оценку.
+    """
+
+    def __init__(self, prior=PRIOR_LATENCY, weight=0.2):
+        """
+        :param prior: Начальные оценки задержки, секунд;
+        :param weight: Вес нового замера.
+        """
+        self.latency = dict(prior)
+        self.weight = weight
+        self.calls = {name: 0 for name in prior}
+        # Запросы, пропущенные движком из-за бюджета после последнего замера
+        self.skipped = {name: 0 for name in prior}
+        self.probes = 0
+
+    def observe(self, name, seconds):
+        previous = self.latency.get(name, seconds)
+        if not self.calls.get(name):
+            previous = seconds
+        self.latency[name] = (1 - self.weight) * previous + self.weight * seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.skipped[name] = 0
+
+    def skip(self, name, reprobe_every):
+        """
+        Учет запроса, пропущенного движком из-за бюджета.
+
+        :param name: Имя движка;
+        :param reprobe_every: Через сколько пропусков движок замеряется
+        снова (0 - никогда);
+        :return: True, если пора снова замерить движок.
+        """
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+        if reprobe_every and self.skipped[name] >= reprobe_every:
+            self.skipped[name] = 0
+            self.probes += 1
+            return True
+        return False
+
+    def stats(self):
+        return {
+            "latency_seconds": dict(self.latency),
+            "calls": dict(self.calls),
+            "probes": self.probes,
+        }
+
+
+latency_tracker = LatencyTracker()
+
+
+def select_engine(
+    engine=FORECAST_ENGINE, budget=FORECAST_BUDGET, reprobe_every=ENGINE_REPROBE_EVERY
+):
+    """
+    Движок для запроса: заданный в настройках или, при "auto", самый
+    точный из тех, чья ожидаемая задержка укладывается в бюджет. Более
+    точные движки вне бюджета время от времени замеряются снова: иначе
+    завышенная оценка (долгий первый прогноз, нагрузка) не обновилась бы
+    никогда.
+
+    :param engine: Имя движка из `ENGINES` или "auto";
+    :param budget: Бюджет времени на прогноз, секунд;
+    :param reprobe_every: Через сколько пропущенных запросов движок вне
+    бюджета получает запрос для нового замера (0 - не замерять);
+    :return: Имя движка.
+    """
+    if engine != "auto":
+        if engine not in ENGINES:
+            raise ValueError(
+                f"Unknown engine {engine!r}, expected one of {list(ENGINES)}"
+            )
+        return engine
+    within = [name for name in ENGINES if latency_tracker.latency[name] <= budget]
+    # Ни один не укладывается - самый быстрый
+    selected = within[0] if within else min(ENGINES, key=latency_tracker.latency.get)
+    for name in ENGINES:
+        if name == selected:
+            break
+        if latency_tracker.skip(name, reprobe_every):
+            return name
+    return selected
+
+
+async def forecast(data, ticker, periods, engine):
+    """
+    Прогноз выбранным движком с замером задержки.
+
+    :param data: Данные из функции `data_loader`;
+    :param ticker: Акция для которой предсказываем;
+    :param periods: Горизонт предсказания;
+    :param engine: Имя движка из `ENGINES`;
+    :return: Предсказание и доверительный интервал.
+    """
+    started = time.perf_counter()
+    predict, conf = await ENGINES[engine](data, ticker, periods)
+    latency_tracker.observe(engine, time.perf_counter() - started)
+    return predict, conf
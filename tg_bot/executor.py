@@ -0,0 +1,76 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from config import CPU_EXECUTOR, CPU_WORKERS, IO_WORKERS
+
+_io_pool = None
+_cpu_pool = None
+
+
+def io_executor():
+    """
+    Пул потоков для блокирующего ввода-вывода (создается при первом вызове).
+    """
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    return _io_pool
+
+
+def cpu_executor():
+    """
+    Пул для CPU-задач: процессы (по умолчанию) или потоки,
+    в зависимости от `CPU_EXECUTOR`.
+    """
+    global _cpu_pool
+    if _cpu_pool is None:
+        if CPU_EXECUTOR == "thread":
+            _cpu_pool = ThreadPoolExecutor(
+                max_workers=CPU_WORKERS, thread_name_prefix="cpu"
+            )
+        else:
+            # spawn, а не fork: в родительском процессе уже работают
+            # потоки пула ввода-вывода и event loop
+            _cpu_pool = ProcessPoolExecutor(
+                max_workers=CPU_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _cpu_pool
+
+
+async def run_io(func, *args, **kwargs):
+    """
+    Выполнение блокирующей функции в пуле ввода-вывода.
+
+    :param func: Синхронная функция;
+    :return: Результат `func(*args, **kwargs)`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor(), partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Выполнение CPU-задачи в пуле вычислений. Для пула процессов
+    функция и аргументы должны сериализоваться через pickle.
+
+    :param func: Синхронная функция уровня модуля;
+    :return: Результат `func(*args, **kwargs)`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor(), partial(func, *args, **kwargs))
+
+
+def shutdown():
+    """
+    Остановка пулов при завершении приложения.
+    """
+    global _io_pool, _cpu_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
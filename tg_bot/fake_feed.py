@@ -0,0 +1,91 @@
+"""
+Локальный WebSocket-поток цен для тестов (без сети).
+
+Клиент подключается к `ws://host:port/ws` и отправляет
+`{"subscribe": [тикеры]}`; сервер отвечает тиками в формате
+`live.parse_ticks` - случайным блужданием цены каждого тикера.
+"""
+
+import asyncio
+import random
+import time
+
+from aiohttp import WSMsgType, web
+
+
+class FakeFeedServer:
+    """
+    WebSocket-сервер с синтетическими тиками. Можно ограничить число
+    тиков на соединение, чтобы проверить переподключение.
+    """
+
+    def __init__(
+        self, prices=None, period=0.01, close_after=None, host="127.0.0.1", port=0
+    ):
+        """
+        :param prices: Начальные цены `тикер -> цена`;
+        :param period: Пауза между тиками, секунд;
+        :param close_after: Сколько тиков отправить до разрыва соединения
+         (None - без разрыва);
+        :param host: Адрес сервера;
+        :param port: Порт (0 - любой свободный).
+        """
+        self.prices = dict(prices or {"BTC-USD": 40000.0, "ETH-USD": 2000.0})
+        self.period = period
+        self.close_after = close_after
+        self.host = host
+        self.port = port
+        # Число подключений и отправленных тиков
+        self.connections = 0
+        self.sent = 0
+        self._rng = random.Random(0)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/ws"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/ws", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+
+        message = await ws.receive()
+        if message.type != WSMsgType.TEXT:
+            return ws
+        tickers = [
+            ticker for ticker in message.json()["subscribe"] if ticker in self.prices
+        ]
+        sent = 0
+        while not ws.closed and tickers:
+            if self.close_after is not None and sent >= self.close_after:
+                break
+            ticker = tickers[sent % len(tickers)]
+            self.prices[ticker] *= 1 + self._rng.gauss(0, 0.001)
+            await ws.send_json(
+                {"ticker": ticker, "time": time.time(), "price": self.prices[ticker]}
+            )
+            sent += 1
+            self.sent += 1
+            await asyncio.sleep(self.period)
+        await ws.close()
+        return ws
@@ -0,0 +1,127 @@
+"""
+Локальный HTTP-источник котировок для тестов и бенчмарков (без сети).
+
+Отвечает на `GET /prices/{ticker}?start=YYYY-MM-DD&end=YYYY-MM-DD&interval=1d`
+CSV-таблицей баров из `synthetic.make_ohlc`, в формате, который читает
+`market_data.HttpProvider`. Внутридневные бары генерируются на лету.
+"""
+
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from market_data import DAILY, parse_interval
+from synthetic import make_ohlc
+
+
+class FakeMarketServer:
+    """
+    Фоновый HTTP-сервер с заранее заданными котировками. Можно задать
+    задержку ответа и коды ошибок для следующих запросов.
+    """
+
+    def __init__(self, prices=None, latency=0.0, host="127.0.0.1", port=0):
+        """
+        :param prices: Словарь `тикер -> таблица OHLCV`, по умолчанию
+         десять лет синтетических баров BTC-USD и ETH-USD;
+        :param latency: Задержка каждого ответа, секунд;
+        :param host: Адрес сервера;
+        :param port: Порт (0 - любой свободный).
+        """
+        if prices is None:
+            prices = {
+                "BTC-USD": make_ohlc(3650, seed=0, start="2015-01-01"),
+                "ETH-USD": make_ohlc(3650, seed=1, start="2015-01-01"),
+            }
+        self.prices = prices
+        self.latency = latency
+        # Число принятых запросов и коды ответов для следующих запросов
+        self.requests = 0
+        self._failures = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, *statuses):
+        """
+        Следующие запросы получат ответы с кодами `statuses`.
+        """
+        with self._lock:
+            self._failures.extend(statuses)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-market", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _respond(self, path, query):
+        """
+        Код и тело ответа на запрос.
+        """
+        with self._lock:
+            self.requests += 1
+            failure = self._failures.popleft() if self._failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if failure is not None:
+            return failure, "error"
+
+        parts = path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "prices" or parts[1] not in self.prices:
+            return 404, "not found"
+        start = pd.Timestamp(query.get("start", ["1970-01-01"])[0])
+        end = pd.Timestamp(query.get("end", ["2100-01-01"])[0])
+        interval = query.get("interval", [DAILY])[0]
+        if interval == DAILY:
+            frame = self.prices[parts[1]]
+        else:
+            # Бары одного запроса воспроизводимы: зерно зависит от параметров
+            delta = parse_interval(interval)
+            seed = zlib.crc32(f"{parts[1]} {interval} {start}".encode())
+            frame = make_ohlc(
+                (end - start) // delta, seed=seed, start=start, freq=delta
+            )
+        return 200, frame[(frame.index >= start) & (frame.index < end)].to_csv()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = server._respond(url.path, parse_qs(url.query))
+                payload = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,183 @@
+"""
+Локальный сервер Bot API для тестов рассылки (без сети).
+
+Бот подключается через `Bot(token, session=AiohttpSession(
+api=TelegramAPIServer.from_base(server.url)))`. Сервер отвечает на
+`sendPhoto` и `sendMessage`, записывает каждый запрос и, как Telegram,
+отвечает 429 с `retry_after`, если бот превысил общий лимит или лимит
+чата; ответы 429, 403 и 400 можно также задать заранее.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    """
+    Сервер Bot API с лимитами частоты сообщений.
+    """
+
+    def __init__(
+        self,
+        global_rate=None,
+        chat_interval=None,
+        retry_after=1,
+        upload_delay=0,
+        host="127.0.0.1",
+        port=0,
+    ):
+        """
+        :param global_rate: Сообщений в секунду на всех чатах
+         (None - без ограничения);
+        :param chat_interval: Наименьшая пауза между сообщениями одного
+         чата, секунд (None - без ограничения);
+        :param retry_after: `retry_after` в ответах 429, секунд;
+        :param upload_delay: Сколько длится прием загружаемого файла, секунд
+         (сообщение считается пришедшим в конце загрузки);
+        :param host: Адрес сервера;
+        :param port: Порт (0 - любой свободный).
+        """
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.retry_after = retry_after
+        self.upload_delay = upload_delay
+        self.host = host
+        self.port = port
+        # Принятые сообщения `(время, чат, метод, загружен ли файл)`
+        self.sent = []
+        # Число ответов 429
+        self.flooded = 0
+        # Чаты, заблокировавшие бота
+        self.blocked = set()
+        # Сколько следующих запросов получат 429
+        self.flood_next = 0
+        # `file_id`, на которые сервер отвечает 400 (как после смены токена)
+        self.invalid_file_ids = set()
+        self._recent = deque()
+        self._last_by_chat = {}
+        self._ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def uploads(self):
+        """
+        Сколько раз файл загружался, а не передавался по `file_id`.
+        """
+        return sum(uploaded for *_, uploaded in self.sent)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _flood(self, now, chat_id):
+        if self.flood_next:
+            self.flood_next -= 1
+            return True
+        if self.global_rate is not None:
+            while self._recent and now - self._recent[0] >= 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.global_rate:
+                return True
+        last = self._last_by_chat.get(chat_id)
+        return (
+            self.chat_interval is not None
+            and last is not None
+            and now - last < self.chat_interval
+        )
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        if method not in ("sendPhoto", "sendMessage"):
+            return web.json_response(
+                {"ok": False, "error_code": 404, "description": "Not Found"},
+                status=404,
+            )
+        form = await request.post()
+        if self.upload_delay and str(form.get("photo", "")).startswith("attach://"):
+            await asyncio.sleep(self.upload_delay)
+        chat_id = int(form["chat_id"])
+        now = time.monotonic()
+
+        if chat_id in self.blocked:
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 403,
+                    "description": "Forbidden: bot was blocked by the user",
+                },
+                status=403,
+            )
+        if self._flood(now, chat_id):
+            self.flooded += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after "
+                    f"{self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        self._recent.append(now)
+        self._last_by_chat[chat_id] = now
+        message_id = next(self._ids)
+        result = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        uploaded = False
+        if method == "sendPhoto":
+            photo = form["photo"]
+            if photo in self.invalid_file_ids:
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 400,
+                        "description": "Bad Request: wrong file identifier",
+                    },
+                    status=400,
+                )
+            # Загруженный файл передается как `attach://<поле формы>`,
+            # иначе приходит строка `file_id`
+            uploaded = photo.startswith("attach://")
+            file_id = f"photo-{message_id}" if uploaded else photo
+            result["photo"] = [
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 800,
+                    "height": 600,
+                }
+            ]
+            if "caption" in form:
+                result["caption"] = form["caption"]
+        else:
+            result["text"] = form["text"]
+        self.sent.append((now, chat_id, method, uploaded))
+        return web.json_response({"ok": True, "result": result})
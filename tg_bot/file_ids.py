@@ -0,0 +1,256 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+
+from config import FILE_ID_CACHE_SIZE, FILE_ID_PATH
+from executor import run_io
+from locks import file_lock
+
+
+def content_hash(data):
+    """
+    Хэш содержимого изображения.
+
+    :param data: Байты изображения;
+    :return: Строка из 32 шестнадцатеричных символов.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class FileIdCache:
+    """
+    `file_id`, которые Telegram вернул после загрузки изображений, по хэшу
+    содержимого. Повторная отправка тех же байтов ссылается на `file_id`
+    без загрузки файла. Записи дописываются в JSONL-файл, общий для
+    воркеров, и переживают перезапуск. Запись и сжатие файла идут под
+    блокировкой между процессами; файл сжимается до последних записей,
+    когда строк в нем становится больше `2 * max_entries`. Записи других
+    воркеров дочитываются перед каждой записью и при промахе. `send_photo`
+    ищет `file_id` в памяти, а чтение и запись файла выполняет
+    в `executor.run_io`.
+    """
+
+    def __init__(self, path=FILE_ID_PATH, max_entries=FILE_ID_CACHE_SIZE):
+        """
+        :param path: Путь к файлу записей (None - только в памяти);
+        :param max_entries: Сколько последних `file_id` хранить.
+        """
+        self.path = Path(path) if path else None
+        self.lock_path = self.path.with_suffix(".lock") if self.path else None
+        self.max_entries = max_entries
+        self._file_ids = OrderedDict()
+        # Прочитанная часть файла: inode (меняется при сжатии), смещение
+        # в байтах и число строк
+        self._inode = None
+        self._offset = 0
+        self._lines = 0
+        # В конце файла недописанная после сбоя строка
+        self._partial = False
+        # `_lock` защищает записи в памяти и держится недолго: его ждет
+        # поиск в event loop; `_io_lock` - чтение и запись файла в потоках
+        self._lock = threading.Lock()
+        self._io_lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        # Байты изображений, отправленных по `file_id` вместо загрузки
+        self.bytes_saved = 0
+        # `file_id`, отклоненные Telegram (например, после смены токена)
+        self.rejected = 0
+        self._load()
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    def __contains__(self, digest):
+        return digest in self._file_ids
+
+    def get(self, digest):
+        """
+        `file_id` по хэшу содержимого или None.
+        """
+        file_id = self._lookup(digest)
+        if file_id is None:
+            # Изображение мог загрузить другой воркер
+            self._sync()
+            file_id = self._lookup(digest)
+        self._count(file_id)
+        return file_id
+
+    def put(self, digest, file_id):
+        if self._file_ids.get(digest) == file_id:
+            return
+        self._write(digest, file_id)
+
+    def forget(self, digest):
+        if digest in self._file_ids:
+            self._write(digest, None)
+
+    async def send_photo(self, bot, chat_id, photo, digest=None, **kwargs):
+        """
+        Отправка изображения по `file_id`, если те же байты уже
+        загружались, иначе - загрузка с запоминанием `file_id`.
+        Отклоненный `file_id` забывается, и изображение загружается заново.
+
+        :param bot: `aiogram.Bot`;
+        :param chat_id: Чат;
+        :param photo: `BufferedInputFile` с изображением (другие значения,
+         например `file_id` или URL, отправляются как есть);
+        :param digest: Хэш содержимого, если уже посчитан;
+        :param kwargs: Прочие аргументы `send_photo` (например, caption);
+        :return: Отправленное сообщение.
+        """
+        if not isinstance(photo, BufferedInputFile):
+            return await bot.send_photo(chat_id, photo=photo, **kwargs)
+        digest = digest or content_hash(photo.data)
+        file_id = self._lookup(digest)
+        if file_id is None and self.path is not None:
+            # Изображение мог загрузить другой воркер
+            await run_io(self._sync)
+            file_id = self._lookup(digest)
+        self._count(file_id)
+        if file_id is not None:
+            try:
+                message = await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                logging.warning("Cached file_id rejected: %s", e)
+                self.rejected += 1
+                await run_io(self.forget, digest)
+            else:
+                self.bytes_saved += len(photo.data)
+                return message
+
+        message = await bot.send_photo(chat_id, photo=photo, **kwargs)
+        file_id = message.photo[-1].file_id if message and message.photo else None
+        if isinstance(file_id, str):
+            await run_io(self.put, digest, file_id)
+        return message
+
+    def stats(self):
+        """
+        Доля отправок по `file_id` и сэкономленные байты загрузки.
+        """
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._file_ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "rejected": self.rejected,
+        }
+
+    def _lookup(self, digest):
+        # Поиск только в памяти, без чтения файла
+        with self._lock:
+            file_id = self._file_ids.get(digest)
+            if file_id is not None:
+                self._file_ids.move_to_end(digest)
+        return file_id
+
+    def _count(self, file_id):
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        with file_lock(self.lock_path), self._io_lock:
+            self._sync()
+            # Недописанную после сбоя строку сжатие уберет до следующей записи
+            if self._partial or self._lines > 2 * self.max_entries:
+                self._compact()
+
+    def _write(self, digest, file_id):
+        if self.path is None:
+            with self._lock:
+                self._apply(digest, file_id)
+            return
+        with file_lock(self.lock_path), self._io_lock:
+            # Сначала дочитываем записи других воркеров: смещение должно
+            # указывать на конец файла
+            self._sync()
+            if self._partial:
+                self._compact()
+            with self._lock:
+                self._apply(digest, file_id)
+            line = (json.dumps([digest, file_id]) + "\n").encode()
+            with self.path.open("ab") as f:
+                f.write(line)
+            self._offset += len(line)
+            self._lines += 1
+            if self._lines > 2 * self.max_entries:
+                self._compact()
+
+    def _apply(self, digest, file_id):
+        # Вызывается под `_lock`
+        if file_id is None:
+            self._file_ids.pop(digest, None)
+            return
+        self._file_ids[digest] = file_id
+        self._file_ids.move_to_end(digest)
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.popitem(last=False)
+
+    def _sync(self):
+        # Дочитывание строк, дописанных после прошлого чтения; если файл
+        # сжат другим воркером (новый inode), он читается заново
+        if self.path is None:
+            return
+        with self._io_lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            reload = stat.st_ino != self._inode or stat.st_size < self._offset
+            if reload:
+                self._inode, self._offset, self._lines = stat.st_ino, 0, 0
+            if stat.st_size == self._offset:
+                return
+            entries = []
+            with self.path.open("rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    self._partial = not line.endswith(b"\n")
+                    if self._partial:
+                        # Строку еще дописывают (или запись оборвалась)
+                        break
+                    self._offset += len(line)
+                    self._lines += 1
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+            # Записи в памяти меняются одним шагом, уже после чтения файла
+            with self._lock:
+                if reload:
+                    self._file_ids.clear()
+                for digest, file_id in entries:
+                    self._apply(digest, file_id)
+
+    def _compact(self):
+        # Вызывается под блокировками после `_sync`: в памяти все записи файла
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            entries = list(self._file_ids.items())
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            for digest, file_id in entries:
+                f.write(json.dumps([digest, file_id]) + "\n")
+        tmp.replace(self.path)
+        stat = os.stat(self.path)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+        self._lines = len(entries)
+        self._partial = False
+
+
+# Общий кэш `file_id` для обработчиков и рассылки
+file_id_cache = FileIdCache()
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import engines
+import metrics
+from config import (FORECAST_CLOSE_DELAY, FORECAST_MAX_AGE,
+                    FORECAST_MAX_HORIZON, FORECAST_REFRESH_SECONDS,
+                    FORECAST_TICKERS)
+from metrics import span
+from models import arima_model
+from pre_processing import data_loader
+from singleflight import SingleFlight
+
+
+def last_daily_close(now):
+    """
+    Время закрытия последнего дневного бара (полночь UTC).
+    """
+    return now.astimezone(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+@dataclass
+class Forecast:
+    """
+    Прогноз тикера на максимальный горизонт и данные, на которых он построен.
+    """
+
+    ticker: str
+    # Исторические данные из `data_loader`
+    data: pd.DataFrame
+    # Предсказание и доверительный интервал на `horizon` дней
+    predict: pd.Series
+    conf: np.ndarray
+    horizon: int
+    # Момент, от которого отсчитываются даты прогноза
+    end_date: datetime
+    # Время расчета (UTC)
+    computed_at: datetime
+
+    def is_stale(self, now=None, max_age=FORECAST_MAX_AGE):
+        """
+        Прогноз устарел, если после его расчета закрылся дневной бар
+        или прошло больше `max_age` секунд.
+        """
+        now = now or datetime.now(timezone.utc)
+        return (
+            self.computed_at < last_daily_close(now)
+            or (now - self.computed_at).total_seconds() > max_age
+        )
+
+
+class ForecastCache:
+    """
+    Заранее рассчитанные прогнозы для популярных тикеров. Фоновая задача
+    `run` пересчитывает их после каждого дневного закрытия и периодически,
+    а обработчик только отрезает нужный горизонт.
+    """
+
+    def __init__(
+        self,
+        start_date,
+        col_value,
+        tickers=FORECAST_TICKERS,
+        max_horizon=FORECAST_MAX_HORIZON,
+    ):
+        """
+        :param start_date: Время начала рассмотрения данных;
+        :param col_value: Колонка для парсинга с yfinance;
+        :param tickers: Тикеры для фонового пересчета;
+        :param max_horizon: Горизонт, на который строится прогноз.
+        """
+        self.start_date = start_date
+        self.col_value = col_value
+        self.tickers = list(tickers)
+        self.max_horizon = max_horizon
+        self._forecasts = {}
+        # Одновременные пересчеты одного тикера выполняются один раз
+        self.flights = SingleFlight("forecast")
+        self.hits = 0
+        self.misses = 0
+
+    async def refresh(self, ticker):
+        """
+        Расчет прогноза тикера на максимальный горизонт.
+
+        :param ticker: Акция;
+        :return: Новый прогноз `Forecast`.
+        """
+        return await self.flights.do(ticker, self._refresh, ticker)
+
+    async def _refresh(self, ticker):
+        # Этапы замеряются в контексте запроса, вызвавшего пересчет
+        # (или фонового `run`)
+        end_date = datetime.now()
+        with span("download") as stage:
+            data = await data_loader(
+                self.start_date, end_date, [ticker], self.col_value
+            )
+            stage.size = len(data)
+        with span("forecast", size=len(data)):
+            started = time.perf_counter()
+            predict, conf = await arima_model(data, ticker, self.max_horizon)
+            # Прогнозы ARIMA обучаются только здесь, поэтому и замер
+            # для выбора движка (в том числе при повторных замерах) - здесь
+            engines.latency_tracker.observe("arima", time.perf_counter() - started)
+        forecast = Forecast(
+            ticker=ticker,
+            data=data,
+            predict=predict,
+            conf=conf,
+            horizon=self.max_horizon,
+            end_date=end_date,
+            computed_at=datetime.now(timezone.utc),
+        )
+        self._forecasts[ticker] = forecast
+        return forecast
+
+    async def get(self, ticker, periods):
+        """
+        Прогноз на `periods` дней из кэша. Если прогноза нет или он
+        устарел, он пересчитывается по запросу.
+
+        :param ticker: Акция;
+        :param periods: Горизонт предсказания;
+        :return: `(data, predict, conf, end_date)` или None,
+         если горизонт больше максимального.
+        """
+        if periods > self.max_horizon:
+            return None
+
+        forecast = self._forecasts.get(ticker)
+        if forecast is None or forecast.is_stale():
+            self.misses += 1
+            forecast = await self.refresh(ticker)
+        else:
+            self.hits += 1
+
+        return (
+            forecast.data,
+            forecast.predict.iloc[:periods],
+            forecast.conf[:periods],
+            forecast.end_date,
+        )
+
+    def stats(self):
+        """
+        Возраст прогнозов и счетчики попаданий.
+        """
+        now = datetime.now(timezone.utc)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "age_seconds": {
+                ticker: (now - forecast.computed_at).total_seconds()
+                for ticker, forecast in self._forecasts.items()
+            },
+        }
+
+    def seconds_until_refresh(self, now=None):
+        """
+        Пауза до следующего пересчета: ближайшее из дневного
+        закрытия (с задержкой) и периодического обновления.
+        """
+        now = now or datetime.now(timezone.utc)
+        next_close = (
+            last_daily_close(now)
+            + timedelta(days=1)
+            + timedelta(seconds=FORECAST_CLOSE_DELAY)
+        )
+        return min((next_close - now).total_seconds(), FORECAST_REFRESH_SECONDS)
+
+    async def run(self):
+        """
+        Фоновый пересчет прогнозов, запускается из `app.main()`.
+        """
+        while True:
+            for ticker in self.tickers:
+                started = time.monotonic()
+                try:
+                    with metrics.request("refresh_forecast", ticker=ticker):
+                        await self.refresh(ticker)
+                except Exception:
+                    logging.exception("Forecast refresh failed for %s", ticker)
+                else:
+                    logging.info(
+                        "Forecast for %s refreshed in %.2fs",
+                        ticker,
+                        time.monotonic() - started,
+                    )
+            await asyncio.sleep(self.seconds_until_refresh())
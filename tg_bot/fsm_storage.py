@@ -0,0 +1,44 @@
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+
+from config import FSM_STORAGE_URL, FSM_TTL
+
+
+def create_storage(url=FSM_STORAGE_URL, redis=None):
+    """
+    Хранилище состояний FSM.
+
+    Без адреса состояние хранится в памяти процесса. С адресом Redis
+    (или с переданным клиентом) состояние и данные пользователей лежат
+    вне процесса, поэтому их видят все воркеры бота и они переживают
+    перезапуск.
+
+    :param url: Адрес Redis, например `redis://localhost:6379/0`;
+    :param redis: Готовый асинхронный клиент Redis (например, для тестов);
+    :return: Хранилище aiogram.
+    """
+    if redis is None and not url:
+        return MemoryStorage()
+
+    kwargs = {
+        "key_builder": DefaultKeyBuilder(with_destiny=True),
+        "state_ttl": FSM_TTL,
+        "data_ttl": FSM_TTL,
+    }
+    if redis is not None:
+        return RedisStorage(redis, **kwargs)
+    return RedisStorage.from_url(url, **kwargs)
+
+
+def create_isolation(storage):
+    """
+    Блокировки обработки событий одного пользователя. Для общего
+    хранилища блокировки тоже хранятся в Redis, чтобы два воркера
+    не обрабатывали сообщения одного пользователя одновременно.
+
+    :param storage: Хранилище из `create_storage`;
+    :return: Изоляция событий или None (без блокировок, как по умолчанию).
+    """
+    if isinstance(storage, RedisStorage):
+        return storage.create_isolation()
+    return None
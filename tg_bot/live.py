@@ -0,0 +1,438 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+from config import (LIVE_BUFFER_SIZE, LIVE_DIR, LIVE_FEED_URL,
+                    LIVE_STALE_SECONDS, LIVE_TICKERS)
+from market_data import (COLUMNS, DAILY, backoff_delay, empty_frame,
+                         parse_interval)
+
+
+# Заголовок буфера: счетчик записей (нечетный, пока идет запись), позиция
+# следующей записи, число тиков и время записи последнего тика (наносекунды
+# эпохи по часам бота)
+SEQ, NEXT, SIZE, RECEIVED_AT = range(4)
+HEADER_WORDS = 4
+
+# Сколько раз читатель повторяет чтение, совпавшее с записью
+READ_ATTEMPTS = 100
+
+
+def open_shared(path, words):
+    """
+    Memory-map файла из `words` чисел int64, общего для процессов.
+    Файл создается нулями, если его нет.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        # Увеличение размера заполняет файл нулями, поэтому процессы,
+        # открывающие его одновременно, не мешают друг другу
+        if os.fstat(fd).st_size < words * 8:
+            os.ftruncate(fd, words * 8)
+    finally:
+        os.close(fd)
+    return np.memmap(path, dtype="i8", mode="r+", shape=(words,))
+
+
+class RingBuffer:
+    """
+    Последние `capacity` тиков тикера в двух массивах NumPy фиксированного
+    размера: время (int64, наносекунды UTC) и цена (float64). Новый тик
+    замещает самый старый, без выделения памяти.
+
+    С `path` массивы и заголовок лежат в memory-map файле: тики пишет один
+    процесс (ведущий), а читают все воркеры. Запись окружена нечетным
+    значением счетчика `SEQ`, и читатель повторяет чтение, если счетчик
+    изменился или запись еще идет.
+    """
+
+    def __init__(self, capacity, path=None):
+        """
+        :param capacity: Сколько последних тиков хранить;
+        :param path: Файл буфера, общий для процессов (None - в памяти).
+        """
+        self.capacity = capacity
+        words = HEADER_WORDS + 2 * capacity
+        if path is None:
+            storage = np.zeros(words, dtype="i8")
+        else:
+            storage = open_shared(Path(path), words)
+        self._header = storage[:HEADER_WORDS]
+        self.times = storage[HEADER_WORDS : HEADER_WORDS + capacity]
+        self.prices = storage[HEADER_WORDS + capacity :].view("f8")
+
+    def __len__(self):
+        return int(self._header[SIZE])
+
+    def append(self, timestamp, price):
+        """
+        :param timestamp: Время тика, наносекунды UTC;
+        :param price: Цена.
+        """
+        header = self._header
+        # Нечетный счетчик - запись идет; `| 1` выравнивает счетчик,
+        # оставленный процессом, завершившимся посреди записи
+        seq = int(header[SEQ]) | 1
+        header[SEQ] = seq
+        position = int(header[NEXT])
+        self.times[position] = timestamp
+        self.prices[position] = price
+        header[NEXT] = (position + 1) % self.capacity
+        header[SIZE] = min(int(header[SIZE]) + 1, self.capacity)
+        header[RECEIVED_AT] = time.time_ns()
+        header[SEQ] = seq + 1
+
+    def snapshot(self, since=None):
+        """
+        Копия тиков в порядке поступления.
+
+        :param since: Только тики не раньше этого времени, наносекунды UTC;
+        :return: `(время, цены)`.
+        """
+
+        def read():
+            size = int(self._header[SIZE])
+            start = (int(self._header[NEXT]) - size) % self.capacity
+            order = (start + np.arange(size)) % self.capacity
+            return self.times[order], self.prices[order]
+
+        times, prices = self._consistent(read)
+        if since is not None:
+            # Тики приходят по порядку, поэтому хватает бинарного поиска
+            left = np.searchsorted(times, since, side="left")
+            times, prices = times[left:], prices[left:]
+        return times, prices
+
+    def last(self):
+        """
+        Последний тик `(время, цена)` или None.
+        """
+
+        def read():
+            if not self._header[SIZE]:
+                return None
+            position = (int(self._header[NEXT]) - 1) % self.capacity
+            return int(self.times[position]), float(self.prices[position])
+
+        return self._consistent(read)
+
+    def received_at(self):
+        """
+        Когда записан последний тик (секунды эпохи) или None.
+        """
+        received = int(self._header[RECEIVED_AT])
+        return received / 1e9 if received else None
+
+    def _consistent(self, read):
+        """
+        `read()`, не пересекшийся с записью другого процесса.
+        """
+        for _ in range(READ_ATTEMPTS):
+            seq = int(self._header[SEQ])
+            if not seq % 2:
+                result = read()
+                if int(self._header[SEQ]) == seq:
+                    return result
+            time.sleep(0)
+        # Писатель завершился посреди записи: читаем как есть
+        return read()
+
+
+def parse_ticks(message):
+    """
+    Тики из сообщения потока: объект `{"ticker", "time", "price"}`
+    или список таких объектов; время - секунды эпохи UTC.
+
+    :return: Список `(тикер, время в наносекундах, цена)`.
+    """
+    payload = json.loads(message)
+    if isinstance(payload, dict):
+        payload = [payload]
+    return [
+        (tick["ticker"], int(float(tick["time"]) * 1e9), float(tick["price"]))
+        for tick in payload
+        if "ticker" in tick and "price" in tick
+    ]
+
+
+class StreamProvider:
+    """
+    Источник потока цен. Соединение с сервером - на время итерации.
+    """
+
+    async def stream(self, tickers):
+        """
+        Асинхронный итератор тиков `(тикер, время в наносекундах, цена)`.
+        Разрыв соединения - исключение или конец итерации.
+
+        :param tickers: Тикеры для подписки.
+        """
+        raise NotImplementedError
+        yield
+
+
+class WebSocketProvider(StreamProvider):
+    """
+    Поток цен по WebSocket: после подключения отправляется
+    `{"subscribe": [тикеры]}`, в ответ приходят тики в формате `parse_ticks`
+    (например, локальный `fake_feed.FakeFeedServer` в тестах).
+    """
+
+    def __init__(self, url, heartbeat=30):
+        """
+        :param url: Адрес `ws://` или `wss://`;
+        :param heartbeat: Интервал ping, секунд.
+        """
+        self.url = url
+        self.heartbeat = heartbeat
+
+    async def stream(self, tickers):
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+                await ws.send_json({"subscribe": list(tickers)})
+                async for message in ws:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    for tick in parse_ticks(message.data):
+                        yield tick
+
+
+class LiveFeed:
+    """
+    Фоновый прием потока цен в кольцевые буферы по тикерам. Графики
+    дописывают из буферов хвост к сохраненной истории (`extend`) без
+    повторной загрузки; прогнозы строятся по сохраненной истории, чтобы
+    обученные модели оставались в кэше между тиками.
+
+    Поток принимает только ведущий процесс. С `directory` буферы лежат
+    в общих файлах, и остальные воркеры читают из них те же тики.
+    """
+
+    def __init__(
+        self,
+        provider,
+        tickers=LIVE_TICKERS,
+        capacity=LIVE_BUFFER_SIZE,
+        stale=LIVE_STALE_SECONDS,
+        sleep=asyncio.sleep,
+        directory=None,
+    ):
+        """
+        :param provider: Источник потока `StreamProvider` (None - поток выключен);
+        :param tickers: Тикеры для подписки;
+        :param capacity: Размер буфера каждого тикера, тиков;
+        :param stale: Через сколько секунд без тиков хвост не используется;
+        :param sleep: Функция ожидания перед переподключением;
+        :param directory: Каталог буферов, общий для воркеров
+         (None - буферы в памяти процесса).
+        """
+        self.provider = provider
+        self.tickers = list(tickers)
+        self.stale = stale
+        self.sleep = sleep
+        self.buffers = {}
+        for ticker in self.tickers:
+            path = None
+            if directory is not None:
+                # Размер в имени: буфер другого размера - другой файл
+                name = f"{ticker.replace(os.sep, '_')}-{capacity}.ticks"
+                path = Path(directory) / name
+            self.buffers[ticker] = RingBuffer(capacity, path)
+        # Синхронные обработчики каждого тика `listener(тикер, время, цена)`
+        self.listeners = []
+        self.ticks = 0
+        self.reconnects = 0
+
+    @property
+    def enabled(self):
+        return self.provider is not None
+
+    def on_tick(self, ticker, timestamp, price):
+        """
+        Запись тика в буфер тикера (тики других тикеров пропускаются).
+        """
+        buffer = self.buffers.get(ticker)
+        if buffer is None:
+            return
+        buffer.append(timestamp, price)
+        self.ticks += 1
+        for listener in self.listeners:
+            listener(ticker, timestamp, price)
+
+    async def run(self):
+        """
+        Фоновый прием потока, запускается из `app.main()`. После разрыва
+        соединения переподключается с экспоненциальной паузой.
+        """
+        attempt = 0
+        while True:
+            try:
+                async for ticker, timestamp, price in self.provider.stream(
+                    self.tickers
+                ):
+                    self.on_tick(ticker, timestamp, price)
+                    attempt = 0
+                logging.warning("Live feed closed by server")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning("Live feed failed: %s", e)
+            self.reconnects += 1
+            await self.sleep(backoff_delay(attempt))
+            attempt += 1
+
+    def is_fresh(self):
+        """
+        Поток жив: последний тик пришел не раньше `stale` секунд назад
+        (в любом процессе, который пишет в общие буферы).
+        """
+        received_at = [buffer.received_at() for buffer in self.buffers.values()]
+        received_at = [value for value in received_at if value is not None]
+        return bool(received_at) and time.time() - max(received_at) <= self.stale
+
+    def latest(self, ticker):
+        """
+        Последний тик тикера `(время, цена)` или None.
+        """
+        buffer = self.buffers.get(ticker)
+        return buffer.last() if buffer is not None else None
+
+    def bars(self, ticker, interval=DAILY, since=None):
+        """
+        Бары OHLC из тиков буфера (объем неизвестен и равен нулю).
+
+        :param ticker: Акция;
+        :param interval: Размер бара, например "5m" или "1d";
+        :param since: Только бары, начинающиеся не раньше этого времени;
+        :return: Таблица OHLCV с индексом 'Date' (начало бара).
+        """
+        delta = parse_interval(interval).value
+        buffer = self.buffers.get(ticker)
+        if buffer is None:
+            return empty_frame()
+        since = None if since is None else pd.Timestamp(since).value
+        times, prices = buffer.snapshot(since)
+        if not len(times):
+            return empty_frame()
+
+        # Границы баров - по смене номера бара, как в `data_candles`
+        buckets = times // delta
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        lasts = np.r_[starts[1:], len(times)] - 1
+        close = prices[lasts]
+        return pd.DataFrame(
+            {
+                "Open": prices[starts],
+                "High": np.maximum.reduceat(prices, starts),
+                "Low": np.minimum.reduceat(prices, starts),
+                "Close": close,
+                "Adj Close": close,
+                "Volume": np.zeros(len(starts), dtype="i8"),
+            },
+            index=pd.DatetimeIndex(
+                (buckets[starts] * delta).view("M8[ns]"), name="Date"
+            ),
+            columns=COLUMNS,
+        )
+
+    def extend(self, data, tickers, interval=DAILY, end=None):
+        """
+        История с дописанным живым хвостом. Последний бар истории
+        дополняется тиками буфера, бары после него добавляются.
+        Если поток выключен или молчит дольше `stale` секунд,
+        история возвращается без изменений.
+
+        :param data: Таблица из `data_loader` (колонки - тикеры)
+         или из `data_all` (колонки OHLCV одного тикера `tickers[0]`);
+        :param tickers: Акции;
+        :param interval: Интервал баров `data`;
+        :param end: Конец запрошенного диапазона (не включительно):
+         хвост не выходит за него, а к истории за прошлые периоды
+         не дописывается вовсе;
+        :return: Таблица того же вида.
+        """
+        if not self.is_fresh() or data.empty:
+            return data
+        since = data.index[-1]
+        if "Close" in data.columns:
+            tail = self.bars(tickers[0], interval, since)
+        else:
+            tail = pd.DataFrame(
+                {
+                    ticker: self.bars(ticker, interval, since)["Close"]
+                    for ticker in tickers
+                    if ticker in data.columns
+                }
+            )
+        if end is not None:
+            tail = tail[tail.index < pd.Timestamp(end)]
+        if tail.empty:
+            return data
+
+        data = data.copy()
+        if tail.index[0] == since:
+            if "Close" in data.columns:
+                merge_bar(data, tail.iloc[0])
+            else:
+                # Цена незакрытого бара - последняя цена потока
+                live = tail.iloc[0].dropna()
+                data.loc[since, live.index] = live
+            tail = tail.iloc[1:]
+        if tail.empty:
+            return data
+        return pd.concat([data, tail.reindex(columns=data.columns)])
+
+    def stats(self):
+        """
+        Счетчики тиков и переподключений, заполненность буферов.
+        """
+        return {
+            "ticks": self.ticks,
+            "reconnects": self.reconnects,
+            "fresh": int(self.is_fresh()),
+            "buffered": {
+                ticker: len(buffer) for ticker, buffer in self.buffers.items()
+            },
+        }
+
+
+def merge_bar(data, live):
+    """
+    Слияние последнего бара OHLCV `data` (на месте) с баром из тиков
+    буфера: в буфере может не быть начала бара, поэтому открытие
+    и объем остаются из истории, максимум и минимум - по обоим барам,
+    закрытие - последняя цена потока.
+
+    :param data: Таблица OHLCV;
+    :param live: Бар из `LiveFeed.bars` за то же время.
+    """
+    since = data.index[-1]
+    if "High" in data.columns:
+        data.loc[since, "High"] = np.fmax(data.loc[since, "High"], live["High"])
+    if "Low" in data.columns:
+        data.loc[since, "Low"] = np.fmin(data.loc[since, "Low"], live["Low"])
+    for column in ["Close", "Adj Close"]:
+        if column in data.columns:
+            data.loc[since, column] = live["Close"]
+
+
+def create_live_feed(url=LIVE_FEED_URL, directory=LIVE_DIR):
+    """
+    Поток цен по настройкам: WebSocket по `url` с буферами в `directory`
+    или выключенный (пустой `url`).
+    """
+    if not url:
+        return LiveFeed(None)
+    return LiveFeed(WebSocketProvider(url), directory=directory)
+
+
+# Общий поток цен, из которого обработчики дописывают живой хвост
+live_feed = create_live_feed()
@@ -0,0 +1,88 @@
+import asyncio
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import LEADER_LOCK_PATH, LEADER_RETRY_SECONDS
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Эксклюзивная блокировка (flock) файла `path` между процессами.
+    Файл открывается заново при каждом входе, поэтому потоки одного
+    процесса тоже ждут друг друга.
+
+    :param path: Путь к файлу блокировки (создается при необходимости).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LeaderLock:
+    """
+    Роль ведущего процесса среди воркеров бота: фоновые задачи (пересчет
+    прогнозов, поток цен, рассылки) выполняет только процесс, удерживающий
+    блокировку файла. Блокировка снимается вместе с процессом, и роль
+    переходит к одному из оставшихся.
+    """
+
+    def __init__(self, path=LEADER_LOCK_PATH):
+        """
+        :param path: Путь к файлу блокировки, общий для всех воркеров.
+        """
+        self.path = Path(path)
+        self._file = None
+
+    @property
+    def is_leader(self):
+        return self._file is not None
+
+    def try_acquire(self):
+        """
+        Попытка стать ведущим без ожидания.
+
+        :return: True, если процесс - ведущий.
+        """
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    async def run(self, start, retry=LEADER_RETRY_SECONDS, sleep=asyncio.sleep):
+        """
+        Ожидание роли ведущего; получив ее, процесс вызывает `start()`.
+
+        :param start: Синхронная функция, запускающая фоновые задачи;
+        :param retry: Пауза между попытками, секунд;
+        :param sleep: Асинхронная функция ожидания.
+        """
+        while not self.try_acquire():
+            await sleep(retry)
+        logging.info("Process %s runs background jobs", os.getpid())
+        start()
+
+
+# Роль ведущего текущего процесса
+leader = LeaderLock()
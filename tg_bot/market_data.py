@@ -0,0 +1,561 @@
+import asyncio
+import io
+import logging
+import random
+import threading
+import time
+
+import pandas as pd
+import requests
+import yfinance as yf
+from requests.adapters import HTTPAdapter
+
+from config import (IO_WORKERS, MARKET_DATA_BACKOFF, MARKET_DATA_BACKOFF_CAP,
+                    MARKET_DATA_BURST, MARKET_DATA_DEADLINE,
+                    MARKET_DATA_PROVIDER, MARKET_DATA_RATE,
+                    MARKET_DATA_RETRIES, MARKET_DATA_TIMEOUT, MARKET_DATA_URL)
+
+# Колонки OHLCV в том виде, в котором их отдает yfinance
+COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+# Дневные бары
+DAILY = "1d"
+
+# Интервалы баров, которые отдают провайдеры
+INTERVALS = ("1m", "5m", "15m", "30m", "1h", DAILY)
+
+# Ограничения Yahoo на внутридневные бары: `(дней в одном запросе, дней
+# истории от текущего момента)`
+YAHOO_INTRADAY_LIMITS = {
+    "1m": (7, 30),
+    "5m": (60, 60),
+    "15m": (60, 60),
+    "30m": (60, 60),
+    "1h": (730, 730),
+}
+
+# Ошибки yfinance, с которыми Yahoo отвечает на диапазон без торгов.
+# "No timezone found" сюда не входит: так yfinance сообщает и о сбое сети
+YAHOO_NO_DATA = ("No price data found", "No data found")
+
+
+def parse_interval(interval):
+    """
+    Длительность интервала вида "5m", "4h" или "1d".
+
+    :param interval: Число и единица: m - минуты, h - часы, d - дни;
+    :return: `pd.Timedelta`.
+    """
+    units = {"m": "min", "h": "h", "d": "D"}
+    count, unit = interval[:-1], interval[-1:]
+    if not count.isdigit() or int(count) == 0 or unit not in units:
+        raise ValueError(f"Unknown interval {interval!r}, expected e.g. '5m', '1h'")
+    return pd.Timedelta(int(count), unit=units[unit])
+
+
+def source_interval(interval):
+    """
+    Самый крупный интервал провайдера, из баров которого собираются
+    свечи `interval` (его длительность делится на длительность источника).
+    """
+    delta = parse_interval(interval)
+    return max(
+        (
+            source
+            for source in INTERVALS
+            if delta % parse_interval(source) == pd.Timedelta(0)
+        ),
+        key=parse_interval,
+    )
+
+
+def candle_count(start, end, interval, now=None):
+    """
+    Оценка числа свечей `interval` в диапазоне до загрузки (торги
+    криптовалютой идут круглосуточно, поэтому оценка точна сверху).
+
+    :param start: Начало диапазона;
+    :param end: Конец диапазона (не включительно), не позже `now`;
+    :param interval: Размер свечи, например "15m";
+    :param now: Текущее время (по умолчанию - сейчас).
+    """
+    end = min(pd.Timestamp(end), pd.Timestamp(now or pd.Timestamp.now()))
+    span = end - pd.Timestamp(start)
+    if span <= pd.Timedelta(0):
+        return 0
+    return -(-span // parse_interval(interval))
+
+
+def yahoo_windows(start, end, interval):
+    """
+    Диапазон, разбитый на окна не длиннее, чем Yahoo отдает за один запрос.
+
+    :return: Список пар `(начало, конец)`.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    limits = YAHOO_INTRADAY_LIMITS.get(interval)
+    if limits is None:
+        return [(start, end)]
+    window = pd.Timedelta(days=limits[0])
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+
+def empty_frame():
+    """
+    Пустая таблица OHLCV: данных за диапазон нет.
+    """
+    return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], name="Date"))
+
+
+class MarketDataError(Exception):
+    """
+    Котировки загрузить не удалось; текст ошибки можно показать пользователю.
+    """
+
+
+class TransientError(Exception):
+    """
+    Временная ошибка провайдера (сеть, 429, 5xx): запрос можно повторить.
+    """
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов: `rate` запросов в секунду
+    с запасом до `capacity` запросов подряд. Общий для всех потоков.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param rate: Скорость пополнения, запросов в секунду;
+        :param capacity: Максимальное число запросов подряд;
+        :param clock: Монотонные часы;
+        :param sleep: Функция ожидания.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+        # Суммарное время ожидания токенов, секунд
+        self.waited = 0.0
+
+    def reserve(self):
+        """
+        Забирает токен, если он есть.
+
+        :return: 0, если токен получен, иначе сколько секунд до следующего.
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, deadline=None):
+        """
+        Ожидание токена не дольше, чем до `deadline` (по часам `clock`).
+
+        :return: True, если токен получен до истечения срока.
+        """
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            self.waited += wait
+            self.sleep(wait)
+
+    async def wait(self, sleep=asyncio.sleep):
+        """
+        Асинхронное ожидание токена (без срока) - для корутин, которые
+        не должны блокировать цикл событий.
+
+        :param sleep: Асинхронная функция ожидания.
+        """
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            self.waited += wait
+            await sleep(wait)
+
+
+def backoff_delay(attempt, base=MARKET_DATA_BACKOFF, cap=MARKET_DATA_BACKOFF_CAP):
+    """
+    Пауза перед повтором номер `attempt` (с нуля): экспоненциальная
+    с полным случайным разбросом, чтобы повторы разных запросов
+    не приходили к провайдеру одновременно.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def pooled_session(pool_size=IO_WORKERS):
+    """
+    Сессия requests с пулом соединений на каждый поток ввода-вывода.
+    Повторы делает `MarketData`, поэтому у адаптера их нет.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class Provider:
+    """
+    Источник баров OHLCV. Ошибки, после которых запрос можно
+    повторить, провайдер поднимает как `TransientError`.
+    """
+
+    def fetch(self, ticker, start, end, timeout, interval=DAILY):
+        """
+        :param ticker: Акция;
+        :param start: Начало диапазона (включительно);
+        :param end: Конец диапазона (не включительно);
+        :param timeout: Таймаут одного HTTP-запроса, секунд;
+        :param interval: Интервал баров из `INTERVALS`;
+        :return: Таблица OHLCV с индексом 'Date' (пустая, если данных нет).
+        """
+        raise NotImplementedError
+
+    def check_range(self, start, end, interval, now=None):
+        """
+        Проверка, что провайдер хранит бары `interval` за диапазон;
+        если нет - `MarketDataError` с текстом для пользователя.
+        """
+
+    def request_count(self, tickers, start, end, interval=DAILY):
+        """
+        Сколько запросов к источнику займет загрузка диапазона тикеров:
+        по токену ограничения частоты на каждый.
+        """
+        return len(tickers)
+
+    def fetch_many(self, tickers, start, end, timeout, interval=DAILY, deadline=None):
+        """
+        Загрузка нескольких тикеров; по умолчанию - по одному.
+
+        :param timeout: Таймаут одного HTTP-запроса, секунд;
+        :param deadline: Срок на весь пакет (по `time.monotonic`): таймаут
+         каждого запроса сокращается до оставшегося времени;
+        :return: Словарь `тикер -> таблица OHLCV`.
+        """
+        frames = {}
+        for ticker in tickers:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TransientError(f"{ticker}: batch deadline exceeded")
+                timeout = min(timeout, remaining)
+            frames[ticker] = self.fetch(ticker, start, end, timeout, interval)
+        return frames
+
+
+class YahooProvider(Provider):
+    """
+    Котировки Yahoo Finance через yfinance с общей сессией.
+    """
+
+    # `yf.download` хранит результаты и ошибки в глобальных переменных
+    # модуля `yfinance.shared`, поэтому пакетные загрузки идут по одной
+    _download_lock = threading.Lock()
+
+    def __init__(self, session=None):
+        self.session = session or pooled_session()
+
+    def check_range(self, start, end, interval, now=None):
+        limits = YAHOO_INTRADAY_LIMITS.get(interval)
+        if limits is None:
+            return
+        now = pd.Timestamp(now or pd.Timestamp.now())
+        if pd.Timestamp(start) < now - pd.Timedelta(days=limits[1]):
+            raise MarketDataError(
+                f"Yahoo Finance хранит бары {interval} только за последние"
+                f" {limits[1]} дней. Выберите период позже"
+                f" {(now - pd.Timedelta(days=limits[1])).date()} или свечи крупнее."
+            )
+
+    def request_count(self, tickers, start, end, interval=DAILY):
+        # Каждое окно каждого тикера - отдельный запрос, в том числе
+        # внутри `yf.download`
+        return len(tickers) * len(yahoo_windows(start, end, interval))
+
+    def fetch(self, ticker, start, end, timeout, interval=DAILY):
+        windows = yahoo_windows(start, end, interval)
+        if len(windows) > 1:
+            # Внутридневные бары Yahoo отдает ограниченными окнами
+            frames = [
+                self._fetch(ticker, window_start, window_end, timeout, interval)
+                for window_start, window_end in windows
+            ]
+            frames = [frame for frame in frames if not frame.empty]
+            return pd.concat(frames) if frames else empty_frame()
+        return self._fetch(ticker, start, end, timeout, interval)
+
+    def _fetch(self, ticker, start, end, timeout, interval):
+        try:
+            data = yf.Ticker(ticker, session=self.session).history(
+                start=start,
+                end=end,
+                interval=interval,
+                auto_adjust=False,
+                actions=False,
+                timeout=timeout,
+                raise_errors=True,
+            )
+        except Exception as e:
+            if yahoo_no_data(str(e)):
+                # Торгов в диапазоне не было
+                return empty_frame()
+            # Сеть, DNS, таймаут, "Yahoo is down", ответ с кодом ошибки или
+            # обрезанный ответ (yfinance поднимает их как Exception)
+            raise TransientError(f"{ticker}: {e}") from e
+        return self._normalize(data, interval)
+
+    def fetch_many(self, tickers, start, end, timeout, interval=DAILY, deadline=None):
+        """
+        Все тикеры одним вызовом `yf.download`: запросы тикеров идут
+        одновременно в потоках yfinance, поэтому пакет занимает время
+        самого медленного запроса, а не сумму. Таймаут запросов сокращается
+        до оставшегося срока `deadline`.
+        """
+        if len(yahoo_windows(start, end, interval)) > 1:
+            # Окна загружаются по тикерам, с общим сроком на пакет
+            return super().fetch_many(
+                tickers, start, end, timeout, interval, deadline=deadline
+            )
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise TransientError(f"{', '.join(tickers)}: batch deadline exceeded")
+        with self._download_lock:
+            try:
+                data = yf.download(
+                    list(tickers),
+                    start=start,
+                    end=end,
+                    interval=interval,
+                    auto_adjust=False,
+                    actions=False,
+                    group_by="ticker",
+                    threads=len(tickers),
+                    progress=False,
+                    timeout=timeout,
+                    session=self.session,
+                )
+            except Exception as e:
+                raise TransientError(f"{', '.join(tickers)}: {e}") from e
+            errors = dict(yf.shared._ERRORS)
+
+        frames = {}
+        for ticker in tickers:
+            # yfinance приводит тикеры к верхнему регистру
+            error = errors.get(ticker.upper())
+            if error is not None:
+                if not yahoo_no_data(error):
+                    raise TransientError(f"{ticker}: {error}")
+                frames[ticker] = empty_frame()
+                continue
+            frame = data[ticker.upper()] if len(tickers) > 1 else data
+            # Таблицы тикеров выровнены по общему индексу: убираем пустые строки
+            frames[ticker] = self._normalize(frame.dropna(how="all"), interval)
+        return frames
+
+    @staticmethod
+    def _normalize(data, interval):
+        data = data.copy()
+        if data.index.tz is not None:
+            if interval == DAILY:
+                # Дневной бар - календарный день биржи
+                data.index = data.index.tz_localize(None)
+            else:
+                # Внутридневные бары храним в UTC
+                data.index = data.index.tz_convert(None)
+        data.index = data.index.rename("Date")
+        if "Adj Close" not in data:
+            data["Adj Close"] = data["Close"]
+        return data[COLUMNS]
+
+
+def yahoo_no_data(message):
+    """
+    Ошибка yfinance означает, что Yahoo ответил без баров за диапазон,
+    а не сбой запроса (ответ с кодом ошибки - сбой).
+    """
+    return "status_code" not in message and any(
+        text in message for text in YAHOO_NO_DATA
+    )
+
+
+class HttpProvider(Provider):
+    """
+    Котировки из HTTP API вида `GET {base_url}/prices/{ticker}?start=&end=`,
+    отвечающего CSV с колонками Date и OHLCV (например, локальный
+    `fake_market.FakeMarketServer` в тестах и бенчмарках).
+    """
+
+    def __init__(self, base_url, session=None):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or pooled_session()
+
+    def fetch(self, ticker, start, end, timeout, interval=DAILY):
+        try:
+            response = self.session.get(
+                f"{self.base_url}/prices/{ticker}",
+                params={
+                    "start": pd.Timestamp(start).strftime("%Y-%m-%d"),
+                    "end": pd.Timestamp(end).strftime("%Y-%m-%d"),
+                    "interval": interval,
+                },
+                timeout=timeout,
+            )
+        except requests.RequestException as e:
+            raise TransientError(f"{ticker}: {e}") from e
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise TransientError(f"{ticker}: HTTP {response.status_code}")
+        if response.status_code == 404:
+            return empty_frame()
+        if response.status_code != 200:
+            raise MarketDataError(f"Не удалось загрузить котировки {ticker}.")
+        return pd.read_csv(
+            io.StringIO(response.text), index_col="Date", parse_dates=["Date"]
+        )
+
+
+class MarketData:
+    """
+    Загрузка котировок с ограничением частоты, повторами
+    с экспоненциальной паузой и общим сроком на запрос.
+    """
+
+    def __init__(
+        self,
+        provider,
+        bucket=None,
+        retries=MARKET_DATA_RETRIES,
+        timeout=MARKET_DATA_TIMEOUT,
+        deadline=MARKET_DATA_DEADLINE,
+        sleep=time.sleep,
+    ):
+        """
+        :param provider: Источник котировок `Provider`;
+        :param bucket: Общий `TokenBucket` (по умолчанию из настроек);
+        :param retries: Число повторов после первой попытки;
+        :param timeout: Таймаут одного HTTP-запроса, секунд;
+        :param deadline: Срок на загрузку с учетом повторов, секунд;
+        :param sleep: Функция ожидания между повторами.
+        """
+        self.provider = provider
+        self.bucket = bucket or TokenBucket(MARKET_DATA_RATE, MARKET_DATA_BURST)
+        self.retries = retries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.sleep = sleep
+        # Счетчики меняются из потоков ввода-вывода
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+
+    def fetch(self, ticker, start, end, interval=DAILY):
+        """
+        Бары тикера, сигнатура `PriceStore.fetch`.
+        """
+        return self._call(
+            self.provider.fetch,
+            ticker,
+            start,
+            end,
+            interval=interval,
+            cost=self.provider.request_count([ticker], start, end, interval),
+        )
+
+    def check_range(self, start, end, interval=DAILY):
+        """
+        Проверка диапазона до загрузки: провайдер может не хранить мелкие
+        бары за давний период (`MarketDataError` с текстом для пользователя).
+        """
+        self.provider.check_range(start, end, interval)
+
+    def fetch_many(self, tickers, start, end, interval=DAILY):
+        """
+        Бары нескольких тикеров, сигнатура `PriceStore.fetch_many`.
+        """
+        tickers = list(tickers)
+        return self._call(
+            self.provider.fetch_many,
+            tickers,
+            start,
+            end,
+            interval=interval,
+            batch=True,
+            cost=self.provider.request_count(tickers, start, end, interval),
+        )
+
+    def _call(self, func, *args, batch=False, cost=1, **kwargs):
+        """
+        :param cost: Число запросов к источнику за одну попытку: столько
+         токенов забирается из `bucket` перед каждой попыткой.
+        """
+        deadline = time.monotonic() + self.deadline
+        if batch:
+            # Срок общий для всего пакета, а не для каждого тикера
+            kwargs["deadline"] = deadline
+        error = None
+        for attempt in range(self.retries + 1):
+            if not all(self.bucket.acquire(deadline) for _ in range(cost)):
+                break
+            remaining = deadline - time.monotonic()
+            with self._lock:
+                self.requests += cost
+            try:
+                return func(*args, timeout=min(self.timeout, remaining), **kwargs)
+            except TransientError as e:
+                error = e
+                logging.warning("Market data request failed: %s", e)
+            delay = backoff_delay(attempt)
+            if attempt == self.retries or time.monotonic() + delay > deadline:
+                break
+            with self._lock:
+                self.retried += 1
+            self.sleep(delay)
+
+        with self._lock:
+            self.failures += 1
+        raise MarketDataError(
+            "Источник котировок сейчас недоступен, попробуйте позже."
+        ) from error
+
+    def stats(self):
+        """
+        Счетчики запросов, повторов и ожидания лимита.
+        """
+        return {
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "throttled_seconds": self.bucket.waited,
+        }
+
+
+def create_market_data(provider=MARKET_DATA_PROVIDER, url=MARKET_DATA_URL):
+    """
+    Слой загрузки котировок по настройкам: "yahoo" или "http" (`url`).
+    """
+    if provider == "http":
+        return MarketData(HttpProvider(url))
+    return MarketData(YahooProvider())
@@ -0,0 +1,263 @@
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+
+# Границы корзин гистограмм длительности, секунд
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Структурные логи этапов обработки (по одной JSON-строке на этап)
+logger = logging.getLogger("metrics")
+
+# Контекст текущего запроса: обработчик, id запроса, тикер
+_request = contextvars.ContextVar("request", default=None)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """
+    Гистограмма в формате Prometheus: накопительные корзины,
+    сумма и число наблюдений для каждого набора меток.
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        """
+        :param name: Имя метрики;
+        :param help: Описание метрики;
+        :param labelnames: Имена меток;
+        :param buckets: Верхние границы корзин по возрастанию.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Метки -> [счетчики корзин (+Inf последней), сумма]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Добавляет наблюдение `value` в серию с метками `labels`.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        """
+        Число наблюдений в серии с метками `labels`.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series[0]) if series else 0
+
+    def expose(self):
+        """
+        Строки метрики в текстовом формате Prometheus.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {
+                key: (list(counts), total)
+                for key, (counts, total) in self._series.items()
+            }
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(self.labelnames + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Набор гистограмм и источников статистики, отдаваемых на `/metrics`.
+    """
+
+    def __init__(self):
+        self._histograms = []
+        self._stats = {}
+
+    def histogram(self, name, help, labelnames=(), buckets=BUCKETS):
+        """
+        Новая гистограмма, зарегистрированная в наборе.
+        """
+        histogram = Histogram(name, help, labelnames, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def register_stats(self, prefix, stats):
+        """
+        Экспорт словаря `stats()` (например, `price_store.stats`) как
+        gauge-метрик `<prefix>_<ключ>`. Вложенные словари экспортируются
+        с меткой `key`.
+
+        :param prefix: Префикс имен метрик;
+        :param stats: Функция без аргументов, возвращающая словарь чисел.
+        """
+        self._stats[prefix] = stats
+
+    def expose(self):
+        """
+        Все метрики в текстовом формате Prometheus.
+        """
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.expose())
+        for prefix, stats in self._stats.items():
+            try:
+                values = stats()
+            except Exception:
+                logger.exception("Stats collection failed for %s", prefix)
+                continue
+            for key, value in values.items():
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                if isinstance(value, dict):
+                    for label, item in sorted(value.items()):
+                        lines.append(f'{name}{{key="{label}"}} {float(item)}')
+                else:
+                    lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Длительность этапов обработчиков: загрузка, модель, отрисовка, отправка
+STAGE_SECONDS = registry.histogram(
+    "bot_stage_seconds", "Duration of handler stages", ("handler", "stage")
+)
+
+# Полное время обработки запроса
+REQUEST_SECONDS = registry.histogram(
+    "bot_request_seconds", "Duration of handler requests", ("handler", "status")
+)
+
+
+def _log(event, **fields):
+    logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False))
+
+
+@contextmanager
+def request(handler, request_id=None, ticker=None):
+    """
+    Контекст обработки одного запроса пользователя: задает id запроса
+    и тикер для всех вложенных `span`, замеряет полное время.
+
+    :param handler: Имя обработчика;
+    :param request_id: Id запроса (по умолчанию случайный);
+    :param ticker: Акция, если известна.
+    """
+    context = {
+        "handler": handler,
+        "request_id": request_id or uuid.uuid4().hex[:12],
+        "ticker": ticker,
+    }
+    token = _request.set(context)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield context
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _request.reset(token)
+        REQUEST_SECONDS.observe(seconds, handler=handler, status=status)
+        _log("request", **context, status=status, seconds=round(seconds, 6))
+
+
+class Span:
+    """
+    Замер одного этапа; `size` можно задать внутри блока,
+    когда размер данных станет известен.
+    """
+
+    def __init__(self, stage, size=None):
+        self.stage = stage
+        self.size = size
+        self.seconds = None
+
+
+@contextmanager
+def span(stage, size=None):
+    """
+    Замер этапа обработки внутри `request`: длительность попадает
+    в гистограмму `bot_stage_seconds` и в структурный лог.
+
+    :param stage: Имя этапа ("download", "forecast", "render", "upload", ...);
+    :param size: Размер данных этапа (например, число строк).
+    """
+    context = _request.get() or {"handler": "-", "request_id": None, "ticker": None}
+    current = Span(stage, size)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(current.seconds, handler=context["handler"], stage=stage)
+        _log(
+            "span",
+            **context,
+            stage=stage,
+            size=current.size,
+            seconds=round(current.seconds, 6),
+            error=error,
+        )
+
+
+async def metrics_handler(http_request):
+    """
+    Отдает метрики в текстовом формате Prometheus.
+    """
+    return web.Response(text=registry.expose(), content_type="text/plain")
+
+
+def add_routes(app, path="/metrics"):
+    """
+    Подключает `/metrics` к существующему приложению aiohttp (режим вебхука).
+    """
+    app.router.add_get(path, metrics_handler)
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Отдельный HTTP-сервер метрик (режим long polling).
+
+    :return: `web.AppRunner`, который нужно очистить при остановке.
+    """
+    app = web.Application()
+    add_routes(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Metrics server on %s:%s", host, port)
+    return runner
@@ -0,0 +1,139 @@
+import hashlib
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from config import MODEL_CACHE_BYTES
+
+
+def fingerprint(values):
+    """
+    Хэш значений ряда, по которому сверяются обучающие данные.
+    """
+    return hashlib.blake2b(
+        np.ascontiguousarray(values, dtype="f8").tobytes(), digest_size=16
+    ).hexdigest()
+
+
+@dataclass
+class CachedModel:
+    """
+    Обученная модель и сведения о данных, на которых она обучена.
+    """
+
+    model: object
+    # Число наблюдений и хэш обучающего ряда
+    n_obs: int
+    fingerprint: str
+    # Последняя дата обучающего ряда
+    end: pd.Timestamp
+    # Последняя дата ряда на момент подбора порядка модели
+    searched_end: pd.Timestamp
+    size: int
+
+
+class ModelCache:
+    """
+    LRU-кэш обученных моделей с ключом `(тикер, начало ряда, конец ряда)`
+    и ограничением по суммарному размеру сериализованных моделей.
+    """
+
+    def __init__(self, max_bytes=MODEL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        # Готовая модель, дообучение на новых барах, переобучение
+        # с известным порядком и полный подбор порядка
+        self.hits = 0
+        self.updates = 0
+        self.refits = 0
+        self.searches = 0
+        self.evictions = 0
+        # Порядки, оцененные параллельным подбором, и подборы,
+        # остановленные по бюджету времени
+        self.candidates = 0
+        self.search_timeouts = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, ticker, start, end, digest=None):
+        """
+        Модель, обученная ровно на ряде `[start, end]` тикера; найденная
+        модель учитывается как попадание.
+
+        :param digest: `fingerprint` ряда: модель, обученная на других
+         значениях тех же дат, не подходит.
+        """
+        entry = self._entries.get((ticker, start, end))
+        if entry is None or (digest is not None and entry.fingerprint != digest):
+            return None
+        self._entries.move_to_end((ticker, start, end))
+        self.hits += 1
+        return entry
+
+    def latest(self, ticker, start, end):
+        """
+        Самая свежая модель тикера с тем же началом ряда,
+        обученная на данных не позже `end`.
+        """
+        keys = [
+            key
+            for key in self._entries
+            if key[0] == ticker and key[1] == start and key[2] <= end
+        ]
+        if not keys:
+            return None
+        key = max(keys, key=lambda key: key[2])
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, ticker, start, model, series, searched_end):
+        """
+        Сохраняет модель, вытесняя давно не использованные
+        при превышении бюджета памяти.
+
+        :param ticker: Акция;
+        :param start: Начало обучающего ряда;
+        :param model: Обученная модель;
+        :param series: Обучающий ряд;
+        :param searched_end: Конец ряда, на котором подбирался порядок;
+        :return: Запись кэша.
+        """
+        entry = CachedModel(
+            model=model,
+            n_obs=len(series),
+            fingerprint=fingerprint(series.values),
+            end=series.index[-1],
+            searched_end=searched_end,
+            size=len(pickle.dumps(model)),
+        )
+        key = (ticker, start, entry.end)
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key).size
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+        return entry
+
+    def stats(self):
+        """
+        Счетчики использования кэша моделей.
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "updates": self.updates,
+            "refits": self.refits,
+            "searches": self.searches,
+            "evictions": self.evictions,
+            "candidates": self.candidates,
+            "search_timeouts": self.search_timeouts,
+        }
@@ -1,17 +1,36 @@
+import asyncio
+import copy
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
 import pmdarima as pm
 
+from config import (ARIMA_RESEARCH_DAYS, ARIMA_SEARCH, ARIMA_SEARCH_BUDGET,
+                    CPU_WORKERS)
+from executor import cpu_executor, run_cpu
+from model_cache import ModelCache, fingerprint
+from singleflight import SingleFlight
 
-async def arima_model(data, ticker, periods):
+# Обученные модели ARIMA по тикерам
+model_cache = ModelCache()
+
+# Одновременные обучения на одних и тех же данных выполняются один раз
+fit_flights = SingleFlight("fit")
+
+
+def search_model(series):
     """
-    AUTO ARIMA.
+    Подбор порядка AUTO ARIMA (синхронно, для пула вычислений).
 
-    :param data: Спарсенный датафрэйм;
-    :param ticker: Акция для которой предсказываем;
-    :param periods: Горизонт предсказания;
-    :return: Предсказание и доверительный интервал.
+    :param series: Ряд стоимости акции;
+    :return: Обученная модель.
     """
-    model = pm.auto_arima(
-        y=data[ticker],
+    return pm.auto_arima(
+        y=series,
         start_p=0,
         start_q=0,
         d=0,
@@ -22,5 +41,274 @@ async def arima_model(data, ticker, periods):
         max_q=7,
         race=False,
     )
+
+
+# Стартовые порядки `(p, d, q)` пошагового подбора, как в auto_arima
+INITIAL_ORDERS = [(2, 0, 2), (0, 0, 0), (1, 0, 0), (0, 0, 1)]
+
+
+def neighbour_orders(order, max_p=7, max_q=7):
+    """
+    Соседние порядки: `p` и `q` отличаются не больше чем на единицу.
+    """
+    p, d, q = order
+    return [
+        (p + dp, d, q + dq)
+        for dp in (-1, 0, 1)
+        for dq in (-1, 0, 1)
+        if (dp, dq) != (0, 0) and 0 <= p + dp <= max_p and 0 <= q + dq <= max_q
+    ]
+
+
+def fit_order(series, order):
+    """
+    Обучение ARIMA заданного порядка (синхронно, для пула вычислений).
+
+    :param series: Ряд стоимости акции;
+    :param order: Порядок `(p, d, q)`;
+    :return: Обученная модель или None, если обучение не удалось.
+    """
+    try:
+        return pm.ARIMA(order=order, suppress_warnings=True).fit(series)
+    except Exception:
+        return None
+
+
+def _aic(model):
+    return np.nan_to_num(model.aic(), nan=np.inf)
+
+
+@dataclass
+class SearchResult:
+    """
+    Итог параллельного подбора порядка.
+    """
+
+    # Модель с наименьшим AIC среди оцененных
+    model: object
+    # Число оцененных порядков и шагов подбора
+    evaluated: int
+    rounds: int
+    elapsed: float
+    # Подбор остановлен по бюджету времени, а не сошелся
+    timed_out: bool
+
+
+# Обучения порядков, отправленные в пул вычислений и еще не завершенные, -
+# в том числе брошенные подбором после срока: отмена не останавливает уже
+# начатое в пуле обучение, поэтому новые обучения ждут свободного воркера,
+# а не копятся в очереди пула
+_running_fits = set()
+_running_lock = threading.Lock()
+
+
+def running_fits():
+    """
+    Число обучений порядков, выполняющихся в пуле.
+    """
+    with _running_lock:
+        _running_fits.difference_update([f for f in _running_fits if f.done()])
+        return len(_running_fits)
+
+
+async def _wait_free_worker(workers):
+    # Ожидание, пока в пуле выполняется меньше `workers` обучений
+    while True:
+        with _running_lock:
+            running = [f for f in _running_fits if not f.done()]
+            _running_fits.intersection_update(running)
+        if len(running) < workers:
+            return
+        await asyncio.wait(
+            [asyncio.wrap_future(f) for f in running],
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+
+
+async def _fit_orders(series, orders, deadline, workers, fitted):
+    """
+    Параллельное обучение порядков `orders` до срока `deadline`, не больше
+    `workers` обучений в пуле одновременно (с учетом брошенных ранее).
+    Результаты дописываются в `fitted` (порядок -> модель или None);
+    если к сроку нет ни одной модели, ожидается первая успешная.
+    """
+
+    def has_model():
+        return any(model is not None for model in fitted.values())
+
+    async def evaluate(order):
+        await _wait_free_worker(workers)
+        if time.monotonic() >= deadline and has_model():
+            return
+        # Между проверкой свободного воркера и отправкой нет ожиданий,
+        # поэтому корутины не отправят больше `workers` обучений
+        future = cpu_executor().submit(fit_order, series, order)
+        with _running_lock:
+            _running_fits.add(future)
+        fitted[order] = await asyncio.wrap_future(future)
+
+    tasks = [asyncio.ensure_future(evaluate(order)) for order in orders]
+    try:
+        pending = set(tasks)
+        while pending and not (time.monotonic() >= deadline and has_model()):
+            timeout = deadline - time.monotonic()
+            _, pending = await asyncio.wait(
+                pending,
+                timeout=timeout if timeout > 0 else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+    finally:
+        # Ожидающие воркера обучения не запускаются; начатые доработают
+        # в пуле и до завершения считаются в `_running_fits`
+        for task in tasks:
+            task.cancel()
+
+
+async def search_model_parallel(
+    series, budget=ARIMA_SEARCH_BUDGET, workers=CPU_WORKERS, max_p=7, max_q=7
+):
+    """
+    Пошаговый подбор порядка ARIMA, в котором все соседи текущего лучшего
+    порядка обучаются параллельно в пуле вычислений. Подбор идет, пока AIC
+    улучшается и не исчерпан бюджет времени; затем возвращается лучшая
+    из оцененных моделей (хотя бы одна модель дожидается всегда).
+
+    :param series: Ряд стоимости акции;
+    :param budget: Бюджет времени, секунд;
+    :param workers: Сколько порядков обучается одновременно;
+    :param max_p: Максимальный порядок авторегрессии;
+    :param max_q: Максимальный порядок скользящего среднего;
+    :return: `SearchResult`.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    fitted = {}
+    best = None
+    rounds = 0
+    timed_out = False
+    orders = INITIAL_ORDERS
+    while orders:
+        if rounds and time.monotonic() >= deadline:
+            timed_out = True
+            break
+        await _fit_orders(series, orders, deadline, workers, fitted)
+        rounds += 1
+        timed_out = any(order not in fitted for order in orders)
+        candidates = [model for model in fitted.values() if model is not None]
+        if not candidates:
+            raise ValueError("No ARIMA order could be fitted")
+        candidate = min(candidates, key=_aic)
+        if best is not None and _aic(candidate) >= _aic(best):
+            break
+        best = candidate
+        orders = [
+            order
+            for order in neighbour_orders(best.order, max_p, max_q)
+            if order not in fitted
+        ]
+
+    return SearchResult(
+        model=best,
+        evaluated=len(fitted),
+        rounds=rounds,
+        elapsed=time.monotonic() - started,
+        timed_out=timed_out,
+    )
+
+
+def refit_model(series, model):
+    """
+    Обучение ARIMA с порядком ранее подобранной модели, без перебора.
+
+    :param series: Ряд стоимости акции;
+    :param model: Модель, порядок которой используется;
+    :return: Обученная модель.
+    """
+    return pm.ARIMA(
+        order=model.order,
+        seasonal_order=model.seasonal_order,
+        with_intercept=model.with_intercept,
+        suppress_warnings=True,
+    ).fit(series)
+
+
+def update_model(model, new_obs):
+    """
+    Дообучение модели на новых наблюдениях (копия, кэш не меняется).
+
+    :param model: Обученная модель;
+    :param new_obs: Новые наблюдения ряда;
+    :return: Обновленная модель.
+    """
+    model = copy.deepcopy(model)
+    model.update(new_obs)
+    return model
+
+
+async def fitted_model(series, ticker):
+    """
+    Обученная на `series` модель: из кэша, дообучением закэшированной
+    модели на новых барах или подбором заново раз в `ARIMA_RESEARCH_DAYS`.
+
+    :param series: Ряд стоимости акции;
+    :param ticker: Акция;
+    :return: Обученная модель.
+    """
+    key = (ticker, series.index[0], series.index[-1], fingerprint(series.values))
+    return await fit_flights.do(key, _fitted_model, series, ticker)
+
+
+async def _fitted_model(series, ticker):
+    start, end = series.index[0], series.index[-1]
+    entry = model_cache.get(ticker, start, end, fingerprint(series.values))
+    if entry is not None:
+        return entry.model
+
+    entry = model_cache.latest(ticker, start, end)
+    if entry is None or end - entry.searched_end >= pd.Timedelta(
+        days=ARIMA_RESEARCH_DAYS
+    ):
+        if ARIMA_SEARCH == "parallel":
+            result = await search_model_parallel(series)
+            model = result.model
+            model_cache.candidates += result.evaluated
+            model_cache.search_timeouts += result.timed_out
+            logging.info(
+                "ARIMA search for %s: %s orders in %s rounds, %.2fs, best %s",
+                ticker,
+                result.evaluated,
+                result.rounds,
+                result.elapsed,
+                model.order,
+            )
+        else:
+            model = await run_cpu(search_model, series)
+        searched_end = end
+        model_cache.searches += 1
+    elif fingerprint(series.values[: entry.n_obs]) == entry.fingerprint:
+        # Старые бары не изменились - достаточно дообучить на новых
+        model = await run_cpu(update_model, entry.model, series.iloc[entry.n_obs :])
+        searched_end = entry.searched_end
+        model_cache.updates += 1
+    else:
+        # Изменились уже учтенные бары (например, незакрытый текущий день)
+        model = await run_cpu(refit_model, series, entry.model)
+        searched_end = entry.searched_end
+        model_cache.refits += 1
+
+    model_cache.put(ticker, start, model, series, searched_end)
+    return model
+
+
+async def arima_model(data, ticker, periods):
+    """
+    AUTO ARIMA.
+
+    :param data: Спарсенный датафрэйм;
+    :param ticker: Акция для которой предсказываем;
+    :param periods: Горизонт предсказания;
+    :return: Предсказание и доверительный интервал.
+    """
+    model = await fitted_model(data[ticker], ticker)
     predict, conf = model.predict(n_periods=periods, return_conf_int=True)
-    return predict, conf
+    return pd.Series(np.asarray(predict)), conf
@@ -1,8 +1,62 @@
-import io
-
-import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import numpy as np
 import plotly.graph_objects as go
 from aiogram.types import BufferedInputFile
+from matplotlib.collections import LineCollection, PolyCollection
+
+from chart_cache import ChartCache, chart_key
+from config import CANDLE_BACKEND
+from executor import run_cpu
+from render import figure_pool, to_png
+from singleflight import SingleFlight
+
+# Готовые изображения графиков
+chart_cache = ChartCache()
+
+# Одновременная отрисовка одного и того же графика выполняется один раз
+chart_flights = SingleFlight("chart")
+
+
+async def render_cached(kind, ticker, data, render, *args):
+    """
+    Отрисовка графика в пуле вычислений с кэшированием результата.
+
+    :param kind: Тип графика;
+    :param ticker: Акция (или None, если она не известна);
+    :param data: Данные, от которых зависит изображение;
+    :param render: Синхронная функция отрисовки;
+    :param args: Аргументы `render`;
+    :return: Байты PNG изображения.
+    """
+    key = chart_key(kind, ticker, data)
+    img_bytes = chart_cache.get(key)
+    if img_bytes is None:
+        img_bytes = await chart_flights.do(key, _render, key, render, *args)
+    return img_bytes
+
+
+async def _render(key, render, *args):
+    img_bytes = await run_cpu(render, *args)
+    chart_cache.put(key, img_bytes)
+    return img_bytes
+
+
+def render_history(stock_history, tickers):
+    """
+    Отрисовка исторических данных в PNG (синхронно, для пула вычислений).
+
+    :param stock_history: Данные из функции `pre_processing/data_loader`;
+    :param tickers: Акция
+    :return: Байты PNG изображения
+    """
+    # Create the graph
+    with figure_pool.figure(figsize=(12, 5)) as fig:
+        ax = fig.subplots()
+        ax.plot(stock_history[tickers])
+        ax.set_title(f"{tickers[0]} Исторические данные стоимости")
+        ax.set_xlabel("Дата")
+        ax.set_ylabel("Стоимость")
+        return to_png(fig)
 
 
 async def plot_history(stock_history, tickers):
@@ -13,20 +67,48 @@ async def plot_history(stock_history, tickers):
     :param tickers: Акция
     :return: Изображение BufferedInputFile сохраненное в буфере
     """
-    # Create the graph
-    plt.figure(figsize=(12, 5))
-    plt.plot(stock_history[tickers])
-    plt.title(f"{tickers[0]} Исторические данные стоимости")
-    plt.xlabel("Дата")
-    plt.ylabel("Стоимость")
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    file = BufferedInputFile(buf.read(), filename="stock_price_history.png")
+    img_bytes = await render_cached(
+        "history",
+        tickers[0],
+        stock_history[tickers],
+        render_history,
+        stock_history,
+        tickers,
+    )
+    file = BufferedInputFile(img_bytes, filename="stock_price_history.png")
     return file
 
 
+def render_predict(data):
+    """
+    Отрисовка предсказания в PNG (синхронно, для пула вычислений).
+
+    :param data: Подготовленные данные для визуализации см.
+     `post_processing.py: get_data_for_plot`
+    :return: Байты PNG изображения
+    """
+    with figure_pool.figure() as fig:
+        ax = fig.subplots()
+        ax.plot(data[["history", "prediction"]])
+        ax.fill_between(
+            x=data.index,
+            y1=data["left_int"],
+            y2=data["right_int"],
+            color="b",
+            alpha=0.1,
+        )
+        ax.legend(["history", "prediction"])
+        ax.set_xlabel("Дата")
+        # Число делений не зависит от числа точек
+        locator = mdates.AutoDateLocator(maxticks=12)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
+        ax.tick_params(axis="x", labelrotation=90, labelsize=6)
+        ax.set_ylabel("Стоимость")
+        ax.set_title("Прогноз")
+        return to_png(fig)
+
+
 async def plot_predict(data):
     """
     Простая визуализация предсказания
@@ -34,30 +116,25 @@ async def plot_predict(data):
      `post_processing.py: get_data_for_plot`
     :return: Изображение BufferedInputFile сохраненное в буфере
     """
-    plt.figure()
-    plt.plot(data[["history", "prediction"]])
-    plt.fill_between(
-        x=data.index, y1=data["left_int"], y2=data["right_int"], color="b", alpha=0.1
-    )
-    plt.legend(["history", "prediction"])
-    plt.xlabel("Дата")
-    plt.xticks(rotation=90)
-    plt.ylabel("Стоимость")
-    plt.tick_params(axis="x", labelsize=6)
-    plt.title("Прогноз")
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plot = BufferedInputFile(buf.read(), filename="predict_price.png")
+    img_bytes = await render_cached("predict", None, data, render_predict, data)
+    plot = BufferedInputFile(img_bytes, filename="predict_price.png")
     return plot
 
 
-# Визуализация с помощью библиотеки plotly среднемесячной цены криптовалют
+# Визуализация с помощью библиотеки plotly средней цены криптовалют по периодам
 
+# Подписи графика для частот группировки `pre_processing.data_grp`
+AVG_TITLES = {
+    "W": ("Динамика средненедельной стоимости по периоду ", "Неделя"),
+    "M": ("Динамика среднемесячной стоимости по периоду ", "Месяц - год"),
+    "Q": ("Динамика среднеквартальной стоимости по периоду ", "Квартал"),
+    "Y": ("Динамика среднегодовой стоимости по периоду ", "Год"),
+}
 
-async def viz_avg(df_grp, tickers):
 
+def render_avg(df_grp, tickers, freq="M"):
+
+    title, xaxis_title = AVG_TITLES[freq]
     fig = go.Figure()
 
     fig.add_trace(
@@ -70,24 +147,83 @@ async def viz_avg(df_grp, tickers):
     )
 
     fig.update_layout(
-        title="Динамика среднемесячной стоимости по периоду " + tickers[0],
-        xaxis_title="Месяц - год",
+        title=title + tickers[0],
+        xaxis_title=xaxis_title,
         yaxis_title="Стоимость , USD",
         xaxis_tickangle=-45,
     )
 
-    img_bytes = fig.to_image(format="png")
+    return fig.to_image(format="png")
+
+
+async def viz_avg(df_grp, tickers, freq="M"):
+
+    img_bytes = await render_cached(
+        f"avg-{freq}", tickers[0], df_grp, render_avg, df_grp, tickers, freq
+    )
 
     file = BufferedInputFile(img_bytes, filename="avg_price.png")
 
     return file
 
 
-# Визуализация данных стоимости криптовалют в виде свечей с помощью библиоткеи plotly
+# Визуализация данных стоимости криптовалют в виде свечей
 
+# Цвета растущей и падающей свечи, как в plotly
+INCREASING_COLOR = "#3D9970"
+DECREASING_COLOR = "#FF4136"
 
-async def viz_candle(all_data):
 
+def render_candle_agg(all_data):
+    """
+    Свечной график средствами matplotlib/Agg: тени и тела свечей
+    рисуются двумя коллекциями, без отдельного объекта на каждую свечу.
+
+    :param all_data: Данные OHLC из функции `pre_processing/data_all`;
+    :return: Байты PNG изображения
+    """
+    x = mdates.date2num(all_data.index.to_pydatetime())
+    open_, high, low, close = (
+        all_data[column].to_numpy(dtype="f8")
+        for column in ["Open", "High", "Low", "Close"]
+    )
+    colors = np.where(close >= open_, INCREASING_COLOR, DECREASING_COLOR)
+    # Ширина тела - 60% от типичного шага между барами
+    width = 0.6 * (np.median(np.diff(x)) if len(x) > 1 else 1.0)
+
+    wicks = np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1)
+    bottom, top = np.minimum(open_, close), np.maximum(open_, close)
+    left, right = x - width / 2, x + width / 2
+    bodies = np.stack(
+        [
+            np.column_stack([left, bottom]),
+            np.column_stack([left, top]),
+            np.column_stack([right, top]),
+            np.column_stack([right, bottom]),
+        ],
+        axis=1,
+    )
+
+    with figure_pool.figure(figsize=(12, 5)) as fig:
+        ax = fig.subplots()
+        ax.add_collection(LineCollection(wicks, colors=colors, linewidths=1))
+        ax.add_collection(PolyCollection(bodies, facecolors=colors, edgecolors=colors))
+        ax.autoscale_view()
+        ax.xaxis_date()
+        ax.set_xlabel("Дата")
+        ax.set_ylabel("Стоимость")
+        ax.grid(alpha=0.3)
+        return to_png(fig)
+
+
+def render_candle_kaleido(all_data):
+    """
+    Свечной график plotly с экспортом через kaleido. Процесс kaleido
+    запускается при первом экспорте и дальше переиспользуется воркером.
+
+    :param all_data: Данные OHLC из функции `pre_processing/data_all`;
+    :return: Байты PNG изображения
+    """
     fig = go.Figure(
         data=[
             go.Candlestick(
@@ -99,8 +235,27 @@ async def viz_candle(all_data):
             )
         ]
     )
-    fig.show()
+    return fig.to_image(format="png")
+
+
+# Способы отрисовки свечного графика, выбираются через `CANDLE_BACKEND`
+CANDLE_RENDERERS = {
+    "agg": render_candle_agg,
+    "kaleido": render_candle_kaleido,
+}
 
-    img_bytes = fig.to_image(format="png")
+
+async def viz_candle(all_data, backend=CANDLE_BACKEND):
+    """
+    Визуализация стоимости в виде свечного графика.
+
+    :param all_data: Данные OHLC из функции `pre_processing/data_all`;
+    :param backend: Способ отрисовки из `CANDLE_RENDERERS`;
+    :return: Изображение BufferedInputFile сохраненное в буфере
+    """
+    render = CANDLE_RENDERERS[backend]
+    img_bytes = await render_cached(
+        f"candle-{backend}", None, all_data, render, all_data
+    )
     file = BufferedInputFile(img_bytes, filename="candle_price.png")
     return file
@@ -1,5 +1,4 @@
-from datetime import timedelta
-
+import numpy as np
 import pandas as pd
 
 
@@ -12,16 +11,21 @@ async def post_processing_data(model_predict, end_date, periods, conf):
      строится предсказание;
     :param periods: Горизонт предказания;
     :param conf: Доверительный интервал предсказания;
-    :return: Таблица с предсказанием.
+    :return: Таблица с предсказанием и индексом дат 'Date'.
     """
-    add_dates = [
-        (end_date + timedelta(day)).strftime("%Y-%m-%d") for day in range(periods)
-    ]
+    # Даты прогноза - целые дни, начиная с дня `end_date`
+    add_dates = pd.date_range(
+        pd.Timestamp(end_date).normalize(), periods=periods, freq="D", name="Date"
+    )
+    conf = np.asarray(conf, dtype="f8")
     predict_df = pd.DataFrame(
-        model_predict.values, columns=["prediction"], index=add_dates
+        {
+            "prediction": np.asarray(model_predict, dtype="f8"),
+            "left_int": conf[:, 0],
+            "right_int": conf[:, 1],
+        },
+        index=add_dates,
     )
-    predict_df["left_int"] = conf.T[0]
-    predict_df["right_int"] = conf.T[1]
     return predict_df
 
 
@@ -40,11 +44,12 @@ async def get_data_for_plot(data, back_days, ticker_predict, predict_df):
     :return: Составленная таблица с предыдущими значениями
      и предсказанными + доверительный инетрвал.
     """
+    # Пропуски - NaN, чтобы все столбцы оставались числовыми
     prev_data = data[-back_days:]
-    prev_data = prev_data.assign(prediction=pd.NA, left_int=pd.NA, right_int=pd.NA)
+    prev_data = prev_data.assign(prediction=np.nan, left_int=np.nan, right_int=np.nan)
     prev_data = prev_data.rename(columns={ticker_predict: "history"})
     prev_data = prev_data[["prediction", "left_int", "right_int", "history"]]
-    prev_data.index = prev_data.index.strftime("%Y-%m-%d")
+    # Индекс остается DatetimeIndex, даты форматируются только на оси графика
     concat_data = pd.concat([prev_data, predict_df])
 
     return concat_data
@@ -1,42 +1,169 @@
+import numpy as np
 import pandas as pd
-import yfinance as yf
 
+from executor import run_io
+from market_data import DAILY, parse_interval
+from price_store import day_range, price_store
+from singleflight import SingleFlight
 
-async def data_loader(start_date, end_date, tickers, col_value):
+# Одновременные одинаковые загрузки выполняются один раз
+data_flights = SingleFlight("data")
+
+
+async def data_loader(start_date, end_date, tickers, col_value, interval=DAILY):
     """
-    Загрузка данных с yfinance.
+    Загрузка данных с yfinance через локальное хранилище `price_store`.
+    Недостающие даты всех тикеров докачиваются пакетно.
 
     :param start_date: Время начала рассмотрения данных;
     :param end_date: Время окончания рассмотрения данных;
     :param tickers: Акции для загрузки;
     :param col_value: Колонка для парсинга с yfinance;
+    :param interval: Интервал баров из `market_data.INTERVALS`
+     (внутридневные цены - float32);
     :return: Таблица загруженных данных со столбцом 'col_value'.
     """
+    # Хранилище читает целые дни, поэтому и ключ - диапазон дней
+    key = (
+        "data_loader",
+        day_range(start_date, end_date),
+        tuple(tickers),
+        col_value,
+        interval,
+    )
+    return await data_flights.do(
+        key, _data_loader, start_date, end_date, tickers, col_value, interval
+    )
 
-    data = pd.DataFrame(columns=tickers)
-    for ticker in tickers:
-        data[ticker] = yf.download(ticker, start_date, end_date)[col_value]
+
+async def _data_loader(start_date, end_date, tickers, col_value, interval):
+    stocks = await run_io(price_store.get_many, tickers, start_date, end_date, interval)
+    columns = {ticker: stocks[ticker][col_value] for ticker in tickers}
+    data = pd.DataFrame(columns, columns=tickers)
+    if tickers:
+        # Индекс по первому тикеру, как при поочередном заполнении колонок
+        data = data.reindex(columns[tickers[0]].index)
     return data
 
 
-async def data_all(start_date, end_date, tickers):
+async def data_all(start_date, end_date, tickers, interval=DAILY):
     """
     Функция выгрузки данных в нужном формате с yfinance
     """
-    df = pd.DataFrame(yf.download(tickers[0], start=start_date, end=end_date))
+    key = ("data_all", day_range(start_date, end_date), tickers[0], interval)
+    return await data_flights.do(
+        key, _data_all, start_date, end_date, tickers, interval
+    )
+
+
+async def _data_all(start_date, end_date, tickers, interval):
+    df = pd.DataFrame(
+        await run_io(price_store.get, tickers[0], start_date, end_date, interval)
+    )
     return df
 
 
-async def data_grp(data, tickers):
+# Агрегация колонок OHLCV при укрупнении баров: первое значение, максимум,
+# минимум, последнее или сумма; остальные колонки (цены тикеров из
+# `data_loader`) берутся на закрытии
+CANDLE_AGGREGATIONS = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Adj Close": "last",
+    "Volume": "sum",
+}
+
+
+async def data_candles(data, interval):
     """
-    Функция группировки данных по дате и средней стоимости
+    Укрупнение баров до свечей `interval` за один проход по массивам
+    (без groupby): границы свечей находятся по смене номера свечи,
+    а максимум, минимум и сумма считаются через `ufunc.reduceat`.
+    Тип колонок сохраняется, так что float32 остается float32.
+
+    :param data: Бары из `data_all` или `data_loader`, отсортированные по времени;
+    :param interval: Размер свечи, например "5m", "4h" или "1d";
+     свечи выровнены по началу эпохи (UTC);
+    :return: Таблица свечей с индексом 'Date' (начало свечи).
     """
-    data = data.reset_index()
-    df_grp = (
-        data.groupby(data["Date"].dt.strftime("%B %Y"))[tickers[0]].mean().reset_index()
-    )
-    df_grp["Date"] = pd.to_datetime(
-        df_grp["Date"], format="%B %Y"
-    )  # Преобразование столбца Date в формат даты
-    df_grp = df_grp.sort_values(by="Date")  # Сортировка по столбцу Date
-    return df_grp
+    delta = parse_interval(interval).value
+    if data.empty:
+        return data.copy()
+
+    # Номер свечи каждого бара и первые бары каждой свечи
+    buckets = data.index.values.astype("M8[ns]").view("i8") // delta
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    lasts = np.r_[starts[1:], len(buckets)] - 1
+
+    candles = {}
+    for name in data.columns:
+        values = data[name].to_numpy()
+        how = CANDLE_AGGREGATIONS.get(name, "last")
+        if how == "first":
+            candles[name] = values[starts]
+        elif how == "last":
+            candles[name] = values[lasts]
+        elif how == "max":
+            candles[name] = np.maximum.reduceat(values, starts)
+        elif how == "min":
+            candles[name] = np.minimum.reduceat(values, starts)
+        else:
+            candles[name] = np.add.reduceat(values, starts)
+
+    index = pd.DatetimeIndex((buckets[starts] * delta).view("M8[ns]"), name="Date")
+    return pd.DataFrame(candles, index=index, columns=data.columns)
+
+
+# Частота группировки -> правило resample (метка - начало периода)
+FREQUENCIES = {
+    "W": "W-MON",
+    "M": "MS",
+    "Q": "QS",
+    "Y": "YS",
+}
+
+# Поддерживаемые агрегации
+AGGREGATIONS = ("mean", "last", "ohlc", "vwap")
+
+
+async def data_grp(data, tickers, freq="M", how="mean", volume=None):
+    """
+    Группировка данных по календарным периодам.
+
+    :param data: Данные из функции `data_loader`;
+    :param tickers: Акции, по которым считаются агрегаты;
+    :param freq: Период: "W" - неделя, "M" - месяц, "Q" - квартал, "Y" - год;
+    :param how: Агрегация: "mean", "last", "ohlc" или "vwap"
+     (средняя цена, взвешенная по объему);
+    :param volume: Объемы торгов той же формы, что и `data` (для "vwap");
+    :return: Таблица со столбцом 'Date' (начало периода) и агрегатами по
+     каждому тикеру; для "ohlc" столбцы вида 'BTC-USD open'.
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(
+            f"Unknown frequency {freq!r}, expected one of {list(FREQUENCIES)}"
+        )
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {how!r}, expected one of {AGGREGATIONS}")
+
+    prices = data[tickers]
+    # Недели начинаются с понедельника, как и их метка
+    resample = {"rule": FREQUENCIES[freq], "label": "left", "closed": "left"}
+
+    if how == "vwap":
+        if volume is None:
+            raise ValueError("Aggregation 'vwap' requires volume")
+        volume = volume[tickers]
+        weighted = (prices * volume).resample(**resample).sum(min_count=1)
+        df_grp = weighted / volume.resample(**resample).sum(min_count=1)
+    elif how == "ohlc":
+        df_grp = prices.resample(**resample).ohlc()
+        df_grp.columns = [f"{ticker} {field}" for ticker, field in df_grp.columns]
+    else:
+        df_grp = prices.resample(**resample).agg(how)
+
+    # Периоды без торгов не показываем
+    df_grp = df_grp.dropna(how="all")
+    return df_grp.rename_axis("Date").reset_index()
@@ -0,0 +1,372 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import PRICE_STORE_DIR, PRICE_STORE_TTL
+from locks import file_lock
+from market_data import (COLUMNS, DAILY, create_market_data, empty_frame,
+                         parse_interval)
+
+# Ссылка на текущую версию данных тикера и префикс каталогов версий
+CURRENT = "current"
+VERSION_PREFIX = "version-"
+# Попытки чтения версии, удаленной писателем во время чтения
+READ_ATTEMPTS = 3
+
+
+def day_range(start_date, end_date):
+    """
+    Приводит границы запроса к целым дням: начало округляется вниз,
+    конец - вверх (конец не включается, как и в yfinance).
+    """
+    start = pd.Timestamp(start_date).floor("D")
+    end = pd.Timestamp(end_date).ceil("D")
+    return start, end
+
+
+def price_dtype(interval):
+    """
+    Тип цен в хранилище: дневные бары - float64, внутридневные - float32
+    (их в сотни раз больше, а семи значащих цифр цене хватает).
+    """
+    return "f8" if interval == DAILY else "f4"
+
+
+class PriceStore:
+    """
+    Локальное колоночное хранилище котировок OHLCV.
+
+    Для каждого тикера и интервала баров каждая колонка лежит в отдельном
+    `.npy` файле и читается через memory-map, а в `meta.json` хранится
+    непрерывный диапазон дат, уже загруженный с провайдера. При запросе
+    докачиваются только недостающие слева и справа куски диапазона.
+    Время баров хранится как int64 (наносекунды), цены - в `price_dtype`.
+
+    Колонки и `meta.json` записываются в новый каталог версии, после чего
+    ссылка `current` атомарно переключается на него: читатели видят либо
+    старую, либо новую версию целиком. Запись идет под блокировкой файла,
+    общей для процессов, а загрузка с провайдера - без блокировок.
+    """
+
+    def __init__(self, root, fetch, fetch_many=None, ttl=PRICE_STORE_TTL):
+        """
+        :param root: Каталог хранилища;
+        :param fetch: Функция загрузки `fetch(ticker, start, end, interval)`;
+        :param fetch_many: Пакетная загрузка
+         `fetch_many(tickers, start, end, interval)`,
+         при None тикеры загружаются по одному через `fetch`;
+        :param ttl: Сколько секунд бар текущего дня считается актуальным.
+        """
+        self.root = Path(root)
+        self.fetch = fetch
+        self.fetch_many = fetch_many
+        self.ttl = ttl
+        # Запросы, целиком обслуженные из локальных данных
+        self.hits = 0
+        # Запросы, потребовавшие обращения к провайдеру
+        self.misses = 0
+        # Число обращений к провайдеру и загруженных строк
+        self.fetches = 0
+        self.rows_fetched = 0
+        self._lock = threading.Lock()
+
+    def get(self, ticker, start_date, end_date, interval=DAILY):
+        """
+        Котировки тикера за диапазон дат, при необходимости
+        докачивает недостающие участки.
+
+        :param ticker: Акция;
+        :param start_date: Время начала рассмотрения данных;
+        :param end_date: Время окончания рассмотрения данных (не включительно);
+        :param interval: Интервал баров из `market_data.INTERVALS`;
+        :return: Таблица OHLCV с индексом 'Date'.
+        """
+        return self.get_many([ticker], start_date, end_date, interval)[ticker]
+
+    def get_many(self, tickers, start_date, end_date, interval=DAILY):
+        """
+        Котировки нескольких тикеров за один диапазон дат. Тикеры
+        с одинаковыми недостающими участками докачиваются одним запросом.
+
+        :param tickers: Акции;
+        :param start_date: Время начала рассмотрения данных;
+        :param end_date: Время окончания рассмотрения данных (не включительно);
+        :param interval: Интервал баров из `market_data.INTERVALS`;
+        :return: Словарь `тикер -> таблица OHLCV с индексом 'Date'`.
+        """
+        parse_interval(interval)
+        start, end = day_range(start_date, end_date)
+        metas = {
+            ticker: self._snapshot(ticker, interval, self._read_meta)
+            for ticker in tickers
+        }
+        # Недостающий диапазон -> тикеры, которым он нужен
+        batches = {}
+        for ticker in tickers:
+            missing = self._missing(metas[ticker], start, end)
+            with self._lock:
+                if missing:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            for fetch_range in missing:
+                batches.setdefault(fetch_range, []).append(ticker)
+
+        # Загрузка - без блокировок: запросы других тикеров и чтение
+        # из хранилища ее не ждут
+        fetched = {}
+        for (fetch_start, fetch_end), batch in batches.items():
+            frames = self._fetch_batch(batch, fetch_start, fetch_end, interval)
+            for ticker in batch:
+                fetched.setdefault(ticker, []).append(
+                    (fetch_start, fetch_end, frames.get(ticker))
+                )
+        for ticker, parts in fetched.items():
+            self._fill(ticker, interval, parts)
+
+        return {
+            ticker: self._snapshot(
+                ticker,
+                interval,
+                lambda version: self._read(version, start, end),
+            )
+            for ticker in tickers
+        }
+
+    def stored(self, ticker, interval=DAILY):
+        """
+        Все уже загруженные котировки тикера, без обращения к провайдеру.
+
+        :param ticker: Акция;
+        :param interval: Интервал баров;
+        :return: Таблица OHLCV с индексом 'Date' (пустая, если данных нет).
+        """
+        data = self._snapshot(ticker, interval, self._read_all)
+        return empty_frame() if data is None else data
+
+    def stats(self):
+        """
+        Счетчики попаданий и промахов хранилища.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "fetches": self.fetches,
+            "rows_fetched": self.rows_fetched,
+        }
+
+    def _missing(self, meta, start, end):
+        """
+        Список диапазонов `(start, end)`, которых нет в хранилище.
+        """
+        if meta is None:
+            return [(start, end)]
+
+        now = pd.Timestamp.now()
+        covered_start = pd.Timestamp(meta["start"])
+        covered_end = pd.Timestamp(meta["end"])
+        # Последний бар, загруженный до закрытия его дня, еще менялся:
+        # бар текущего дня перекачивается после истечения ttl, а бар
+        # прошедшего дня - один раз, уже с окончательными ценами
+        age = time.time() - meta["edge_fetched_at"]
+        fetched_at = now - pd.Timedelta(seconds=age)
+        if covered_start <= fetched_at < covered_end:
+            fetched_day = fetched_at.floor("D")
+            if fetched_day < now.floor("D") or age > self.ttl:
+                covered_end = fetched_day
+
+        missing = []
+        if start < covered_start:
+            missing.append((start, covered_start))
+        if end > covered_end:
+            missing.append((covered_end, end))
+        return missing
+
+    def _fetch_batch(self, tickers, start, end, interval):
+        """
+        Загрузка диапазона для группы тикеров: одним запросом,
+        если задан `fetch_many`, иначе по одному.
+        """
+        with self._lock:
+            self.fetches += 1 if self.fetch_many is not None else len(tickers)
+        if self.fetch_many is not None:
+            return self.fetch_many(tickers, start, end, interval)
+        return {ticker: self.fetch(ticker, start, end, interval) for ticker in tickers}
+
+    def _fill(self, ticker, interval, parts):
+        """
+        Дописывает загруженные диапазоны `(start, end, frame)` в хранилище.
+        Покрытие и данные берутся из текущей версии под блокировкой: другой
+        процесс мог дописать их, пока шла загрузка.
+        """
+        parts = [
+            (fetch_start, fetch_end, frame)
+            for fetch_start, fetch_end, frame in parts
+            # Пустой ответ не расширяет покрытие: он может означать
+            # как отсутствие торгов, так и ошибку провайдера
+            if frame is not None and not frame.empty
+        ]
+        if not parts:
+            return
+
+        directory = self._dir(ticker, interval)
+        with file_lock(directory / "write.lock"):
+            current = self._current(ticker, interval)
+            meta = self._read_meta(current) or {
+                "start": None,
+                "end": None,
+                "edge_fetched_at": 0.0,
+            }
+            frames = [self._read_all(current)]
+            for fetch_start, fetch_end, frame in parts:
+                frames.append(frame)
+                if meta["start"] is None or fetch_start < pd.Timestamp(meta["start"]):
+                    meta["start"] = fetch_start.isoformat()
+                if meta["end"] is None or fetch_end >= pd.Timestamp(meta["end"]):
+                    meta["end"] = fetch_end.isoformat()
+                    # Время загрузки последнего бара: по нему `_missing`
+                    # решает, окончательный ли это бар
+                    meta["edge_fetched_at"] = time.time()
+
+            version = Path(tempfile.mkdtemp(prefix=VERSION_PREFIX, dir=directory))
+            self._write(version, interval, pd.concat(frames))
+            self._write_meta(version, meta)
+            self._switch(directory, version)
+        with self._lock:
+            self.rows_fetched += sum(len(frame) for _, _, frame in parts)
+
+    def _dir(self, ticker, interval):
+        directory = self.root / ticker.replace(os.sep, "_")
+        # Дневные бары - в каталоге тикера, внутридневные - в подкаталогах
+        return directory if interval == DAILY else directory / interval
+
+    def _current(self, ticker, interval):
+        """
+        Каталог текущей версии данных тикера или None, если данных нет.
+        """
+        directory = self._dir(ticker, interval)
+        try:
+            return directory / os.readlink(directory / CURRENT)
+        except FileNotFoundError:
+            # Данные, записанные до появления версий, - прямо в каталоге
+            return directory if (directory / "meta.json").exists() else None
+
+    def _snapshot(self, ticker, interval, read):
+        """
+        Чтение `read(каталог версии)` из текущей версии данных тикера.
+        Если писатель удалил версию до того, как ее прочитали, читается
+        новая.
+        """
+        for attempt in range(READ_ATTEMPTS):
+            try:
+                return read(self._current(ticker, interval))
+            except FileNotFoundError:
+                if attempt == READ_ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def _switch(directory, version):
+        """
+        Атомарно переключает ссылку `current` на каталог `version` и удаляет
+        прежние версии. Вызывается под блокировкой записи.
+        """
+        link = directory / f"{CURRENT}.tmp"
+        if os.path.lexists(link):
+            link.unlink()
+        os.symlink(version.name, link)
+        os.replace(link, directory / CURRENT)
+
+        # Читатели старой версии дочитают ее через memory-map или
+        # перечитают новую
+        for old in directory.glob(f"{VERSION_PREFIX}*"):
+            if old != version:
+                shutil.rmtree(old, ignore_errors=True)
+        for name in ["meta.json", "Date.npy"] + [f"{name}.npy" for name in COLUMNS]:
+            (directory / name).unlink(missing_ok=True)
+
+    @staticmethod
+    def _read_meta(version):
+        if version is None:
+            return None
+        with open(version / "meta.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_meta(version, meta):
+        with open(version / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def _load_columns(version, mmap_mode):
+        if version is None:
+            return None
+        return {
+            name: np.load(version / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in ["Date"] + COLUMNS
+        }
+
+    def _read(self, version, start, end):
+        """
+        Срез `[start, end)` из memory-map колонок версии.
+        """
+        columns = self._load_columns(version, mmap_mode="r")
+        if columns is None:
+            return pd.DataFrame(
+                columns=COLUMNS, index=pd.DatetimeIndex([], name="Date")
+            )
+
+        dates = columns["Date"]
+        left = np.searchsorted(dates, start.value, side="left")
+        right = np.searchsorted(dates, end.value, side="left")
+        index = pd.DatetimeIndex(
+            np.array(dates[left:right]).view("M8[ns]"), name="Date"
+        )
+        # Колонки уже скопированы из memory-map, без объединения в один блок
+        return pd.DataFrame(
+            {name: np.array(columns[name][left:right]) for name in COLUMNS},
+            index=index,
+            copy=False,
+        )
+
+    def _read_all(self, version):
+        columns = self._load_columns(version, mmap_mode=None)
+        if columns is None:
+            return None
+        index = pd.DatetimeIndex(columns.pop("Date").view("M8[ns]"), name="Date")
+        return pd.DataFrame(columns, index=index)
+
+    @staticmethod
+    def _write(version, interval, data):
+        """
+        Записывает колонки в каталог новой версии, удаляя дубли по дате
+        (более свежие бары замещают старые).
+        """
+        data = data[~data.index.duplicated(keep="last")].sort_index()
+        columns = {"Date": data.index.values.astype("M8[ns]").view("i8")}
+        for name in COLUMNS:
+            values = data[name].to_numpy()
+            if name == "Volume":
+                columns[name] = np.nan_to_num(values.astype("f8")).astype("i8")
+            else:
+                columns[name] = values.astype(price_dtype(interval))
+
+        for name, values in columns.items():
+            np.save(version / f"{name}.npy", values)
+
+
+# Загрузка котировок с ограничением частоты и повторами
+market_data = create_market_data()
+
+# Общее хранилище, из которого читают `data_loader` и `data_all`
+price_store = PriceStore(
+    PRICE_STORE_DIR, fetch=market_data.fetch, fetch_many=market_data.fetch_many
+)
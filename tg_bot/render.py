@@ -0,0 +1,77 @@
+import io
+import queue
+import threading
+from contextlib import contextmanager
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from config import RENDER_POOL_SIZE
+
+# Размер и разрешение фигуры по умолчанию, как у `plt.figure()`
+DEFAULT_FIGSIZE = (6.4, 4.8)
+DEFAULT_DPI = 100
+
+
+class FigurePool:
+    """
+    Пул переиспользуемых фигур matplotlib без глобального состояния pyplot.
+
+    Фигура выдается в монопольное пользование через `figure()` и после
+    отрисовки очищается и возвращается в пул, поэтому число живых фигур
+    в процессе не превышает `size`, а память на отрисовку постоянна.
+    """
+
+    def __init__(self, size=RENDER_POOL_SIZE):
+        self.size = size
+        self.created = 0
+        self._free = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self.created < self.size:
+                self.created += 1
+                figure = Figure()
+                FigureCanvasAgg(figure)
+                return figure
+        # Все фигуры заняты - ждем освобождения
+        return self._free.get()
+
+    @contextmanager
+    def figure(self, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+        """
+        Чистая фигура заданного размера на время блока `with`.
+
+        :param figsize: Размер фигуры в дюймах;
+        :param dpi: Разрешение;
+        :return: Объект `Figure` с холстом Agg.
+        """
+        figure = self._acquire()
+        figure.set_size_inches(figsize)
+        figure.set_dpi(dpi)
+        try:
+            yield figure
+        finally:
+            figure.clear()
+            self._free.put(figure)
+
+
+def to_png(figure):
+    """
+    Кодирование фигуры в PNG.
+
+    :param figure: Фигура с холстом Agg;
+    :return: Байты PNG изображения.
+    """
+    buf = io.BytesIO()
+    figure.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+# Фигуры процесса отрисовки (у каждого воркера пула свои)
+figure_pool = FigurePool()
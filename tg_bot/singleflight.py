@@ -0,0 +1,60 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов: пока вычисление
+    с ключом `key` не завершилось, все повторные вызовы ждут его же
+    и получают тот же результат (или то же исключение).
+
+    Результат общий для всех ожидающих, поэтому изменять его нельзя.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: Имя набора запросов (для статистики).
+        """
+        self.name = name
+        self._calls = {}
+        # Запущенные вычисления и вызовы, дождавшиеся чужого вычисления
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Результат `func(*args, **kwargs)`, общий для одновременных
+        вызовов с одинаковым ключом.
+
+        :param key: Хешируемый ключ запроса;
+        :param func: Асинхронная функция;
+        :return: Результат вычисления.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        # Отмена одного ожидающего не отменяет вычисление для остальных
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Исключение уже получили ожидающие, если они были
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        """
+        Число запущенных и объединенных вычислений.
+        """
+        total = self.calls + self.shared
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+            "shared_rate": self.shared / total if total else 0.0,
+        }
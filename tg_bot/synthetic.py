@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+
+def make_ohlc(n_days, seed=0, start="2000-01-01", freq="D"):
+    """
+    Синтетические бары OHLCV в формате yfinance (без сети).
+
+    :param n_days: Число баров;
+    :param seed: Зерно генератора;
+    :param start: Первая дата;
+    :param freq: Интервал баров (по умолчанию дневные);
+    :return: Таблица с колонками Open, High, Low, Close, Adj Close, Volume.
+    """
+    rng = np.random.default_rng(seed)
+    # Геометрическое случайное блуждание, как у цены актива
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=n_days)))
+    open_ = close * np.exp(rng.normal(0, 0.01, size=n_days))
+    return pd.DataFrame(
+        {
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + rng.random(n_days) / 100),
+            "Low": np.minimum(open_, close) * (1 - rng.random(n_days) / 100),
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(10**6, 10**8, size=n_days),
+        },
+        index=pd.date_range(start, periods=n_days, freq=freq, name="Date"),
+    )
+
+
+def make_prices(n_days, tickers=("BTC-USD",), seed=0, col_value="Adj Close"):
+    """
+    Таблица цен в формате `pre_processing.data_loader`.
+
+    :param n_days: Число дневных баров;
+    :param tickers: Акции;
+    :param seed: Зерно генератора;
+    :param col_value: Колонка OHLCV, из которой берется цена;
+    :return: Таблица с колонкой на каждый тикер.
+    """
+    return pd.DataFrame(
+        {
+            ticker: make_ohlc(n_days, seed=seed + i)[col_value]
+            for i, ticker in enumerate(tickers)
+        }
+    )
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from alerts import ABOVE, BELOW, AlertBook, AlertLimitError, direction_for
+from app import check_alerts, set_price_alert
+from broadcast import MessageQueue, SendLimiter
+
+
+class TestAlertBook(unittest.TestCase):
+    def setUp(self):
+        self.book = AlertBook(max_per_chat=10)
+
+    def test_triggers_once_on_crossing(self):
+        up = self.book.add(1, "BTC-USD", 50000, ABOVE)
+        down = self.book.add(2, "BTC-USD", 40000, BELOW)
+        self.book.add(3, "ETH-USD", 1000, BELOW)
+
+        self.assertEqual(self.book.check("BTC-USD", 45000), [])
+        self.assertEqual(self.book.check("BTC-USD", 50000), [up])
+        self.assertEqual(self.book.check("BTC-USD", 51000), [])
+        self.assertEqual(self.book.check("BTC-USD", 39000), [down])
+        # Сработавшие ждут доставки сообщения
+        self.assertEqual(len(self.book), 3)
+        self.book.resolve(up.id)
+        self.book.resolve(down.id)
+        self.assertEqual(len(self.book), 1)
+        self.assertEqual(self.book.stats()["triggered"], 2)
+
+    def test_rearm_after_failed_send(self):
+        alert = self.book.add(1, "BTC-USD", 50000, ABOVE)
+        self.assertEqual(self.book.check("BTC-USD", 50000), [alert])
+        self.assertEqual(self.book.check("BTC-USD", 51000), [])
+
+        self.book.rearm(alert.id)
+        self.assertEqual(self.book.check("BTC-USD", 51000), [alert])
+        self.book.resolve(alert.id)
+        self.assertEqual(self.book.check("BTC-USD", 52000), [])
+        self.assertEqual(len(self.book), 0)
+
+    def test_remove_among_equal_levels(self):
+        alerts = [self.book.add(chat, "BTC-USD", 100, ABOVE) for chat in range(3)]
+
+        self.assertIsNone(self.book.remove(alerts[1].id, chat_id=0))
+        self.assertEqual(self.book.remove(alerts[1].id, chat_id=1), alerts[1])
+        self.assertIsNone(self.book.remove(alerts[1].id))
+
+        triggered = self.book.check("BTC-USD", 100)
+        self.assertEqual([alert.chat_id for alert in triggered], [0, 2])
+        self.assertEqual(self.book.for_chat(0), [])
+
+    def test_limit_per_chat(self):
+        for level in range(10):
+            self.book.add(1, "BTC-USD", level, BELOW)
+        with self.assertRaises(AlertLimitError):
+            self.book.add(1, "BTC-USD", 11, BELOW)
+        self.book.add(2, "BTC-USD", 11, BELOW)
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(0)
+        book = AlertBook(max_per_chat=10**6)
+        pending = []
+        for chat in range(2000):
+            level = rng.uniform(90, 110)
+            direction = direction_for(level, 100)
+            pending.append(book.add(chat, "BTC-USD", level, direction))
+
+        price = 100.0
+        for _ in range(500):
+            price += rng.gauss(0, 0.5)
+            expected = [
+                alert
+                for alert in pending
+                if (alert.direction == ABOVE and price >= alert.level)
+                or (alert.direction == BELOW and price <= alert.level)
+            ]
+            pending = [alert for alert in pending if alert not in expected]
+
+            triggered = book.check("BTC-USD", price)
+            self.assertCountEqual([a.id for a in triggered], [a.id for a in expected])
+            for alert in triggered:
+                book.resolve(alert.id)
+        self.assertEqual(len(book), len(pending))
+
+
+class TestSharedAlertBook(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "alerts.json"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_workers_share_alerts(self):
+        # Воркер, проверяющий тики, и воркер, принявший команду
+        checker = AlertBook(path=self.path, sync_interval=0)
+        handler = AlertBook(path=self.path, sync_interval=0)
+        first = handler.add(1, "BTC-USD", 50000, ABOVE)
+        second = checker.add(2, "BTC-USD", 60000, ABOVE)
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(handler.for_chat(2), [second])
+
+        # Проверка тика файл не читает: изменения приносит `sync` (в фоне - `run`)
+        checker.sync()
+        self.assertEqual(checker.check("BTC-USD", 55000), [first])
+        self.assertEqual(handler.remove(second.id, chat_id=2), second)
+        self.assertEqual(checker.check("BTC-USD", 61000), [second])
+        checker.rearm(second.id)
+        checker.sync()
+        self.assertEqual(checker.check("BTC-USD", 61000), [])
+        checker.resolve(first.id)
+        self.assertEqual(len(handler), 1)
+        handler.sync()
+        self.assertEqual(len(handler), 0)
+        self.assertEqual(handler.for_chat(1), [])
+
+    def test_limit_counts_other_workers(self):
+        first = AlertBook(max_per_chat=2, path=self.path)
+        second = AlertBook(max_per_chat=2, path=self.path)
+        first.add(1, "BTC-USD", 1, BELOW)
+        second.add(1, "BTC-USD", 2, BELOW)
+        with self.assertRaises(AlertLimitError):
+            first.add(1, "BTC-USD", 3, BELOW)
+
+    def test_undelivered_alert_survives_restart(self):
+        book = AlertBook(path=self.path, sync_interval=0)
+        alert = book.add(1, "BTC-USD", 50000, ABOVE)
+        self.assertEqual(book.check("BTC-USD", 50000), [alert])
+
+        # Процесс завершился, не отправив сообщение
+        restored = AlertBook(path=self.path, sync_interval=0)
+        self.assertEqual(restored.check("BTC-USD", 50000), [alert])
+        self.assertEqual(restored.add(1, "ETH-USD", 1, BELOW).id, alert.id + 1)
+
+
+    @patch("alerts.COMPACT_SLACK", 5)
+    def test_log_compacted(self):
+        checker = AlertBook(path=self.path, max_per_chat=100)
+        handler = AlertBook(path=self.path, max_per_chat=100)
+        alerts = [handler.add(1, "BTC-USD", 100 + i % 7, ABOVE) for i in range(20)]
+        for alert in alerts[:15]:
+            handler.remove(alert.id)
+        lines = self.path.read_text().splitlines()
+        # Журнал сжат до снимка и нескольких записей после него
+        self.assertLess(len(lines), 10)
+        self.assertGreater(handler.stats()["compactions"], 0)
+
+        # Другой воркер перечитывает сжатый журнал целиком
+        checker.sync()
+        self.assertEqual(checker.alerts, handler.alerts)
+        self.assertEqual(checker.stats()["reloads"], 1)
+        triggered = checker.check("BTC-USD", 1000)
+        self.assertEqual(
+            sorted(alert.id for alert in triggered), [a.id for a in alerts[15:]]
+        )
+        self.assertEqual(handler.add(1, "ETH-USD", 1, BELOW).id, alerts[-1].id + 1)
+
+    def test_reads_file_written_before_log(self):
+        # Раньше файл был одним JSON-объектом без перевода строки
+        self.path.write_text(
+            json.dumps(
+                {"next_id": 8, "alerts": [[7, 1, "BTC-USD", 50000.0, ABOVE]]}
+            )
+        )
+        book = AlertBook(path=self.path)
+        self.assertEqual(len(book), 1)
+        alert = book.add(1, "BTC-USD", 40000, BELOW)
+        self.assertEqual(alert.id, 8)
+
+        restored = AlertBook(path=self.path)
+        self.assertEqual(sorted(restored.alerts), [7, 8])
+        self.assertEqual(self.path.read_text().count("\n"), 2)
+
+
+class TestAlertSync(unittest.IsolatedAsyncioTestCase):
+    async def test_run_picks_up_other_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "alerts.json"
+            checker = AlertBook(path=path, sync_interval=0.01)
+            task = asyncio.create_task(checker.run())
+            self.addCleanup(task.cancel)
+
+            alert = AlertBook(path=path).add(1, "BTC-USD", 50000, ABOVE)
+            async with asyncio.timeout(5):
+                while alert.id not in checker.alerts:
+                    await asyncio.sleep(0.01)
+            self.assertEqual(checker.check("BTC-USD", 50000), [alert])
+
+
+class TestAlertHandlers(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.book = AlertBook()
+        self.bot = AsyncMock()
+        self.queue = MessageQueue(self.bot, SendLimiter(rate=100, chat_rate=100))
+        for name, value in [
+            ("app.alert_book", self.book),
+            ("app.alert_queue", self.queue),
+        ]:
+            patcher = patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_message(self, text):
+        message = MagicMock()
+        message.text = text
+        message.chat.id = 42
+        message.reply = AsyncMock()
+        state = MagicMock()
+        state.get_data = AsyncMock(return_value={"coin": "BTC-USD alert"})
+        state.update_data = AsyncMock()
+        state.set_state = AsyncMock()
+        return message, state
+
+    @patch("app.live_feed")
+    async def test_direction_from_latest_price(self, live_feed):
+        live_feed.latest.return_value = (0, 45000.0)
+        message, state = self.make_message("50000")
+
+        await set_price_alert(message, state)
+
+        (alert,) = self.book.for_chat(42)
+        self.assertEqual(
+            (alert.ticker, alert.level, alert.direction), ("BTC-USD", 50000, ABOVE)
+        )
+        message.reply.assert_awaited_once()
+        self.assertIn("поднимется до 50000", message.reply.call_args.args[0])
+
+    @patch("app.live_feed")
+    async def test_explicit_direction_without_price(self, live_feed):
+        live_feed.latest.return_value = None
+        message, state = self.make_message("50000")
+        await set_price_alert(message, state)
+        self.assertEqual(len(self.book), 0)
+
+        message, state = self.make_message("< 30000,5")
+        await set_price_alert(message, state)
+        (alert,) = self.book.for_chat(42)
+        self.assertEqual((alert.level, alert.direction), (30000.5, BELOW))
+
+    async def test_tick_sends_notification(self):
+        self.book.add(42, "BTC-USD", 50000, ABOVE)
+        task = asyncio.create_task(self.queue.run())
+        self.addCleanup(task.cancel)
+
+        check_alerts("BTC-USD", 0, 50100.0)
+        await self.queue.queue.join()
+
+        self.bot.send_message.assert_awaited_once()
+        chat_id, text = self.bot.send_message.call_args.args
+        self.assertEqual(chat_id, 42)
+        self.assertIn("BTC-USD поднялся до 50000", text)
+        self.assertEqual(len(self.book), 0)
+
+    async def test_failed_notification_rearms_alert(self):
+        alert = self.book.add(42, "BTC-USD", 50000, ABOVE)
+        self.bot.send_message.side_effect = [ConnectionError("down"), None]
+        task = asyncio.create_task(self.queue.run())
+        self.addCleanup(task.cancel)
+
+        check_alerts("BTC-USD", 0, 50100.0)
+        await self.queue.queue.join()
+        self.assertEqual(self.book.for_chat(42), [alert])
+        self.assertEqual(self.queue.stats()["failed"], 1)
+
+        check_alerts("BTC-USD", 0, 50200.0)
+        await self.queue.queue.join()
+        self.assertEqual(len(self.book), 0)
+        self.assertEqual(self.bot.send_message.await_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
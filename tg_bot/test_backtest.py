@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from backtest import backtest, summarize, walk_forward_origins
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def make_series(n_days, slope=1.0):
+    index = pd.date_range("2023-01-01", periods=n_days, name="Date")
+    return pd.Series(100 + slope * np.arange(n_days, dtype="f8"), index=index)
+
+
+class TestWalkForwardOrigins(unittest.TestCase):
+    def test_windows_fit_history(self):
+        self.assertEqual(walk_forward_origins(100, 60, 10), [60, 70, 80, 90])
+        self.assertEqual(walk_forward_origins(100, 60, 10, step=15), [60, 75, 90])
+        self.assertEqual(walk_forward_origins(100, 60, 10, windows=2), [80, 90])
+        self.assertEqual(walk_forward_origins(50, 60, 10), [])
+
+
+@patch("backtest.run_cpu", new=run_inline)
+class TestBacktest(unittest.IsolatedAsyncioTestCase):
+    async def test_forecast_dates_align_with_actuals(self):
+        # Прямая с дрейфом прогнозируется точно, только если даты прогноза
+        # совпадают с датами факта
+        series = make_series(120)
+        results = await backtest(series, "drift", train=60, horizon=10)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0].origin, series.index[60])
+        for result in results:
+            self.assertAlmostEqual(result.mae, 0, places=6)
+            self.assertEqual(result.coverage, 100.0)
+            self.assertGreaterEqual(result.fit_seconds, 0)
+
+    async def test_summary(self):
+        rng = np.random.default_rng(0)
+        series = make_series(200) + np.cumsum(rng.normal(size=200))
+        results = await backtest(series, "ets", train=100, horizon=7, windows=4)
+        summary = summarize(results)
+
+        self.assertEqual(summary["windows"], 4)
+        self.assertGreater(summary["mae"], 0)
+        self.assertLess(summary["mape"], 10)
+        self.assertTrue(0 <= summary["coverage"] <= 100)
+        self.assertAlmostEqual(
+            summary["fit_seconds_total"], sum(r.fit_seconds for r in results)
+        )
+
+    async def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            await backtest(make_series(100), "prophet")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,7 @@ from unittest.mock import ANY, AsyncMock, MagicMock, call, patch
 
 from aiogram import types
 
-from app import (get_callback, get_feedback, get_find_ticker,
+from app import (get_avg_freq, get_callback, get_feedback, get_find_ticker,
                  get_find_ticker_01, get_find_ticker_02,
                  get_find_ticker_predict, get_name_ticker, get_name_ticker_01,
                  get_name_ticker_02, get_name_ticker_predict,
@@ -205,19 +205,64 @@ class TestGetFindTicker01(unittest.IsolatedAsyncioTestCase):
             # Проверяем, что функция update_data была вызвана с ожидаемыми параметрами
             mock_fsm_context.update_data.assert_called_once_with(coin=selected_coin)
 
-            # Проверяем, что функция set_state была вызвана с ожидаемыми параметрами
-            mock_fsm_context.set_state.assert_called_once_with(ANY)
-
             # Проверяем, что функция send_message была вызвана с ожидаемыми параметрами
             expected_calls = [
                 call(callback_instance.from_user.id, f"Вы выбрали {expected_message}."),
                 call(
                     callback_instance.from_user.id,
+                    "Выберите период усреднения:",
+                    reply_markup=ANY,
+                ),
+            ]
+            mock_bot.send_message.assert_has_calls(expected_calls, any_order=False)
+
+
+class TestGetAvgFreq(unittest.IsolatedAsyncioTestCase):
+    @patch("app.bot")
+    async def test_get_avg_freq_handler(self, mock_bot):
+        callback = MagicMock()
+        callback.data = "avg W"
+        callback.from_user.id = 123456789
+        mock_bot.answer_callback_query = AsyncMock()
+        mock_bot.send_message = AsyncMock()
+        state = AsyncMock()
+        state.get_data = AsyncMock(return_value={"coin": "BTC-USD avg"})
+
+        await get_avg_freq(callback, state)
+
+        mock_bot.answer_callback_query.assert_called_once_with(callback.id)
+        state.update_data.assert_called_once_with(freq="W")
+        state.set_state.assert_called_once_with(ANY)
+        mock_bot.send_message.assert_has_calls(
+            [
+                call(123456789, "Период усреднения: неделя."),
+                call(
+                    123456789,
                     "Введите временной интервал для построения графика средней стоимости в формате: "
                     "YYYY-MM-DD YYYY-MM-DD (например, 2023-01-01 2023-12-31):",
                 ),
             ]
-            mock_bot.send_message.assert_has_calls(expected_calls, any_order=False)
+        )
+
+    @patch("app.bot")
+    async def test_get_avg_freq_without_coin(self, mock_bot):
+        # Кнопка периода нажата после построения графика: состояние очищено
+        callback = MagicMock()
+        callback.data = "avg W"
+        callback.from_user.id = 123456789
+        mock_bot.answer_callback_query = AsyncMock()
+        mock_bot.send_message = AsyncMock()
+        state = AsyncMock()
+        state.get_data = AsyncMock(return_value={})
+
+        await get_avg_freq(callback, state)
+
+        mock_bot.send_message.assert_called_once_with(
+            123456789, "Сначала выберите монету."
+        )
+        state.update_data.assert_not_called()
+        state.set_state.assert_not_called()
+
 
 
 class TestSendCryptoAvg(unittest.IsolatedAsyncioTestCase):
@@ -252,6 +297,55 @@ class TestSendCryptoAvg(unittest.IsolatedAsyncioTestCase):
         except Exception as e:
             print(f"An exception occurred: {e}")
 
+    @patch("app.file_id_cache")
+    @patch("app.viz_avg", new_callable=AsyncMock)
+    @patch("app.data_grp", new_callable=AsyncMock)
+    @patch("app.data_loader", new_callable=AsyncMock)
+    async def test_selected_frequency(
+        self, mock_data_loader, mock_data_grp, mock_viz_avg, mock_file_id_cache
+    ):
+        mock_file_id_cache.send_photo = AsyncMock()
+        state = AsyncMock()
+        state.update_data = AsyncMock(
+            return_value={
+                "coin": "ETH-USD avg",
+                "freq": "Q",
+                "time_ranger": "2023-01-01 2023-12-31",
+            }
+        )
+        message = MagicMock()
+        message.reply = AsyncMock()
+        message.text = "2023-01-01 2023-12-31"
+
+        await send_crypto_avg(message, state)
+
+        # Выбранный период доходит и до группировки, и до графика
+        message.reply.assert_not_called()
+        mock_data_grp.assert_awaited_once_with(
+            mock_data_loader.return_value, ["ETH-USD"], "Q"
+        )
+        mock_viz_avg.assert_awaited_once_with(
+            mock_data_grp.return_value, ["ETH-USD"], "Q"
+        )
+        mock_file_id_cache.send_photo.assert_awaited_once_with(
+            ANY, message.chat.id, mock_viz_avg.return_value
+        )
+
+    @patch("app.data_loader", new_callable=AsyncMock)
+    async def test_missing_coin_is_reported(self, mock_data_loader):
+        state = AsyncMock()
+        state.update_data = AsyncMock(
+            return_value={"time_ranger": "2023-01-01 2023-12-31"}
+        )
+        message = MagicMock()
+        message.reply = AsyncMock()
+        message.text = "2023-01-01 2023-12-31"
+
+        await send_crypto_avg(message, state)
+
+        message.reply.assert_awaited_once_with("An error occurred: 'coin'")
+        mock_data_loader.assert_not_called()
+
     async def test_invalid_time_range_format(self):
         state = AsyncMock()
 
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import BufferedInputFile
+
+from broadcast import (SENT, BroadcastCursor, Broadcaster, DigestItem,
+                       MessageQueue, SendLimiter, SubscriberStore,
+                       seconds_until_digest)
+from fake_telegram import FakeTelegramServer
+
+TOKEN = "123456789:AAH-fake_token_for_tests_0000000000"
+
+
+def digest_items():
+    return [
+        DigestItem(ticker, BufferedInputFile(ticker.encode(), "predict.png"), ticker)
+        for ticker in ["BTC-USD", "ETH-USD"]
+    ]
+
+
+class TestStores(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_subscribers_persist(self):
+        store = SubscriberStore(self.path / "subscribers.json")
+        self.assertTrue(store.add(5))
+        self.assertTrue(store.add(-100))
+        self.assertFalse(store.add(5))
+        self.assertTrue(store.remove(-100))
+        self.assertFalse(store.remove(-100))
+        store.add(2)
+
+        restored = SubscriberStore(self.path / "subscribers.json")
+        self.assertEqual(restored.chats(), [2, 5])
+        self.assertEqual(restored.chats(after=2), [5])
+        self.assertIn(5, restored)
+
+    def test_workers_merge_subscriptions(self):
+        # Каждый воркер создает свое хранилище при запуске
+        first = SubscriberStore(self.path / "subscribers.json")
+        second = SubscriberStore(self.path / "subscribers.json")
+        first.add(1)
+        second.add(2)
+        first.add(3)
+        second.remove(1)
+
+        self.assertEqual(first.chats(), [2, 3])
+        self.assertEqual(len(second), 2)
+        # Счетчик для метрик - на момент последнего обращения к файлу
+        second.add(4)
+        self.assertEqual(second.count, 3)
+        self.assertEqual(first.count, 2)
+
+    def test_cursor_resets_for_new_digest(self):
+        cursor = BroadcastCursor(self.path / "cursor.json")
+        cursor.start("2024-01-01")
+        cursor.advance(10)
+
+        restored = BroadcastCursor(self.path / "cursor.json")
+        restored.start("2024-01-01")
+        self.assertEqual(restored.after, 10)
+        self.assertFalse(restored.finished("2024-01-01"))
+        restored.finish()
+        self.assertTrue(restored.finished("2024-01-01"))
+        # Курсор, созданный раньше (в другом процессе), видит итог рассылки
+        self.assertTrue(cursor.finished("2024-01-01"))
+
+        restored.start("2024-01-02")
+        self.assertIsNone(restored.after)
+        self.assertFalse(restored.finished("2024-01-02"))
+
+    def test_digest_horizon_within_forecast_cache(self):
+        # Прогнозов дальше FORECAST_MAX_HORIZON в кэше нет: такая настройка
+        # отклоняется при запуске, а не в каждой рассылке
+        env = dict(os.environ, DIGEST_HORIZON="45", FORECAST_MAX_HORIZON="30")
+        result = subprocess.run(
+            [sys.executable, "-c", "import config"],
+            cwd=Path(__file__).parent,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("DIGEST_HORIZON=45", result.stderr)
+
+    def test_seconds_until_digest(self):
+        now = datetime(2024, 1, 1, 8, 30, tzinfo=timezone.utc)
+        self.assertEqual(seconds_until_digest(now, 9), 30 * 60)
+        now = datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)
+        self.assertEqual(seconds_until_digest(now, 9), 24 * 60 * 60)
+
+
+class TestSendLimiter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.limiter = SendLimiter(rate=1000, chat_rate=20)
+        # Запросы `(чат, начало, конец)`
+        self.requests = []
+
+    def request(self, chat_id, duration):
+        async def send():
+            start = time.monotonic()
+            await asyncio.sleep(duration)
+            self.requests.append((chat_id, start, time.monotonic()))
+
+        return send
+
+    def gaps(self, chat_id):
+        spans = [(start, end) for chat, start, end in self.requests if chat == chat_id]
+        return [start - end for (_, end), (start, _) in zip(spans, spans[1:])]
+
+    async def test_chat_interval_counts_from_end_of_request(self):
+        # Долгая загрузка файла, затем быстрые отправки по file_id
+        await self.limiter.send(1, self.request(1, 0.1))
+        await self.limiter.send(1, self.request(1, 0))
+        await self.limiter.send(1, self.request(1, 0))
+
+        for gap in self.gaps(1):
+            self.assertGreaterEqual(gap, self.limiter.chat_interval - 0.001)
+
+    async def test_concurrent_requests_to_one_chat_queue(self):
+        results = await asyncio.gather(
+            *[
+                self.limiter.send(1 + i % 2, self.request(1 + i % 2, 0.03 * (i % 3)))
+                for i in range(8)
+            ]
+        )
+
+        self.assertEqual(results, [SENT] * 8)
+        for chat_id in [1, 2]:
+            gaps = self.gaps(chat_id)
+            self.assertEqual(len(gaps), 3)
+            for gap in gaps:
+                self.assertGreaterEqual(gap, self.limiter.chat_interval - 0.001)
+
+    async def test_global_rate_has_headroom(self):
+        self.assertLess(SendLimiter(rate=30).bucket.rate, 30)
+
+
+class TestBroadcaster(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = Path(self.directory.name)
+        # Сервер отвечает 429, если превышены 100 сообщений в секунду
+        # или одно сообщение в чат за 0.05 с; загрузка файла длится 0.1 с,
+        # и отправка по file_id сразу после нее пришла бы раньше лимита чата
+        self.server = await FakeTelegramServer(
+            global_rate=100, chat_interval=0.05, retry_after=1, upload_delay=0.1
+        ).start()
+        self.bot = Bot(
+            TOKEN,
+            session=AiohttpSession(api=TelegramAPIServer.from_base(self.server.url)),
+        )
+        self.subscribers = SubscriberStore(path / "subscribers.json")
+        for chat_id in range(1, 41):
+            self.subscribers.add(chat_id)
+        self.cursor = BroadcastCursor(path / "cursor.json")
+        self.broadcaster = Broadcaster(
+            self.bot,
+            self.subscribers,
+            self.cursor,
+            SendLimiter(rate=60, chat_rate=20),
+            workers=10,
+            save_every=5,
+        )
+
+    async def asyncTearDown(self):
+        await self.bot.session.close()
+        await self.server.stop()
+        self.directory.cleanup()
+
+    async def test_paced_delivery(self):
+        report = await self.broadcaster.run("2024-01-01", digest_items())
+
+        self.assertEqual(report.sent, 80)
+        self.assertEqual(report.failed, 0)
+        # Лимиты соблюдены: сервер ни разу не ответил 429
+        self.assertEqual(self.server.flooded, 0)
+        self.assertEqual(report.retried, 0)
+        # Каждое изображение загружено один раз, дальше - по file_id
+        self.assertEqual(self.server.uploads, 2)
+        chats = [chat_id for _, chat_id, _, _ in self.server.sent]
+        self.assertEqual(sorted(set(chats)), list(range(1, 41)))
+        self.assertTrue(self.cursor.finished("2024-01-01"))
+        self.assertEqual(self.cursor.after, 40)
+        self.assertGreater(report.rate, 0)
+        self.assertEqual(self.broadcaster.stats()["sent"], 80)
+
+        # Те же изображения на следующий день отправляются по file_id
+        report = await self.broadcaster.run("2024-01-02", digest_items())
+        self.assertEqual(report.sent, 80)
+        self.assertEqual(self.server.uploads, 2)
+
+    async def test_retries_after_429(self):
+        self.server.flood_next = 3
+        report = await self.broadcaster.run("2024-01-01", digest_items())
+
+        self.assertEqual(report.retried, 3)
+        self.assertEqual(report.sent, 80)
+        self.assertEqual(report.failed, 0)
+        self.assertGreater(report.flood_wait, 0)
+
+    async def test_gives_up_after_retries(self):
+        self.broadcaster.limiter.retries = 1
+        self.subscribers.remove(1)
+        for chat_id in range(3, 41):
+            self.subscribers.remove(chat_id)
+        self.server.flood_next = 2
+        report = await self.broadcaster.run("2024-01-01", digest_items())
+
+        # Первое сообщение не прошло после повтора, остальные отправлены
+        self.assertEqual(report.failed, 1)
+        self.assertEqual(report.sent, 1)
+
+    async def test_blocked_chat_unsubscribed(self):
+        self.server.blocked.add(7)
+        report = await self.broadcaster.run("2024-01-01", digest_items())
+
+        self.assertEqual(report.blocked, 1)
+        self.assertEqual(report.sent, 78)
+        self.assertNotIn(7, self.subscribers)
+        self.assertEqual(self.broadcaster.stats()["subscribers"], 39)
+
+    async def test_resumes_from_cursor(self):
+        self.cursor.start("2024-01-01")
+        self.cursor.advance(30)
+        report = await self.broadcaster.run("2024-01-01", digest_items())
+
+        self.assertEqual(report.chats, 10)
+        chats = {chat_id for _, chat_id, _, _ in self.server.sent}
+        self.assertEqual(chats, set(range(31, 41)))
+
+        # Завершенный дайджест не рассылается повторно при новом запуске
+        # на следующий день курсор начинается заново
+        report = await self.broadcaster.run("2024-01-02", digest_items())
+        self.assertEqual(report.chats, 40)
+
+    async def test_message_queue_shares_limits(self):
+        # Уведомления в один чат идут не чаще лимита чата, а после 429
+        # повторяются
+        queue = MessageQueue(self.bot, self.broadcaster.limiter, workers=5)
+        task = asyncio.create_task(queue.run())
+        self.addCleanup(task.cancel)
+        results = []
+        self.server.flood_next = 1
+        for i in range(6):
+            queue.put(1 + i % 2, f"alert {i}", results.append)
+        await queue.queue.join()
+
+        self.assertEqual(results, [SENT] * 6)
+        self.assertEqual(len(self.server.sent), 6)
+        self.assertEqual(self.broadcaster.limiter.retried, 1)
+        self.assertEqual(queue.stats()["sent"], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+import plots
+from chart_cache import ChartCache, chart_key
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def make_data(shift=0.0):
+    index = pd.date_range("2023-01-01", periods=10, name="Date")
+    return pd.DataFrame({"BTC-USD": [float(i) + shift for i in range(10)]}, index=index)
+
+
+class TestChartCache(unittest.IsolatedAsyncioTestCase):
+    def test_key_depends_on_data(self):
+        self.assertEqual(
+            chart_key("history", "BTC-USD", make_data()),
+            chart_key("history", "BTC-USD", make_data()),
+        )
+        self.assertNotEqual(
+            chart_key("history", "BTC-USD", make_data()),
+            chart_key("history", "BTC-USD", make_data(shift=1.0)),
+        )
+
+    def test_lru_eviction_by_bytes(self):
+        cache = ChartCache(max_bytes=10)
+        cache.put("a", b"12345")
+        cache.put("b", b"12345")
+        cache.get("a")
+        cache.put("c", b"12345")
+
+        # Вытеснено изображение, которое дольше всего не запрашивали
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"12345")
+        self.assertEqual(cache.bytes, 10)
+        self.assertEqual(cache.stats()["bytes_saved"], 10)
+
+    @patch("plots.run_cpu", new=run_inline)
+    async def test_repeat_chart_is_not_rendered_again(self):
+        render = MagicMock(return_value=b"png")
+        with patch("plots.chart_cache", ChartCache()) as cache:
+            for _ in range(3):
+                img_bytes = await plots.render_cached(
+                    "history", "BTC-USD", make_data(), render, make_data()
+                )
+
+        self.assertEqual(img_bytes, b"png")
+        render.assert_called_once()
+        self.assertEqual(cache.stats()["hits"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+import engines
+from engines import FORECASTERS, LatencyTracker, select_engine
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def make_data(n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-01", periods=n_days, name="Date")
+    return pd.DataFrame(
+        {"BTC-USD": 100 + np.cumsum(rng.normal(0.1, 1, size=n_days))}, index=index
+    )
+
+
+class TestForecasters(unittest.TestCase):
+    def test_common_interface(self):
+        values = make_data(300)["BTC-USD"].to_numpy()
+        for name, forecaster in FORECASTERS.items():
+            with self.subTest(engine=name):
+                mean, conf, _ = forecaster(values, 10, None)
+                mean, conf = np.asarray(mean), np.asarray(conf)
+
+                self.assertEqual(mean.shape, (10,))
+                self.assertEqual(conf.shape, (10, 2))
+                self.assertTrue(np.all(conf[:, 0] <= mean))
+                self.assertTrue(np.all(mean <= conf[:, 1]))
+                # Интервал не сужается с горизонтом
+                width = conf[:, 1] - conf[:, 0]
+                self.assertGreaterEqual(width[-1], width[0])
+
+    def test_sarimax_warm_start(self):
+        values = make_data(300)["BTC-USD"].to_numpy()
+        cold, _, params = engines.sarimax_forecast(values, 5)
+        warm, _, _ = engines.sarimax_forecast(values, 5, params)
+
+        np.testing.assert_allclose(warm, cold, rtol=1e-3)
+
+
+class TestSelectEngine(unittest.TestCase):
+    def setUp(self):
+        self.tracker = LatencyTracker(
+            prior={
+                "arima": 5.0,
+                "sarimax": 0.5,
+                "ets": 0.1,
+                "theta": 0.1,
+                "drift": 0.01,
+            }
+        )
+        patcher = patch("engines.latency_tracker", self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_configured_engine(self):
+        self.assertEqual(select_engine("theta", budget=0.001), "theta")
+        with self.assertRaises(ValueError):
+            select_engine("prophet")
+
+    def test_auto_picks_most_accurate_within_budget(self):
+        self.assertEqual(select_engine("auto", budget=10), "arima")
+        self.assertEqual(select_engine("auto", budget=1), "sarimax")
+        self.assertEqual(select_engine("auto", budget=0.2), "ets")
+        # Бюджет меньше любой задержки - самый быстрый движок
+        self.assertEqual(select_engine("auto", budget=0.001), "drift")
+
+    def test_auto_follows_measured_latency(self):
+        # SARIMAX оказался медленным на длинной истории
+        for _ in range(20):
+            self.tracker.observe("sarimax", 3.0)
+
+        self.assertEqual(select_engine("auto", budget=1), "ets")
+        self.assertEqual(self.tracker.stats()["calls"]["sarimax"], 20)
+
+    def test_first_measurement_replaces_prior(self):
+        self.tracker.observe("arima", 0.6)
+        self.assertEqual(self.tracker.latency["arima"], 0.6)
+        self.tracker.observe("arima", 1.6)
+        self.assertAlmostEqual(self.tracker.latency["arima"], 0.8)
+
+    def test_over_budget_engine_is_probed_again(self):
+        # Оценка ARIMA завышена: без новых замеров она бы не выбиралась
+        selected = [select_engine("auto", budget=1, reprobe_every=3) for _ in range(6)]
+        self.assertEqual(
+            selected, ["sarimax", "sarimax", "arima", "sarimax", "sarimax", "arima"]
+        )
+        self.assertEqual(self.tracker.stats()["probes"], 2)
+
+        # Замер показал, что ARIMA укладывается в бюджет
+        self.tracker.observe("arima", 0.6)
+        self.assertEqual(select_engine("auto", budget=1, reprobe_every=3), "arima")
+        # Без повторных замеров выбор не меняется
+        self.assertEqual(select_engine("auto", budget=0.5, reprobe_every=0), "sarimax")
+
+
+@patch("engines.run_cpu", new=run_inline)
+class TestForecast(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("engines.latency_tracker", LatencyTracker())
+        self.tracker = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(engines._states.clear)
+
+    async def test_forecast_records_latency_and_state(self):
+        data = make_data(200)
+        predict, conf = await engines.forecast(data, "BTC-USD", 7, "sarimax")
+
+        self.assertIsInstance(predict, pd.Series)
+        self.assertEqual(len(predict), 7)
+        self.assertEqual(conf.shape, (7, 2))
+        self.assertEqual(self.tracker.calls["sarimax"], 1)
+        # Первый замер заменяет начальную оценку
+        self.assertNotEqual(
+            self.tracker.latency["sarimax"], engines.PRIOR_LATENCY["sarimax"]
+        )
+        self.assertIn(("sarimax", "BTC-USD"), engines._states)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import asyncio
+import time
+import unittest
+
+import pandas as pd
+
+import executor
+from plots import render_history
+
+
+class TestExecutor(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        executor.shutdown()
+
+    async def test_blocking_io_does_not_freeze_loop(self):
+        ticks = []
+
+        async def heartbeat():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        # Блокирующий вызов в пуле не мешает другим корутинам
+        await asyncio.gather(executor.run_io(time.sleep, 0.2), heartbeat())
+
+        self.assertEqual(len(ticks), 5)
+        self.assertLess(ticks[-1] - ticks[0], 0.2)
+
+    async def test_render_in_process_pool(self):
+        data = pd.DataFrame(
+            {"BTC-USD": range(30)},
+            index=pd.date_range("2023-01-01", periods=30, name="Date"),
+        )
+        img_bytes = await executor.run_cpu(render_history, data, ["BTC-USD"])
+
+        self.assertTrue(img_bytes.startswith(b"\x89PNG"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import BufferedInputFile
+
+from fake_telegram import FakeTelegramServer
+from file_ids import FileIdCache, content_hash
+from locks import file_lock
+from test_broadcast import TOKEN
+
+
+class TestFileIdCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "file_ids.jsonl"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persists_across_restarts(self):
+        cache = FileIdCache(self.path)
+        cache.put("a", "id-a")
+        cache.put("b", "id-b")
+        cache.put("a", "id-a2")
+        cache.forget("b")
+
+        restored = FileIdCache(self.path)
+        self.assertEqual(restored.get("a"), "id-a2")
+        self.assertIsNone(restored.get("b"))
+        self.assertEqual(len(restored), 1)
+
+    def test_compacts_when_file_grows(self):
+        cache = FileIdCache(self.path, max_entries=2)
+        for i in range(5):
+            cache.put("a", f"id-a{i}")
+        # Строк больше 2 * max_entries - файл сжат до актуальных записей
+        self.assertEqual(len(self.path.read_text().splitlines()), 1)
+        cache.put("b", "id-b")
+        self.assertEqual(FileIdCache(self.path, max_entries=2).get("a"), "id-a4")
+
+    def test_workers_share_file(self):
+        # Каждый воркер создает свой кэш при запуске
+        first = FileIdCache(self.path, max_entries=2)
+        second = FileIdCache(self.path, max_entries=2)
+        first.put("a", "id-a")
+        self.assertEqual(second.get("a"), "id-a")
+        for i in range(4):
+            second.put("b", f"id-b{i}")
+        # `second` сжал файл; `first` перечитывает его и не теряет записи
+        first.put("c", "id-c")
+        self.assertEqual(first.get("b"), "id-b3")
+        self.assertEqual(second.get("c"), "id-c")
+        restored = FileIdCache(self.path, max_entries=2)
+        self.assertEqual((restored.get("b"), restored.get("c")), ("id-b3", "id-c"))
+
+    def test_keeps_last_entries(self):
+        cache = FileIdCache(self.path, max_entries=2)
+        for key in ["a", "b", "c"]:
+            cache.put(key, f"id-{key}")
+        self.assertNotIn("a", cache)
+
+        restored = FileIdCache(self.path, max_entries=2)
+        self.assertEqual(restored.get("c"), "id-c")
+        self.assertNotIn("a", restored)
+
+    def test_skips_truncated_line(self):
+        cache = FileIdCache(self.path)
+        cache.put("a", "id-a")
+        with self.path.open("a") as f:
+            f.write('["b", "id')
+
+        restored = FileIdCache(self.path)
+        self.assertEqual(restored.get("a"), "id-a")
+        restored.put("c", "id-c")
+        self.assertEqual(FileIdCache(self.path).get("c"), "id-c")
+
+
+class TestSendPhoto(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "file_ids.jsonl"
+        self.server = await FakeTelegramServer().start()
+        self.bot = Bot(
+            TOKEN,
+            session=AiohttpSession(api=TelegramAPIServer.from_base(self.server.url)),
+        )
+        self.image = b"\x89PNG" + bytes(range(256)) * 40
+
+    async def asyncTearDown(self):
+        await self.bot.session.close()
+        await self.server.stop()
+        self.directory.cleanup()
+
+    def photo(self):
+        # Обработчики каждый раз создают новый файл с теми же байтами
+        return BufferedInputFile(self.image, filename="predict_price.png")
+
+    async def test_repeat_sends_reference_file_id(self):
+        cache = FileIdCache(self.path)
+        for chat_id in [1, 2, 3]:
+            await cache.send_photo(self.bot, chat_id, self.photo())
+
+        self.assertEqual(self.server.uploads, 1)
+        self.assertEqual(len(self.server.sent), 3)
+        self.assertEqual(cache.stats()["bytes_saved"], 2 * len(self.image))
+
+        # После перезапуска изображение тоже не загружается
+        restored = FileIdCache(self.path)
+        message = await restored.send_photo(self.bot, 4, self.photo(), caption="BTC")
+        self.assertEqual(self.server.uploads, 1)
+        self.assertEqual(message.caption, "BTC")
+
+        other = BufferedInputFile(self.image + b"\x00", filename="other.png")
+        await restored.send_photo(self.bot, 4, other)
+        self.assertEqual(self.server.uploads, 2)
+
+    async def test_rejected_file_id_is_uploaded_again(self):
+        cache = FileIdCache(self.path)
+        digest = content_hash(self.image)
+        cache.put(digest, "stale-id")
+        self.server.invalid_file_ids.add("stale-id")
+
+        await cache.send_photo(self.bot, 1, self.photo())
+        self.assertEqual(self.server.uploads, 1)
+        self.assertEqual(cache.stats()["rejected"], 1)
+        self.assertNotEqual(cache.get(digest), "stale-id")
+
+    async def test_locked_file_does_not_block_loop(self):
+        cache = FileIdCache(self.path)
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            # Другой воркер сжимает файл
+            with file_lock(cache.lock_path):
+                locked.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertTrue(locked.wait(5))
+
+        task = asyncio.create_task(cache.send_photo(self.bot, 1, self.photo()))
+        started = time.perf_counter()
+        await asyncio.sleep(0.2)
+        # Загрузка прошла, запись `file_id` ждет блокировку вне event loop
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(self.server.uploads, 1)
+        self.assertFalse(task.done())
+
+        release.set()
+        await task
+        message = task.result()
+        restored = FileIdCache(self.path)
+        self.assertEqual(
+            restored.get(content_hash(self.image)), message.photo[-1].file_id
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pandas as pd
+
+import engines
+import metrics
+from engines import LatencyTracker
+from forecasts import ForecastCache
+
+
+def fake_arima(data, ticker, periods):
+    predict = pd.Series(np.arange(periods, dtype="f8"))
+    conf = np.column_stack([predict.values - 1, predict.values + 1])
+    return predict, conf
+
+
+@patch("forecasts.arima_model", new_callable=AsyncMock, side_effect=fake_arima)
+@patch("forecasts.data_loader", new_callable=AsyncMock)
+class TestForecastCache(unittest.IsolatedAsyncioTestCase):
+    async def test_horizon_is_sliced_from_stored_forecast(
+        self, mock_loader, mock_arima
+    ):
+        mock_loader.return_value = pd.DataFrame({"BTC-USD": [1.0, 2.0]})
+        cache = ForecastCache("2023-01-01", "Adj Close", ["BTC-USD"], max_horizon=30)
+
+        await cache.refresh("BTC-USD")
+        data, predict, conf, end_date = await cache.get("BTC-USD", 7)
+
+        # Модель обучалась один раз на максимальный горизонт
+        mock_arima.assert_called_once()
+        self.assertEqual(mock_arima.call_args.args[2], 30)
+        self.assertEqual(len(predict), 7)
+        self.assertEqual(conf.shape, (7, 2))
+        self.assertEqual(cache.hits, 1)
+
+    async def test_cold_and_stale_cache_fit_on_demand(self, mock_loader, mock_arima):
+        mock_loader.return_value = pd.DataFrame({"ETH-USD": [1.0, 2.0]})
+        cache = ForecastCache("2023-01-01", "Adj Close", ["ETH-USD"], max_horizon=30)
+
+        await cache.get("ETH-USD", 5)
+        self.assertEqual(cache.misses, 1)
+
+        # Прогноз, рассчитанный до последнего дневного закрытия, устарел
+        cache._forecasts["ETH-USD"].computed_at -= timedelta(days=1)
+        await cache.get("ETH-USD", 5)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(mock_arima.call_count, 2)
+
+    async def test_refresh_stages_are_measured(self, mock_loader, mock_arima):
+        mock_loader.return_value = pd.DataFrame({"BTC-USD": [1.0, 2.0]})
+        cache = ForecastCache("2023-01-01", "Adj Close", ["BTC-USD"], max_horizon=30)
+
+        with self.assertLogs("metrics") as logs:
+            with metrics.request("forecast_test", "1-1", "BTC-USD"):
+                await cache.get("BTC-USD", 7)
+                # Прогноз из кэша - без этапов загрузки и обучения
+                await cache.get("BTC-USD", 7)
+
+        stages = [
+            json.loads(line.split(":", 2)[2])
+            for line in logs.output
+            if '"event": "span"' in line
+        ]
+        self.assertEqual([span["stage"] for span in stages], ["download", "forecast"])
+        self.assertEqual(stages[0]["size"], 2)
+        self.assertEqual(stages[0]["request_id"], "1-1")
+
+    async def test_arima_reprobe_updates_latency(self, mock_loader, mock_arima):
+        mock_loader.return_value = pd.DataFrame({"BTC-USD": [1.0, 2.0]})
+        cache = ForecastCache("2023-01-01", "Adj Close", ["BTC-USD"], max_horizon=30)
+        tracker = LatencyTracker()
+        tracker.observe("arima", 5.0)
+
+        with patch("engines.latency_tracker", tracker):
+            # ARIMA вне бюджета, но получает запрос для повторного замера
+            engine = engines.select_engine("auto", budget=1, reprobe_every=1)
+            self.assertEqual(engine, "arima")
+            await cache.get("BTC-USD", 7)
+            self.assertLess(tracker.latency["arima"], 5.0)
+            self.assertEqual(tracker.calls["arima"], 2)
+
+            # Прогноз из кэша - не замер обучения
+            await cache.get("BTC-USD", 7)
+            self.assertEqual(tracker.calls["arima"], 2)
+
+    async def test_horizon_above_maximum_is_not_cached(self, mock_loader, mock_arima):
+        cache = ForecastCache("2023-01-01", "Adj Close", ["BTC-USD"], max_horizon=30)
+
+        self.assertIsNone(await cache.get("BTC-USD", 31))
+        mock_arima.assert_not_called()
+
+    def test_next_refresh_after_daily_close(self, mock_loader, mock_arima):
+        cache = ForecastCache("2023-01-01", "Adj Close")
+        now = datetime(2024, 3, 1, 23, 50, tzinfo=timezone.utc)
+
+        with patch("forecasts.FORECAST_CLOSE_DELAY", 300):
+            self.assertEqual(cache.seconds_until_refresh(now), 15 * 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from app import Form
+from fsm_storage import create_isolation, create_storage
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+class TestSharedStorage(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Один сервер Redis на несколько "процессов" бота
+        self.server = FakeServer()
+
+    def worker_storage(self):
+        return create_storage(redis=FakeRedis(server=self.server))
+
+    def test_memory_storage_without_url(self):
+        storage = create_storage(url="")
+
+        self.assertIsInstance(storage, MemoryStorage)
+        self.assertIsNone(create_isolation(storage))
+
+    async def test_state_is_shared_between_workers(self):
+        first, second = self.worker_storage(), self.worker_storage()
+
+        await FSMContext(first, KEY).set_state(Form.time_range)
+        await FSMContext(first, KEY).update_data(coin="BTC-USD")
+
+        # Следующее сообщение пользователя обрабатывает другой воркер
+        state = FSMContext(second, KEY)
+        self.assertEqual(await state.get_state(), Form.time_range.state)
+        self.assertEqual(await state.get_data(), {"coin": "BTC-USD"})
+
+        await first.close()
+        # Перезапуск воркера не теряет начатый диалог
+        restarted = FSMContext(self.worker_storage(), KEY)
+        self.assertEqual(await restarted.get_state(), Form.time_range.state)
+
+    async def test_events_of_one_user_are_serialized(self):
+        isolations = [
+            create_isolation(self.worker_storage()),
+            create_isolation(self.worker_storage()),
+        ]
+        events = []
+
+        async def handle(isolation, name):
+            async with isolation.lock(KEY):
+                events.append(f"{name} start")
+                await asyncio.sleep(0.05)
+                events.append(f"{name} end")
+
+        await asyncio.gather(handle(isolations[0], "a"), handle(isolations[1], "b"))
+
+        # Обработка событий не пересекается, хотя воркеры разные
+        self.assertIn(
+            events,
+            [
+                ["a start", "a end", "b start", "b end"],
+                ["b start", "b end", "a start", "a end"],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+from app import predict_next_days
+from fake_feed import FakeFeedServer
+from live import LiveFeed, RingBuffer, WebSocketProvider, parse_ticks
+
+
+def ns(timestamp):
+    return pd.Timestamp(timestamp).value
+
+
+async def no_sleep(seconds):
+    await asyncio.sleep(0)
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_wraps_around(self):
+        buffer = RingBuffer(4)
+        for i in range(6):
+            buffer.append(i, float(i) * 10)
+
+        times, prices = buffer.snapshot()
+        np.testing.assert_array_equal(times, [2, 3, 4, 5])
+        np.testing.assert_array_equal(prices, [20, 30, 40, 50])
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.last(), (5, 50.0))
+
+        times, _ = buffer.snapshot(since=4)
+        np.testing.assert_array_equal(times, [4, 5])
+
+    def test_empty(self):
+        buffer = RingBuffer(3)
+        self.assertIsNone(buffer.last())
+        self.assertEqual(len(buffer.snapshot()[0]), 0)
+
+    def test_parse_ticks(self):
+        message = json.dumps(
+            [
+                {"ticker": "BTC-USD", "time": 1.5, "price": "100"},
+                {"type": "heartbeat"},
+            ]
+        )
+        self.assertEqual(parse_ticks(message), [("BTC-USD", 1_500_000_000, 100.0)])
+
+
+class TestLiveFeed(unittest.TestCase):
+    def setUp(self):
+        self.feed = LiveFeed(provider=None, tickers=["BTC-USD"], capacity=100)
+        for timestamp, price in [
+            ("2024-01-02 10:00", 105.0),
+            ("2024-01-02 23:00", 107.0),
+            ("2024-01-03 01:00", 103.0),
+            ("2024-01-03 02:00", 104.0),
+        ]:
+            self.feed.on_tick("BTC-USD", ns(timestamp), price)
+        # Тики чужих тикеров не хранятся
+        self.feed.on_tick("XRP-USD", ns("2024-01-03"), 1.0)
+
+    def test_bars_from_ticks(self):
+        bars = self.feed.bars("BTC-USD", "1d")
+
+        self.assertEqual(
+            list(bars.index), list(pd.to_datetime(["2024-01-02", "2024-01-03"]))
+        )
+        self.assertEqual(
+            list(bars.iloc[1][["Open", "High", "Low", "Close"]]), [103, 104, 103, 104]
+        )
+        self.assertEqual(len(self.feed.bars("BTC-USD", "1h", since="2024-01-03")), 2)
+        self.assertTrue(self.feed.bars("XRP-USD").empty)
+
+    def test_extend_history(self):
+        index = pd.date_range("2023-12-31", periods=3, name="Date")
+        data = pd.DataFrame({"BTC-USD": [90.0, 95.0, 100.0]}, index=index)
+
+        extended = self.feed.extend(data, ["BTC-USD"])
+
+        # Незакрытый день замещен живой ценой, следующий - дописан
+        self.assertEqual(list(extended["BTC-USD"]), [90.0, 95.0, 107.0, 104.0])
+        self.assertEqual(extended.index[-1], pd.Timestamp("2024-01-03"))
+        self.assertEqual(list(data["BTC-USD"]), [90.0, 95.0, 100.0])
+
+        # Прошлый период не продлевается
+        past = self.feed.extend(data, ["BTC-USD"], end="2024-01-02")
+        pd.testing.assert_frame_equal(past, data)
+
+    def test_extend_ohlc(self):
+        index = pd.date_range("2024-01-02", periods=1, name="Date")
+        columns = ["Open", "High", "Low", "Close", "Volume"]
+        data = pd.DataFrame(
+            [[100.0, 110.0, 90.0, 106.0, 5_000_000]], index=index, columns=columns
+        )
+        extended = self.feed.extend(data, ["BTC-USD"])
+
+        self.assertEqual(list(extended.columns), columns)
+        # Бар истории дополнен тиками: открытие и объем из истории,
+        # максимум и минимум по обоим барам, закрытие - живое
+        self.assertEqual(list(extended.iloc[0]), [100.0, 110.0, 90.0, 107.0, 5e6])
+        # Следующий бар - только из тиков
+        self.assertEqual(list(extended.iloc[1]), [103.0, 104.0, 103.0, 104.0, 0])
+        self.assertEqual(data.iloc[0]["Close"], 106.0)
+
+        # Живой бар шире сохраненного
+        data.loc[:, ["High", "Low"]] = [[106.0, 104.0]]
+        extended = self.feed.extend(data, ["BTC-USD"])
+        self.assertEqual(list(extended.iloc[0][["High", "Low"]]), [107.0, 104.0])
+
+    def test_stale_feed_keeps_history(self):
+        data = pd.DataFrame(
+            {"BTC-USD": [1.0]}, index=pd.DatetimeIndex(["2024-01-02"], name="Date")
+        )
+        self.feed.stale = -1
+        self.assertIs(self.feed.extend(data, ["BTC-USD"]), data)
+
+
+def write_ticks(path, count):
+    buffer = RingBuffer(64, path)
+    for i in range(1, count + 1):
+        buffer.append(i, float(i))
+
+
+class TestSharedBuffers(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def feed(self):
+        return LiveFeed(
+            provider=None, tickers=["BTC-USD"], capacity=100, directory=self.tmp.name
+        )
+
+    def test_workers_read_leader_ticks(self):
+        leader, worker = self.feed(), self.feed()
+        self.assertIsNone(worker.latest("BTC-USD"))
+        self.assertFalse(worker.is_fresh())
+
+        leader.on_tick("BTC-USD", ns("2024-01-02 10:00"), 105.0)
+        leader.on_tick("BTC-USD", ns("2024-01-03 01:00"), 103.0)
+
+        # Воркер без потока видит тики ведущего
+        self.assertEqual(worker.latest("BTC-USD"), (ns("2024-01-03 01:00"), 103.0))
+        self.assertTrue(worker.is_fresh())
+        index = pd.date_range("2024-01-01", periods=2, name="Date")
+        data = pd.DataFrame({"BTC-USD": [90.0, 100.0]}, index=index)
+        pd.testing.assert_frame_equal(
+            worker.extend(data, ["BTC-USD"]), leader.extend(data, ["BTC-USD"])
+        )
+
+        # Новый ведущий продолжает тот же буфер
+        self.feed().on_tick("BTC-USD", ns("2024-01-03 02:00"), 104.0)
+        self.assertEqual(len(worker.buffers["BTC-USD"]), 3)
+        self.assertEqual(worker.latest("BTC-USD")[1], 104.0)
+
+    def test_reader_never_sees_partial_write(self):
+        path = Path(self.tmp.name) / "BTC-USD-64.ticks"
+        reader = RingBuffer(64, path)
+        writer = multiprocessing.get_context("fork").Process(
+            target=write_ticks, args=(path, 50000)
+        )
+        writer.start()
+        reads = 0
+        while writer.is_alive():
+            times, prices = reader.snapshot()
+            # Тики по порядку, цена каждого совпадает с его временем
+            self.assertTrue(np.all(np.diff(times) == 1))
+            np.testing.assert_array_equal(prices, times)
+            reads += 1
+        writer.join()
+
+        self.assertEqual(writer.exitcode, 0)
+        self.assertGreater(reads, 0)
+        self.assertEqual(reader.last(), (50000, 50000.0))
+
+
+class TestPredictHandler(unittest.IsolatedAsyncioTestCase):
+    @patch("app.file_id_cache.send_photo", new_callable=AsyncMock)
+    @patch("app.plot_predict", new_callable=AsyncMock)
+    @patch("app.get_data_for_plot", new_callable=AsyncMock)
+    @patch("app.post_processing_data", new_callable=AsyncMock)
+    @patch("app.engines")
+    @patch("app.data_loader", new_callable=AsyncMock)
+    async def test_forecast_ignores_live_bar(self, data_loader, engines, *_):
+        index = pd.date_range("2024-01-01", periods=3, name="Date")
+        data_loader.return_value = pd.DataFrame({"BTC-USD": [1.0, 2.0, 3.0]}, index)
+        engines.select_engine.return_value = "ets"
+        engines.forecast = AsyncMock(return_value=(MagicMock(), MagicMock()))
+        message = MagicMock()
+        message.text = "7"
+        message.reply = AsyncMock()
+        state = MagicMock()
+        state.update_data = AsyncMock(
+            return_value={"coin": "BTC-USD_predict", "horizon_predict": "7"}
+        )
+        state.set_state = AsyncMock()
+
+        feed = LiveFeed(provider=None, tickers=["BTC-USD"], capacity=10)
+        feed.on_tick("BTC-USD", ns("2024-01-03 12:00"), 5.0)
+        with patch("app.live_feed", feed):
+            await predict_next_days(message, state)
+
+        message.reply.assert_not_called()
+        # Модель обучена на сохраненной истории: живой бар не попал в данные
+        data = engines.forecast.call_args.args[0]
+        self.assertIs(data, data_loader.return_value)
+
+
+class TestWebSocketFeed(unittest.IsolatedAsyncioTestCase):
+    async def wait_for(self, condition, timeout=5):
+        async with asyncio.timeout(timeout):
+            while not condition():
+                await asyncio.sleep(0.01)
+
+    async def test_ingests_and_reconnects(self):
+        async with FakeFeedServer(period=0.001, close_after=20) as server:
+            feed = LiveFeed(
+                WebSocketProvider(server.url),
+                tickers=["BTC-USD", "ETH-USD"],
+                capacity=16,
+                sleep=no_sleep,
+            )
+            task = asyncio.create_task(feed.run())
+            try:
+                await self.wait_for(lambda: feed.reconnects >= 2)
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        self.assertGreaterEqual(server.connections, 2)
+        self.assertGreaterEqual(feed.ticks, 40)
+        self.assertEqual(len(feed.buffers["BTC-USD"]), 16)
+        times, prices = feed.buffers["ETH-USD"].snapshot()
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        self.assertEqual(feed.latest("ETH-USD")[1], prices[-1])
+        self.assertTrue(feed.is_fresh())
+        self.assertEqual(feed.stats()["buffered"]["BTC-USD"], 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from locks import LeaderLock, file_lock
+
+
+class TestLocks(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "leader.lock"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_single_leader(self):
+        first, second = LeaderLock(self.path), LeaderLock(self.path)
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        self.assertTrue(first.is_leader)
+
+        # Роль переходит после освобождения
+        first.release()
+        self.assertTrue(second.try_acquire())
+        second.release()
+
+    async def test_run_waits_for_role(self):
+        first, second = LeaderLock(self.path), LeaderLock(self.path)
+        first.try_acquire()
+        started = []
+        attempts = 0
+
+        async def sleep(seconds):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 3:
+                first.release()
+            await asyncio.sleep(0)
+
+        await second.run(lambda: started.append(True), sleep=sleep)
+        self.assertEqual(started, [True])
+        self.assertEqual(attempts, 3)
+        second.release()
+
+    def test_file_lock_excludes_threads(self):
+        inside = []
+
+        def work():
+            with file_lock(self.path):
+                inside.append(1)
+                time.sleep(0.01)
+                # Внутри блокировки никого больше нет
+                self.assertEqual(len(inside), 1)
+                inside.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(inside, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
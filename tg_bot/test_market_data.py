@@ -0,0 +1,395 @@
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pandas as pd
+
+import market_data
+from app import send_crypto_candle, send_stock_history
+from fake_market import FakeMarketServer
+from market_data import (
+    COLUMNS,
+    HttpProvider,
+    MarketData,
+    MarketDataError,
+    TokenBucket,
+    YahooProvider,
+    backoff_delay,
+    candle_count,
+    parse_interval,
+    source_interval,
+    yahoo_windows,
+)
+from price_store import PriceStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_limit(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+
+        for _ in range(4):
+            self.assertTrue(bucket.acquire())
+        # Два запроса из запаса, остальные - по одному в полсекунды
+        self.assertAlmostEqual(clock.now, 1.0)
+        self.assertAlmostEqual(bucket.waited, 1.0)
+
+        # Токен не успевает пополниться до срока
+        self.assertFalse(bucket.acquire(deadline=clock.now + 0.1))
+
+    def test_backoff_is_jittered_and_capped(self):
+        delays = [backoff_delay(attempt, base=0.5, cap=4) for attempt in range(10)]
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertTrue(
+            all(backoff_delay(0, base=0.5, cap=4) <= 0.5 for _ in range(20))
+        )
+
+
+class TestIntervals(unittest.TestCase):
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval("5m"), pd.Timedelta(minutes=5))
+        self.assertEqual(parse_interval("4h"), pd.Timedelta(hours=4))
+        self.assertEqual(parse_interval("1d"), pd.Timedelta(days=1))
+        for interval in ["0m", "m", "5s", "1w"]:
+            with self.assertRaises(ValueError):
+                parse_interval(interval)
+
+    def test_source_interval(self):
+        self.assertEqual(source_interval("1d"), "1d")
+        self.assertEqual(source_interval("4h"), "1h")
+        self.assertEqual(source_interval("45m"), "15m")
+        self.assertEqual(source_interval("7m"), "1m")
+        self.assertEqual(source_interval("1h"), "1h")
+
+
+class TestMarketData(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeMarketServer().start()
+        self.addCleanup(self.server.stop)
+        self.sleeps = []
+        self.market_data = MarketData(
+            HttpProvider(self.server.url),
+            bucket=TokenBucket(rate=1000, capacity=1000),
+            retries=3,
+            timeout=1,
+            deadline=5,
+            sleep=self.sleeps.append,
+        )
+
+    def test_fetch_range(self):
+        data = self.market_data.fetch("BTC-USD", "2023-01-01", "2023-02-01")
+
+        self.assertEqual(len(data), 31)
+        self.assertEqual(data.index[0], pd.Timestamp("2023-01-01"))
+        self.assertEqual(data.index.name, "Date")
+        pd.testing.assert_frame_equal(
+            data,
+            self.server.prices["BTC-USD"].loc["2023-01-01":"2023-01-31"],
+            check_freq=False,
+        )
+        self.assertTrue(
+            self.market_data.fetch("XRP-USD", "2023-01-01", "2023-02-01").empty
+        )
+
+    def test_fetch_intraday(self):
+        data = self.market_data.fetch("BTC-USD", "2024-01-01", "2024-01-02", "5m")
+
+        self.assertEqual(len(data), 288)
+        self.assertEqual(data.index[1], pd.Timestamp("2024-01-01 00:05"))
+
+    def test_retries_transient_errors(self):
+        self.server.fail_next(503, 429)
+        data = self.market_data.fetch("ETH-USD", "2023-01-01", "2023-01-08")
+
+        self.assertEqual(len(data), 7)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertEqual(self.market_data.stats()["retries"], 2)
+
+    def test_gives_up_with_user_message(self):
+        self.server.fail_next(*[503] * 4)
+        with self.assertRaises(MarketDataError) as error:
+            self.market_data.fetch("BTC-USD", "2023-01-01", "2023-01-08")
+
+        self.assertIn("попробуйте позже", str(error.exception))
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(self.market_data.stats()["failures"], 1)
+
+    def test_deadline_bounds_slow_provider(self):
+        self.server.latency = 0.5
+        market_data = MarketData(
+            HttpProvider(self.server.url),
+            bucket=TokenBucket(rate=1000, capacity=1000),
+            retries=10,
+            timeout=5,
+            deadline=0.3,
+        )
+
+        started = time.monotonic()
+        with self.assertRaises(MarketDataError):
+            market_data.fetch("BTC-USD", "2023-01-01", "2023-01-08")
+        # Таймаут запроса сокращен до оставшегося срока
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_batch_deadline(self):
+        self.server.latency = 0.3
+        market_data = MarketData(
+            HttpProvider(self.server.url),
+            bucket=TokenBucket(rate=1000, capacity=1000),
+            retries=10,
+            timeout=5,
+            deadline=0.5,
+        )
+
+        started = time.monotonic()
+        with self.assertRaises(MarketDataError):
+            market_data.fetch_many(
+                ["BTC-USD", "ETH-USD", "XRP-USD"], "2023-01-01", "2023-01-08"
+            )
+        # Срок - на весь пакет, а не на каждый тикер
+        self.assertLess(time.monotonic() - started, 1.2)
+
+    def test_price_store_over_http(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = PriceStore(
+                root,
+                fetch=self.market_data.fetch,
+                fetch_many=self.market_data.fetch_many,
+            )
+            data = store.get_many(["BTC-USD", "ETH-USD"], "2023-01-01", "2023-03-01")
+            store.get("BTC-USD", "2023-01-10", "2023-02-10")
+
+        self.assertEqual(len(data["BTC-USD"]), 59)
+        self.assertEqual(self.server.requests, 2)
+
+
+def yahoo_frame(start, periods):
+    index = pd.date_range(start, periods=periods, freq="D", tz="UTC")
+    return pd.DataFrame(
+        {column: range(periods) for column in COLUMNS}, index=index, dtype=float
+    )
+
+
+class TestYahooProvider(unittest.TestCase):
+    def setUp(self):
+        self.market_data = MarketData(
+            YahooProvider(session=MagicMock()),
+            bucket=TokenBucket(rate=1000, capacity=1000),
+            retries=2,
+            sleep=lambda seconds: None,
+        )
+
+    @patch("market_data.yf.Ticker")
+    def test_no_data_is_empty(self, ticker):
+        ticker.return_value.history.side_effect = Exception(
+            "BTC-USD: No price data found, symbol may be delisted (1d 2023-01-01)"
+        )
+        self.assertTrue(
+            self.market_data.fetch("BTC-USD", "2023-01-01", "2023-01-08").empty
+        )
+        self.assertEqual(self.market_data.requests, 1)
+
+    @patch("market_data.yf.Ticker")
+    def test_network_errors_are_retried(self, ticker):
+        # Так yfinance сообщает о сбое DNS или сети при запросе часового пояса
+        ticker.return_value.history.side_effect = Exception(
+            "BTC-USD: No timezone found, symbol may be delisted"
+        )
+        with self.assertRaises(MarketDataError):
+            self.market_data.fetch("BTC-USD", "2023-01-01", "2023-01-08")
+        self.assertEqual(self.market_data.requests, 3)
+
+        ticker.return_value.history.side_effect = [
+            Exception("BTC-USD: No price data found (Yahoo status_code = 500)"),
+            yahoo_frame("2023-01-01", 7),
+        ]
+        data = self.market_data.fetch("BTC-USD", "2023-01-01", "2023-01-08")
+        self.assertEqual(len(data), 7)
+        self.assertIsNone(data.index.tz)
+
+    def test_intraday_windows(self):
+        windows = yahoo_windows("2024-01-01", "2024-01-20", "1m")
+        self.assertEqual(
+            windows,
+            [
+                (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-08")),
+                (pd.Timestamp("2024-01-08"), pd.Timestamp("2024-01-15")),
+                (pd.Timestamp("2024-01-15"), pd.Timestamp("2024-01-20")),
+            ],
+        )
+        self.assertEqual(len(yahoo_windows("2024-01-01", "2024-02-20", "5m")), 1)
+        self.assertEqual(len(yahoo_windows("2020-01-01", "2024-01-01", "1d")), 1)
+
+    @patch("market_data.yf.Ticker")
+    def test_fetch_splits_minute_range(self, ticker):
+        ticker.return_value.history.side_effect = [
+            yahoo_frame("2024-01-01", 7),
+            yahoo_frame("2024-01-08", 7),
+            Exception("BTC-USD: No price data found, symbol may be delisted"),
+        ]
+        data = self.market_data.fetch("BTC-USD", "2024-01-01", "2024-01-20", "1m")
+
+        self.assertEqual(ticker.return_value.history.call_count, 3)
+        # Токен ограничения частоты - на каждое окно
+        self.assertEqual(self.market_data.requests, 3)
+        self.assertEqual(len(data), 14)
+        starts = [c.kwargs["start"] for c in ticker.return_value.history.call_args_list]
+        self.assertEqual(starts[-1], pd.Timestamp("2024-01-15"))
+
+    def test_check_range(self):
+        now = pd.Timestamp("2024-03-01 12:00")
+        provider = self.market_data.provider
+        provider.check_range("2024-02-10", "2024-03-01", "1m", now=now)
+        provider.check_range("2020-01-01", "2024-03-01", "1d", now=now)
+        with self.assertRaises(MarketDataError) as error:
+            provider.check_range("2024-01-20", "2024-03-01", "1m", now=now)
+        self.assertIn("за последние 30 дней", str(error.exception))
+        with self.assertRaises(MarketDataError):
+            provider.check_range("2023-12-01", "2024-01-01", "15m", now=now)
+
+    @patch("market_data.yf.download")
+    def test_fetch_many_single_download(self, download):
+        btc, eth = yahoo_frame("2023-01-01", 7), yahoo_frame("2023-01-03", 5)
+        # Таблицы тикеров выровнены по общему индексу, как у yf.download
+        download.return_value = pd.concat(
+            {"BTC-USD": btc, "ETH-USD": eth, "XRP-USD": btc * float("nan")}, axis=1
+        )
+
+        def record_errors(*args, **kwargs):
+            market_data.yf.shared._ERRORS = {
+                "XRP-USD": "No price data found, symbol may be delisted"
+            }
+            return download.return_value
+
+        download.side_effect = record_errors
+        frames = self.market_data.fetch_many(
+            ["BTC-USD", "ETH-USD", "XRP-USD"], "2023-01-01", "2023-01-08"
+        )
+
+        download.assert_called_once()
+        self.assertEqual(download.call_args.kwargs["threads"], 3)
+        self.assertEqual(len(frames["BTC-USD"]), 7)
+        self.assertEqual(len(frames["ETH-USD"]), 5)
+        self.assertEqual(frames["ETH-USD"].index[0], pd.Timestamp("2023-01-03"))
+        self.assertTrue(frames["XRP-USD"].empty)
+
+    @patch("market_data.yf.download")
+    def test_fetch_many_takes_token_per_ticker(self, download):
+        clock = FakeClock()
+        self.market_data.bucket = TokenBucket(
+            rate=1, capacity=1, clock=clock, sleep=clock.sleep
+        )
+        tickers = ["BTC-USD", "ETH-USD", "XRP-USD"]
+        download.return_value = pd.concat(
+            {ticker: yahoo_frame("2023-01-01", 7) for ticker in tickers}, axis=1
+        )
+        market_data.yf.shared._ERRORS = {}
+        self.market_data.fetch_many(tickers, "2023-01-01", "2023-01-08")
+
+        # Один вызов `yf.download`, но три запроса к Yahoo
+        download.assert_called_once()
+        self.assertEqual(self.market_data.requests, 3)
+        self.assertAlmostEqual(clock.now, 2.0)
+
+    @patch("market_data.yf.download")
+    def test_fetch_many_retries_failed_ticker(self, download):
+        calls = []
+
+        def failing_download(*args, **kwargs):
+            calls.append(kwargs["timeout"])
+            market_data.yf.shared._ERRORS = {
+                "ETH-USD": "HTTPSConnectionPool: Max retries exceeded"
+            }
+            return pd.concat({"BTC-USD": yahoo_frame("2023-01-01", 7)}, axis=1)
+
+        download.side_effect = failing_download
+        with self.assertRaises(MarketDataError):
+            self.market_data.fetch_many(
+                ["BTC-USD", "ETH-USD"], "2023-01-01", "2023-01-08"
+            )
+        self.assertEqual(len(calls), 3)
+
+
+class TestCandleCount(unittest.TestCase):
+    def test_estimate(self):
+        now = pd.Timestamp("2024-06-01")
+        self.assertEqual(candle_count("2024-01-01", "2024-01-08", "15m", now), 672)
+        self.assertEqual(candle_count("2024-01-01", "2024-01-02", "7m", now), 206)
+        # Будущие даты не добавляют свечей
+        self.assertEqual(candle_count("2024-05-31", "2024-12-31", "1h", now), 24)
+        self.assertEqual(candle_count("2024-07-01", "2024-08-01", "1h", now), 0)
+
+
+class TestHandlerMessage(unittest.IsolatedAsyncioTestCase):
+    @patch("app.data_loader", side_effect=MarketDataError("Источник недоступен."))
+    async def test_user_sees_friendly_message(self, data_loader):
+        message = MagicMock()
+        message.reply = AsyncMock()
+        state = MagicMock()
+        state.update_data = AsyncMock(
+            return_value={"coin": "BTC-USD", "time_range": "2023-01-01 2023-12-31"}
+        )
+        state.clear = AsyncMock()
+        state.set_state = AsyncMock()
+
+        await send_stock_history(message, state)
+
+        message.reply.assert_awaited_once_with("Источник недоступен.")
+
+    async def check_rejected(self, handler, key, text):
+        message = MagicMock()
+        message.reply = AsyncMock()
+        state = MagicMock()
+        state.update_data = AsyncMock(return_value={"coin": "BTC-USD", key: text})
+        state.clear = AsyncMock()
+        state.set_state = AsyncMock()
+        with patch("app.data_loader") as data_loader, patch("app.data_all") as data_all:
+            await handler(message, state)
+        # Запрос отклонен до загрузки
+        data_loader.assert_not_called()
+        data_all.assert_not_called()
+        message.reply.assert_awaited_once()
+        return message.reply.call_args.args[0]
+
+    async def test_too_many_candles_rejected_before_download(self):
+        today = pd.Timestamp.now().floor("D")
+        text = f"{(today - pd.Timedelta(days=20)).date()} {today.date()} 1m"
+        for handler, key in [
+            (send_stock_history, "time_range"),
+            (send_crypto_candle, "time_rangers"),
+        ]:
+            reply = await self.check_rejected(handler, key, text)
+            self.assertIn("Слишком много свечей", reply)
+
+    async def test_zero_interval_rejected(self):
+        for handler, key in [
+            (send_stock_history, "time_range"),
+            (send_crypto_candle, "time_rangers"),
+        ]:
+            for text in ["2023-01-01 2023-01-02 0m", "2023-01-01 2023-01-02 00h"]:
+                reply = await self.check_rejected(handler, key, text)
+                self.assertEqual(
+                    reply, "Неверный формат временного интервала. Попробуй все заново."
+                )
+
+    async def test_old_minute_bars_rejected(self):
+        reply = await self.check_rejected(
+            send_crypto_candle, "time_rangers", "2020-01-01 2020-01-02 1m"
+        )
+        self.assertIn("за последние 30 дней", reply)
+
+
+if __name__ == "__main__":
+    unittest.main()
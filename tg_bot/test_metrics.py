@@ -0,0 +1,147 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pandas as pd
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import metrics
+from app import send_stock_history
+from metrics import Histogram, Registry, span
+
+
+def make_message(user_id, message_id, text):
+    message = MagicMock()
+    message.text = text
+    message.chat.id = user_id
+    message.message_id = message_id
+    message.reply = AsyncMock()
+    return message
+
+
+def make_state(coin):
+    state = MagicMock()
+    state.update_data = AsyncMock(
+        return_value={"coin": coin, "time_range": "2023-01-01 2023-12-31"}
+    )
+    state.clear = AsyncMock()
+    state.set_state = AsyncMock()
+    return state
+
+
+async def fake_data_loader(start_date, end_date, tickers, col_value, interval="1d"):
+    await asyncio.sleep(0.01)
+    return pd.DataFrame({tickers[0]: [1.0, 2.0, 3.0]})
+
+
+class TestHistogram(unittest.TestCase):
+    def test_prometheus_text(self):
+        histogram = Histogram("stage_seconds", "Stage", ("stage",), buckets=(0.1, 1))
+        histogram.observe(0.05, stage="render")
+        histogram.observe(0.1, stage="render")
+        histogram.observe(5, stage="render")
+
+        lines = histogram.expose()
+        self.assertIn('stage_seconds_bucket{stage="render",le="0.1"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="render",le="1"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="render",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_count{stage="render"} 3', lines)
+        self.assertIn('stage_seconds_sum{stage="render"} 5.15', lines)
+
+    def test_stats_are_exported_as_gauges(self):
+        registry = Registry()
+        registry.register_stats(
+            "cache", lambda: {"hits": 3, "age_seconds": {"BTC-USD": 1.5}}
+        )
+
+        text = registry.expose()
+        self.assertIn("cache_hits 3.0\n", text)
+        self.assertIn('cache_age_seconds{key="BTC-USD"} 1.5\n', text)
+
+
+class TestSpans(unittest.IsolatedAsyncioTestCase):
+    async def test_span_logs_request_context(self):
+        with self.assertLogs("metrics", level="INFO") as logs:
+            with metrics.request("handler", "42-1", "BTC-USD"):
+                with span("download") as stage:
+                    stage.size = 10
+            with self.assertRaises(ValueError):
+                with metrics.request("handler", "42-2", "ETH-USD"):
+                    with span("render"):
+                        raise ValueError("boom")
+
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual(
+            [(r["event"], r["request_id"], r["ticker"]) for r in records],
+            [
+                ("span", "42-1", "BTC-USD"),
+                ("request", "42-1", "BTC-USD"),
+                ("span", "42-2", "ETH-USD"),
+                ("request", "42-2", "ETH-USD"),
+            ],
+        )
+        self.assertEqual(records[0]["size"], 10)
+        self.assertEqual(records[2]["error"], "ValueError")
+        self.assertEqual(records[3]["status"], "error")
+
+    @patch("app.plot_history", new_callable=AsyncMock, return_value="image")
+    @patch("app.data_loader", side_effect=fake_data_loader)
+    async def test_handler_stages_are_timed(self, *mocks):
+        before = {
+            stage: metrics.STAGE_SECONDS.count(
+                handler="send_stock_history", stage=stage
+            )
+            for stage in ["download", "render", "upload"]
+        }
+        bot = MagicMock()
+        bot.send_photo = AsyncMock()
+
+        with patch("app.bot", bot), self.assertLogs("metrics") as logs:
+            await asyncio.gather(
+                *(
+                    send_stock_history(make_message(user_id, 1, ""), make_state(coin))
+                    for user_id, coin in [(1, "BTC-USD"), (2, "ETH-USD")]
+                )
+            )
+
+        for stage, count in before.items():
+            self.assertEqual(
+                metrics.STAGE_SECONDS.count(handler="send_stock_history", stage=stage),
+                count + 2,
+            )
+        # Этапы одновременных запросов не смешиваются
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        for record in records:
+            expected = "BTC-USD" if record["request_id"] == "1-1" else "ETH-USD"
+            self.assertEqual(record["ticker"], expected)
+        downloads = [r for r in records if r.get("stage") == "download"]
+        self.assertEqual([r["size"] for r in downloads], [3, 3])
+
+    async def test_metrics_endpoint(self):
+        app = web.Application()
+        metrics.add_routes(app)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            with metrics.request("endpoint_test"):
+                with span("render"):
+                    pass
+            response = await client.get("/metrics")
+            text = await response.text()
+        finally:
+            await client.close()
+
+        self.assertEqual(response.status, 200)
+        self.assertIn("# TYPE bot_stage_seconds histogram", text)
+        self.assertIn(
+            'bot_stage_seconds_count{handler="endpoint_test",stage="render"} 1', text
+        )
+        # Статистика кэшей, зарегистрированная в app.py
+        self.assertIn("price_store_hit_rate", text)
+        self.assertIn("chart_cache_bytes", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
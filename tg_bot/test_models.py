@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+import models
+from model_cache import ModelCache
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+async def run_threaded(func, *args, **kwargs):
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def slow_fit_order(series, order, fit_order=models.fit_order):
+    # Все порядки, кроме простейшего, обучаются дольше бюджета
+    if order != (0, 0, 0):
+        time.sleep(0.5)
+    return fit_order(series, order)
+
+
+def make_data(n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-01", periods=n_days, name="Date")
+    return pd.DataFrame(
+        {"BTC-USD": 100 + np.cumsum(rng.normal(size=n_days))}, index=index
+    )
+
+
+@patch("models.run_cpu", new=run_inline)
+class TestArimaModelCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ModelCache()
+        patcher = patch("models.model_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_repeat_prediction_uses_cached_model(self):
+        data = make_data(200)
+        first, _ = await models.arima_model(data, "BTC-USD", 7)
+        second, conf = await models.arima_model(data, "BTC-USD", 7)
+
+        self.assertEqual(self.cache.searches, 1)
+        self.assertEqual(self.cache.hits, 1)
+        np.testing.assert_allclose(first.values, second.values)
+        self.assertEqual(conf.shape, (7, 2))
+
+    async def test_new_bars_update_cached_model(self):
+        data = make_data(210)
+        await models.arima_model(data[:200], "BTC-USD", 7)
+        await models.arima_model(data[:201], "BTC-USD", 7)
+
+        self.assertEqual(self.cache.searches, 1)
+        self.assertEqual(self.cache.updates, 1)
+
+        # Изменился последний бар - переобучение с известным порядком
+        changed = data[:201].copy()
+        changed.iloc[-1, 0] += 1.0
+        await models.arima_model(changed, "BTC-USD", 7)
+        self.assertEqual(self.cache.refits, 1)
+        # Модель с теми же датами, но другими значениями - не попадание
+        self.assertEqual(self.cache.hits, 0)
+
+        # По расписанию порядок подбирается заново
+        with patch("models.ARIMA_RESEARCH_DAYS", 7):
+            await models.arima_model(data, "BTC-USD", 7)
+        self.assertEqual(self.cache.searches, 2)
+
+    async def test_lru_eviction_by_memory_budget(self):
+        data = make_data(200)
+        await models.arima_model(data, "BTC-USD", 7)
+        self.cache.max_bytes = self.cache.bytes
+
+        await models.arima_model(
+            data.rename(columns={"BTC-USD": "ETH-USD"}), "ETH-USD", 7
+        )
+
+        # Давно не использованная модель BTC-USD вытеснена
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.evictions, 1)
+        start, end = data.index[0], data.index[-1]
+        self.assertIsNone(self.cache.get("BTC-USD", start, end))
+        self.assertIsNotNone(self.cache.get("ETH-USD", start, end))
+
+
+class CountingPool(ThreadPoolExecutor):
+    """
+    Пул потоков, запоминающий наибольшее число отправленных и еще
+    не завершенных задач (выполняющихся и ждущих в очереди).
+    """
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def submit(self, func, *args):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        future = super().submit(func, *args)
+        future.add_done_callback(self.done)
+        return future
+
+    def done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+
+@patch("models.run_cpu", new=run_threaded)
+class TestParallelSearch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pool = CountingPool(max_workers=4)
+        self.addCleanup(self.pool.shutdown)
+        patcher = patch("models.cpu_executor", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_search_stops_at_local_optimum(self):
+        series = make_data(150)["BTC-USD"]
+
+        result = await models.search_model_parallel(
+            series, budget=60, workers=4, max_p=3, max_q=3
+        )
+
+        self.assertFalse(result.timed_out)
+        self.assertGreater(result.evaluated, len(models.INITIAL_ORDERS))
+        # Ни один сосед найденного порядка не лучше по AIC
+        for order in models.neighbour_orders(result.model.order, 3, 3):
+            model = models.fit_order(series, order)
+            if model is not None:
+                self.assertGreaterEqual(model.aic(), result.model.aic() - 1e-6)
+
+    @patch("models.fit_order", new=slow_fit_order)
+    async def test_budget_returns_best_so_far(self):
+        series = make_data(150)["BTC-USD"]
+
+        started = time.monotonic()
+        result = await models.search_model_parallel(series, budget=0.2, workers=4)
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(result.evaluated, 1)
+        self.assertEqual(result.model.order, (0, 0, 0))
+
+    @patch("models.fit_order", new=slow_fit_order)
+    async def test_abandoned_fits_hold_workers(self):
+        series = make_data(150)["BTC-USD"]
+
+        # Подборы подряд: обучения, брошенные первым после срока,
+        # еще выполняются, когда начинается второй
+        for _ in range(3):
+            result = await models.search_model_parallel(series, budget=0.05, workers=2)
+            self.assertTrue(result.timed_out)
+
+        self.assertLessEqual(self.pool.max_in_flight, 2)
+        self.assertLessEqual(models.running_fits(), 2)
+        await asyncio.sleep(0.6)
+        self.assertEqual(models.running_fits(), 0)
+
+    @patch("models.ARIMA_SEARCH", "parallel")
+    async def test_fitted_model_uses_parallel_search(self):
+        cache = ModelCache()
+        with patch("models.model_cache", cache):
+            predict, conf = await models.arima_model(make_data(120), "BTC-USD", 5)
+
+        self.assertEqual(len(predict), 5)
+        self.assertEqual(cache.searches, 1)
+        self.assertGreaterEqual(cache.candidates, len(models.INITIAL_ORDERS))
+        self.assertEqual(cache.search_timeouts, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
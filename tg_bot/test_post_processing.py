@@ -0,0 +1,44 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from plots import render_predict
+from post_processing import get_data_for_plot, post_processing_data
+from synthetic import make_prices
+
+
+class TestPostProcessing(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.data = make_prices(400)
+        predict = pd.Series(np.linspace(1.0, 2.0, 30))
+        conf = np.column_stack([predict.values - 0.5, predict.values + 0.5])
+        self.predict_df = await post_processing_data(
+            predict, datetime(2001, 2, 4, 15, 30), 30, conf
+        )
+
+    async def test_forecast_dates_are_datetimes(self):
+        self.assertIsInstance(self.predict_df.index, pd.DatetimeIndex)
+        # Даты прогноза - целые дни, начиная с дня `end_date`
+        self.assertEqual(self.predict_df.index[0], pd.Timestamp("2001-02-04"))
+        self.assertEqual(self.predict_df.index[-1], pd.Timestamp("2001-03-05"))
+        self.assertEqual(self.predict_df["left_int"].iloc[0], 0.5)
+        self.assertEqual(self.predict_df["right_int"].iloc[-1], 2.5)
+
+    async def test_plot_frame_keeps_datetime_index(self):
+        concat_data = await get_data_for_plot(self.data, 60, "BTC-USD", self.predict_df)
+
+        self.assertIsInstance(concat_data.index, pd.DatetimeIndex)
+        self.assertEqual(len(concat_data), 90)
+        self.assertTrue(
+            all(dtype == np.float64 for dtype in concat_data.dtypes), concat_data.dtypes
+        )
+        self.assertTrue(concat_data["prediction"].iloc[:60].isna().all())
+        self.assertTrue(concat_data["history"].iloc[60:].isna().all())
+
+        self.assertTrue(render_predict(concat_data).startswith(b"\x89PNG"))
+
+
+if __name__ == "__main__":
+    unittest.main()
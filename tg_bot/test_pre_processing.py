@@ -0,0 +1,127 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pre_processing import data_candles, data_grp
+from synthetic import make_ohlc, make_prices
+
+
+class TestDataGrp(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.data = make_prices(800, ["BTC-USD", "ETH-USD"])
+
+    async def test_monthly_mean_matches_string_grouping(self):
+        # Прежняя реализация: группировка по строке "%B %Y"
+        frame = self.data.reset_index()
+        expected = (
+            frame.groupby(frame["Date"].dt.strftime("%B %Y"))["BTC-USD"]
+            .mean()
+            .reset_index()
+        )
+        expected["Date"] = pd.to_datetime(expected["Date"], format="%B %Y")
+        expected = expected.sort_values(by="Date").reset_index(drop=True)
+
+        df_grp = await data_grp(self.data, ["BTC-USD"])
+
+        pd.testing.assert_frame_equal(
+            df_grp, expected, check_names=False, check_index_type=False
+        )
+
+    async def test_frequencies_and_all_tickers(self):
+        for freq, expected_len in [("W", 115), ("Q", 9), ("Y", 3)]:
+            df_grp = await data_grp(self.data, ["BTC-USD", "ETH-USD"], freq=freq)
+            self.assertEqual(list(df_grp.columns), ["Date", "BTC-USD", "ETH-USD"])
+            self.assertTrue(df_grp["Date"].is_monotonic_increasing)
+            self.assertEqual(len(df_grp), expected_len)
+
+        weekly = await data_grp(self.data, ["BTC-USD"], freq="W")
+        # Метка недели - понедельник
+        self.assertTrue((weekly["Date"].dt.dayofweek == 0).all())
+
+    async def test_ohlc_and_last(self):
+        df_grp = await data_grp(self.data, ["BTC-USD"], freq="Y", how="ohlc")
+        first_year = self.data.loc["2000", "BTC-USD"]
+
+        self.assertEqual(
+            list(df_grp.columns),
+            ["Date", "BTC-USD open", "BTC-USD high", "BTC-USD low", "BTC-USD close"],
+        )
+        self.assertEqual(df_grp.loc[0, "BTC-USD open"], first_year.iloc[0])
+        self.assertEqual(df_grp.loc[0, "BTC-USD high"], first_year.max())
+        self.assertEqual(df_grp.loc[0, "BTC-USD close"], first_year.iloc[-1])
+
+        last = await data_grp(self.data, ["BTC-USD"], freq="Y", how="last")
+        self.assertEqual(last.loc[0, "BTC-USD"], first_year.iloc[-1])
+
+    async def test_vwap(self):
+        volume = pd.DataFrame(
+            np.arange(1, len(self.data) + 1, dtype="f8"),
+            index=self.data.index,
+            columns=["BTC-USD"],
+        )
+        df_grp = await data_grp(
+            self.data, ["BTC-USD"], freq="Y", how="vwap", volume=volume
+        )
+        prices = self.data.loc["2000", "BTC-USD"]
+        weights = volume.loc["2000", "BTC-USD"]
+
+        self.assertAlmostEqual(
+            df_grp.loc[0, "BTC-USD"], np.average(prices, weights=weights)
+        )
+        with self.assertRaises(ValueError):
+            await data_grp(self.data, ["BTC-USD"], how="vwap")
+
+    async def test_unknown_options(self):
+        with self.assertRaises(ValueError):
+            await data_grp(self.data, ["BTC-USD"], freq="D")
+        with self.assertRaises(ValueError):
+            await data_grp(self.data, ["BTC-USD"], how="median")
+
+
+class TestDataCandles(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Три дня минутных баров с пропуском в середине, цены float32
+        bars = make_ohlc(3 * 24 * 60, start="2024-01-01", freq="1min")
+        bars = bars.drop(bars.index[1000:1100])
+        self.bars = bars.astype({name: "f4" for name in bars.columns[:5]})
+
+    async def test_matches_pandas_resample(self):
+        candles = await data_candles(self.bars, "15m")
+        expected = (
+            self.bars.resample("15min")
+            .agg(
+                {
+                    "Open": "first",
+                    "High": "max",
+                    "Low": "min",
+                    "Close": "last",
+                    "Adj Close": "last",
+                    "Volume": "sum",
+                }
+            )
+            .dropna()
+        )
+
+        pd.testing.assert_frame_equal(
+            candles, expected, check_freq=False, check_dtype=False
+        )
+        self.assertEqual(candles["Close"].dtype, np.float32)
+        self.assertEqual(candles["Volume"].dtype, np.int64)
+
+    async def test_price_columns_take_close(self):
+        prices = self.bars[["Close"]].rename(columns={"Close": "BTC-USD"})
+        candles = await data_candles(prices, "4h")
+
+        self.assertEqual(len(candles), 18)
+        self.assertEqual(candles.index[1], pd.Timestamp("2024-01-01 04:00"))
+        self.assertEqual(candles["BTC-USD"].iloc[0], prices["BTC-USD"].iloc[239])
+
+    async def test_empty_and_invalid(self):
+        self.assertTrue((await data_candles(self.bars.iloc[:0], "5m")).empty)
+        with self.assertRaises(ValueError):
+            await data_candles(self.bars, "5s")
+
+
+if __name__ == "__main__":
+    unittest.main()
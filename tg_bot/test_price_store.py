@@ -0,0 +1,228 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from market_data import parse_interval
+from price_store import COLUMNS, PriceStore
+
+
+def fake_fetch_factory(calls):
+    """
+    Провайдер-заглушка: отдает синтетические дневные бары
+    и запоминает запрошенные диапазоны.
+    """
+
+    def fetch(ticker, start, end, interval="1d"):
+        calls.append((ticker, start, end))
+        index = pd.date_range(
+            start, end, freq=parse_interval(interval), inclusive="left", name="Date"
+        )
+        values = np.arange(len(index), dtype="f8") + index.dayofyear.values
+        frame = pd.DataFrame({name: values for name in COLUMNS}, index=index)
+        frame["Volume"] = frame["Volume"].astype("i8")
+        return frame
+
+    return fetch
+
+
+class TestPriceStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = []
+        self.store = PriceStore(self.tmp.name, fetch=fake_fetch_factory(self.calls))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stored_reads_without_fetch(self):
+        self.assertTrue(self.store.stored("BTC-USD").empty)
+        self.store.get("BTC-USD", "2023-01-01", "2023-02-01")
+
+        data = self.store.stored("BTC-USD")
+        self.assertEqual(len(data), 31)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_repeat_request_is_local_read(self):
+        first = self.store.get("BTC-USD", "2023-01-01", "2023-02-01")
+        second = self.store.get("BTC-USD", "2023-01-01", "2023-02-01")
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(first), 31)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(self.store.stats()["hits"], 1)
+        self.assertEqual(self.store.stats()["misses"], 1)
+
+    def test_overlapping_request_fetches_only_gaps(self):
+        self.store.get("BTC-USD", "2023-02-01", "2023-03-01")
+        data = self.store.get("BTC-USD", "2023-01-15", "2023-03-15")
+
+        # Докачаны только участки слева и справа от сохраненного диапазона
+        self.assertEqual(
+            self.calls[1:],
+            [
+                ("BTC-USD", pd.Timestamp("2023-01-15"), pd.Timestamp("2023-02-01")),
+                ("BTC-USD", pd.Timestamp("2023-03-01"), pd.Timestamp("2023-03-15")),
+            ],
+        )
+        self.assertEqual(len(data), 59)
+        self.assertTrue(data.index.is_monotonic_increasing)
+
+        # Вложенный диапазон читается локально
+        self.store.get("BTC-USD", "2023-02-10", "2023-02-20")
+        self.assertEqual(len(self.calls), 3)
+
+    def test_batched_fetch_for_many_tickers(self):
+        batches = []
+        fetch = fake_fetch_factory(self.calls)
+
+        def fetch_many(tickers, start, end, interval):
+            batches.append(list(tickers))
+            return {ticker: fetch(ticker, start, end, interval) for ticker in tickers}
+
+        store = PriceStore(self.tmp.name, fetch=fetch, fetch_many=fetch_many)
+        data = store.get_many(["BTC-USD", "ETH-USD"], "2023-01-01", "2023-02-01")
+
+        # Оба тикера загружены одним пакетным запросом
+        self.assertEqual(batches, [["BTC-USD", "ETH-USD"]])
+        self.assertEqual(len(data["BTC-USD"]), 31)
+        self.assertEqual(len(data["ETH-USD"]), 31)
+
+        store.get("BTC-USD", "2023-01-01", "2023-03-01")
+        self.assertEqual(batches[-1], ["BTC-USD"])
+        self.assertEqual(store.stats()["fetches"], 2)
+
+    def test_intraday_bars_are_compact(self):
+        daily = self.store.get("BTC-USD", "2023-01-01", "2023-01-03")
+        minutes = self.store.get("BTC-USD", "2023-01-01", "2023-01-03", "1m")
+
+        self.assertEqual(len(daily), 2)
+        self.assertEqual(len(minutes), 2 * 24 * 60)
+        self.assertEqual(minutes.index[1], pd.Timestamp("2023-01-01 00:01"))
+        self.assertEqual(daily["Close"].dtype, np.float64)
+        self.assertEqual(minutes["Close"].dtype, np.float32)
+        self.assertEqual(minutes["Volume"].dtype, np.int64)
+
+        # Интервалы хранятся раздельно, повторный запрос - из хранилища
+        self.store.get("BTC-USD", "2023-01-02", "2023-01-03", "1m")
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.store.stored("BTC-USD")), 2)
+
+    def test_empty_response_is_not_cached(self):
+        store = PriceStore(self.tmp.name, fetch=lambda *args: pd.DataFrame())
+        data = store.get("ETH-USD", "2023-01-01", "2023-02-01")
+        data = store.get("ETH-USD", "2023-01-01", "2023-02-01")
+
+        self.assertTrue(data.empty)
+        self.assertEqual(store.stats()["misses"], 2)
+
+    def test_fetch_does_not_block_other_requests(self):
+        started = threading.Event()
+        release = threading.Event()
+        fetch = fake_fetch_factory(self.calls)
+
+        def slow_fetch(ticker, start, end, interval="1d"):
+            if ticker == "ETH-USD":
+                started.set()
+                release.wait(5)
+            return fetch(ticker, start, end, interval)
+
+        store = PriceStore(self.tmp.name, fetch=slow_fetch)
+        store.get("BTC-USD", "2023-01-01", "2023-02-01")
+        thread = threading.Thread(
+            target=store.get, args=("ETH-USD", "2023-01-01", "2023-02-01")
+        )
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertTrue(started.wait(5))
+
+        # Пока идет загрузка ETH, другие тикеры читаются и докачиваются
+        self.assertEqual(len(store.get("BTC-USD", "2023-01-01", "2023-02-01")), 31)
+        self.assertEqual(len(store.get("LTC-USD", "2023-01-01", "2023-01-10")), 9)
+        self.assertTrue(thread.is_alive())
+
+    def test_concurrent_writers_merge_ranges(self):
+        # Второй процесс дописывает тикер, пока первый загружает свой диапазон
+        other = PriceStore(self.tmp.name, fetch=fake_fetch_factory([]))
+        fetch = fake_fetch_factory(self.calls)
+
+        def fetch_while_other_writes(ticker, start, end, interval="1d"):
+            other.get(ticker, "2023-03-01", "2023-04-01")
+            return fetch(ticker, start, end, interval)
+
+        store = PriceStore(self.tmp.name, fetch=fetch_while_other_writes)
+        store.get("BTC-USD", "2023-02-01", "2023-03-01")
+
+        # Оба диапазона сохранены и образуют непрерывное покрытие
+        self.assertEqual(len(other.stored("BTC-USD")), 59)
+        store.fetch = fetch
+        data = store.get("BTC-USD", "2023-02-01", "2023-04-01")
+        self.assertEqual(len(data), 59)
+        self.assertEqual(len(self.calls), 1)
+
+        # На диске остается одна версия данных
+        directory = Path(self.tmp.name) / "BTC-USD"
+        versions = [path.name for path in directory.glob("version-*")]
+        self.assertEqual(len(versions), 1)
+        self.assertEqual((directory / "current").readlink().name, versions[0])
+
+    def test_reads_data_written_before_versions(self):
+        self.store.get("BTC-USD", "2023-01-01", "2023-02-01")
+        # Раньше колонки лежали прямо в каталоге тикера
+        directory = Path(self.tmp.name) / "BTC-USD"
+        version = directory / (directory / "current").readlink()
+        for path in version.iterdir():
+            path.rename(directory / path.name)
+        version.rmdir()
+        (directory / "current").unlink()
+
+        self.assertEqual(len(self.store.get("BTC-USD", "2023-01-01", "2023-02-01")), 31)
+        self.assertEqual(len(self.calls), 1)
+        self.store.get("BTC-USD", "2023-01-01", "2023-02-10")
+        self.assertEqual(len(self.store.stored("BTC-USD")), 40)
+        self.assertFalse((directory / "meta.json").exists())
+
+
+    def test_partial_bar_is_refetched_after_midnight(self):
+        clock = {"now": pd.Timestamp("2023-01-10 12:00")}
+        close = {"price": 100.0}
+        fetch = fake_fetch_factory(self.calls)
+
+        def intraday_fetch(ticker, start, end, interval="1d"):
+            frame = fetch(ticker, start, end, interval)
+            frame["Close"] = close["price"]
+            return frame
+
+        def now(cls, tz=None):
+            return clock["now"]
+
+        def seconds():
+            return (clock["now"] - pd.Timestamp("2023-01-01")).total_seconds()
+
+        store = PriceStore(self.tmp.name, fetch=intraday_fetch, ttl=3600)
+        with mock.patch.object(pd.Timestamp, "now", classmethod(now)), \
+                mock.patch("price_store.time.time", seconds):
+            # Днем бар 10 января еще не закрыт
+            store.get("BTC-USD", "2023-01-01", "2023-01-11")
+            # После полуночи день закрылся с другой ценой
+            clock["now"] = pd.Timestamp("2023-01-11 09:00")
+            close["price"] = 200.0
+            data = store.get("BTC-USD", "2023-01-01", "2023-01-11")
+            self.assertEqual(
+                self.calls[-1][1:],
+                (pd.Timestamp("2023-01-10"), pd.Timestamp("2023-01-11")),
+            )
+            self.assertEqual(data["Close"].iloc[-1], 200.0)
+            self.assertEqual(data["Close"].iloc[0], 100.0)
+
+            # Окончательный бар больше не перекачивается
+            store.get("BTC-USD", "2023-01-01", "2023-01-11")
+            self.assertEqual(len(self.calls), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import gc
+import os
+import resource
+import unittest
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from plots import render_candle_agg, render_history, render_predict
+from render import FigurePool
+from synthetic import make_ohlc
+
+# Число графиков в нагрузочном тесте памяти
+SOAK_RENDERS = int(os.getenv("SOAK_RENDERS", "2000"))
+
+
+def make_history(n_days=120):
+    index = pd.date_range("2023-01-01", periods=n_days, name="Date")
+    return pd.DataFrame(
+        {"BTC-USD": np.random.default_rng(0).random(n_days)}, index=index
+    )
+
+
+def make_predict(n_days=22):
+    index = pd.date_range("2023-01-01", periods=n_days)
+    values = np.random.default_rng(1).random(n_days)
+    return pd.DataFrame(
+        {
+            "prediction": values,
+            "left_int": values - 0.1,
+            "right_int": values + 0.1,
+            "history": values,
+        },
+        index=index,
+    )
+
+
+def live_figures():
+    gc.collect()
+    return sum(isinstance(obj, Figure) for obj in gc.get_objects())
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class TestFigurePool(unittest.TestCase):
+    def test_figures_are_reused(self):
+        pool = FigurePool(size=2)
+        for _ in range(10):
+            with pool.figure(figsize=(3, 2)) as fig:
+                fig.subplots().plot([1, 2, 3])
+                # Фигура выдается чистой, без осей прошлой отрисовки
+                self.assertEqual(len(fig.axes), 1)
+
+        self.assertEqual(pool.created, 1)
+
+    def test_renders_do_not_leak_figures(self):
+        render_history(make_history(), ["BTC-USD"])
+        render_predict(make_predict())
+        before = live_figures()
+
+        for _ in range(50):
+            render_history(make_history(), ["BTC-USD"])
+            render_predict(make_predict())
+
+        self.assertEqual(live_figures(), before)
+
+    def test_candle_agg_renders_png_headless(self):
+        img_bytes = render_candle_agg(make_ohlc(60))
+
+        self.assertTrue(img_bytes.startswith(b"\x89PNG"))
+
+
+@unittest.skipUnless(os.getenv("RUN_SOAK"), "нагрузочный тест: RUN_SOAK=1")
+class TestRenderSoak(unittest.TestCase):
+    def test_memory_is_bounded(self):
+        history, predict = make_history(), make_predict()
+        # Прогрев: пул фигур и кэши шрифтов заполняются на первых графиках
+        for _ in range(100):
+            render_history(history, ["BTC-USD"])
+            render_predict(predict)
+        baseline = max_rss_kb()
+
+        for _ in range(SOAK_RENDERS // 2):
+            render_history(history, ["BTC-USD"])
+            render_predict(predict)
+
+        # Пиковая память почти не растет после прогрева
+        self.assertLess(max_rss_kb() - baseline, 20 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import random
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pandas as pd
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app import (
+    get_find_ticker,
+    get_find_ticker_predict,
+    predict_next_days,
+    send_stock_history,
+)
+
+# Число одновременных пользователей в нагрузочном тесте
+USERS = 300
+
+
+async def fake_data_loader(start_date, end_date, tickers, col_value, interval="1d"):
+    # Случайная задержка перемешивает шаги разных пользователей
+    await asyncio.sleep(random.random() / 100)
+    return pd.DataFrame({tickers[0]: [1.0]})
+
+
+async def fake_plot_history(data, tickers):
+    await asyncio.sleep(random.random() / 100)
+    return f"history {tickers[0]}"
+
+
+async def fake_forecast(ticker, periods):
+    await asyncio.sleep(random.random() / 100)
+    return pd.DataFrame({ticker: [1.0]}), ticker, None, None
+
+
+async def fake_get_data_for_plot(data, back_days, ticker_predict, predict_df):
+    return ticker_predict
+
+
+async def fake_plot_predict(data):
+    return f"predict {data}"
+
+
+def make_callback(user_id, data):
+    callback = MagicMock()
+    callback.data = data
+    callback.from_user.id = user_id
+    return callback
+
+
+def make_message(user_id, text):
+    message = MagicMock()
+    message.text = text
+    message.chat.id = user_id
+    message.reply = AsyncMock()
+    return message
+
+
+class TestConcurrentSessions(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.storage = MemoryStorage()
+        self.sent = {}
+
+        async def send_photo(chat_id, photo):
+            self.sent.setdefault(chat_id, []).append(photo)
+
+        self.bot = MagicMock()
+        self.bot.answer_callback_query = AsyncMock()
+        self.bot.send_message = AsyncMock()
+        self.bot.send_photo = AsyncMock(side_effect=send_photo)
+
+    def state(self, user_id):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        return FSMContext(storage=self.storage, key=key)
+
+    async def history_session(self, user_id, coin):
+        state = self.state(user_id)
+        await get_find_ticker(make_callback(user_id, coin), state)
+        await asyncio.sleep(random.random() / 100)
+        await send_stock_history(make_message(user_id, "2023-01-01 2023-12-31"), state)
+
+    async def predict_session(self, user_id, coin):
+        state = self.state(user_id)
+        await get_find_ticker_predict(make_callback(user_id, f"{coin}_predict"), state)
+        await asyncio.sleep(random.random() / 100)
+        await predict_next_days(make_message(user_id, "7"), state)
+
+    @patch("app.plot_predict", side_effect=fake_plot_predict)
+    @patch("app.get_data_for_plot", side_effect=fake_get_data_for_plot)
+    @patch("app.post_processing_data", new_callable=AsyncMock)
+    @patch("app.forecast_cache.get", side_effect=fake_forecast)
+    @patch("app.plot_history", side_effect=fake_plot_history)
+    @patch("app.data_loader", side_effect=fake_data_loader)
+    async def test_interleaved_sessions_keep_own_ticker(self, *mocks):
+        coins = {
+            user_id: random.choice(["BTC-USD", "ETH-USD"]) for user_id in range(USERS)
+        }
+        with patch("app.bot", self.bot):
+            await asyncio.gather(
+                *(
+                    self.history_session(user_id, coin)
+                    for user_id, coin in coins.items()
+                ),
+                *(
+                    self.predict_session(USERS + user_id, coin)
+                    for user_id, coin in coins.items()
+                ),
+            )
+
+        # Каждый пользователь получил ровно один график своей монеты
+        for user_id, coin in coins.items():
+            self.assertEqual(self.sent[user_id], [f"history {coin}"])
+            self.assertEqual(self.sent[USERS + user_id], [f"predict {coin}"])
+
+
+if __name__ == "__main__":
+    unittest.main()
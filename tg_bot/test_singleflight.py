@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+import models
+import plots
+import pre_processing
+from chart_cache import ChartCache
+from model_cache import ModelCache
+from singleflight import SingleFlight
+from synthetic import make_ohlc, make_prices
+
+# Число одновременных одинаковых запросов
+USERS = 50
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_result(self):
+        flights = SingleFlight("test")
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return [value]
+
+        results = await asyncio.gather(
+            *(flights.do("a", compute, 1) for _ in range(USERS)),
+            flights.do("b", compute, 2),
+        )
+
+        self.assertEqual(calls, [1, 2])
+        self.assertTrue(all(result is results[0] for result in results[:USERS]))
+        self.assertEqual(flights.stats()["shared"], USERS - 1)
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+        # Завершенное вычисление не кэшируется
+        await flights.do("a", compute, 1)
+        self.assertEqual(calls, [1, 2, 1])
+
+    async def test_exception_is_fanned_out(self):
+        flights = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider is down")
+
+        results = await asyncio.gather(
+            *(flights.do("a", fail) for _ in range(3)), return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flights.calls, 1)
+
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        flights = SingleFlight("test")
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flights.do("a", compute))
+        second = asyncio.create_task(flights.do("a", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        self.assertEqual(await second, "done")
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+
+class TestCoalescedHotPaths(unittest.IsolatedAsyncioTestCase):
+    async def test_data_loader_downloads_once(self):
+        data = make_prices(100)
+        store = MagicMock()
+        store.get_many.side_effect = lambda tickers, start, end, interval: {
+            ticker: data.rename(columns={"BTC-USD": "Adj Close"}) for ticker in tickers
+        }
+
+        with patch("pre_processing.price_store", store):
+            # Время запроса разное, но диапазон дней один
+            results = await asyncio.gather(
+                *(
+                    pre_processing.data_loader(
+                        "2023-01-01",
+                        f"2023-02-01 10:00:{i % 60:02d}",
+                        ["BTC-USD"],
+                        "Adj Close",
+                    )
+                    for i in range(USERS)
+                )
+            )
+
+        self.assertEqual(store.get_many.call_count, 1)
+        self.assertEqual(len(results), USERS)
+
+    @patch("models.run_cpu", new=run_inline)
+    @patch("models.model_cache", new_callable=ModelCache)
+    async def test_arima_model_fits_once(self, cache):
+        data = make_prices(120)
+        with patch("models.search_model", wraps=models.search_model) as search:
+            results = await asyncio.gather(
+                *(models.arima_model(data, "BTC-USD", 1 + i % 7) for i in range(USERS))
+            )
+
+        # Горизонты разные, но модель обучена один раз
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual(cache.searches, 1)
+        self.assertEqual(len(results[6][0]), 7)
+
+    @patch("plots.run_cpu", new=run_inline)
+    @patch("plots.chart_cache", new_callable=ChartCache)
+    async def test_chart_is_rendered_once(self, cache):
+        data = make_ohlc(60)
+        render = MagicMock(return_value=b"png")
+        shared = plots.chart_flights.shared
+
+        results = await asyncio.gather(
+            *(
+                plots.render_cached("candle", None, data, render, data)
+                for _ in range(USERS)
+            )
+        )
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(results, [b"png"] * USERS)
+        # Все запросы промахнулись мимо кэша, но дождались одной отрисовки
+        self.assertEqual(cache.misses, USERS)
+        self.assertEqual(plots.chart_flights.shared - shared, USERS - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
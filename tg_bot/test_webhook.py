@@ -0,0 +1,122 @@
+import socket
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import aiohttp
+from aiogram.methods import SendMessage
+from aiohttp.test_utils import TestClient, TestServer
+
+from app import bot, dp
+from webhook import create_app, run_webhook, worker_metrics_port
+
+SECRET = "test-secret"
+
+
+def start_update(update_id, chat_id):
+    """
+    Синтетическое обновление Telegram с командой /start.
+    """
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": "/start",
+        },
+    }
+
+
+def stub_leader(test):
+    """
+    Подменяет ведущий процесс: фоновые задачи (рассылка дайджеста,
+    пересчет прогнозов) запускаются вместе с сервером и писали бы
+    в рабочий каталог и реальным подписчикам.
+    """
+    leader = MagicMock(run=AsyncMock())
+    patcher = patch("app.leader", leader)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return leader
+
+
+class TestWebhook(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        stub_leader(self)
+        app = create_app(dp, bot, secret_token=SECRET, handle_in_background=False)
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    @patch.object(bot.session, "make_request", new_callable=AsyncMock)
+    async def test_update_is_handled(self, mock_make_request):
+        response = await self.client.post(
+            "/webhook",
+            json=start_update(1, 42),
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+
+        self.assertEqual(response.status, 200)
+        # Обработчик /start ответил через Bot API
+        method = mock_make_request.call_args.args[1]
+        self.assertIsInstance(method, SendMessage)
+        self.assertEqual(method.chat_id, 42)
+        self.assertEqual(method.text, "Выбери одну из кнопок:")
+
+    @patch.object(bot.session, "make_request", new_callable=AsyncMock)
+    async def test_wrong_secret_is_rejected(self, mock_make_request):
+        response = await self.client.post(
+            "/webhook",
+            json=start_update(2, 42),
+            headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+        )
+
+        self.assertEqual(response.status, 401)
+        mock_make_request.assert_not_called()
+
+
+class TestWorkerMetrics(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        stub_leader(self)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.metrics_port = sock.getsockname()[1]
+        app = create_app(dp, bot, secret_token=SECRET, metrics_port=self.metrics_port)
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_metrics_on_worker_port(self):
+        # Общий порт вебхука метрики не отдает
+        response = await self.client.get("/metrics")
+        self.assertEqual(response.status, 404)
+
+        async with aiohttp.ClientSession() as session:
+            url = f"http://127.0.0.1:{self.metrics_port}/metrics"
+            async with session.get(url) as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn("bot_request_seconds", await response.text())
+
+    def test_worker_ports(self):
+        self.assertEqual(
+            [worker_metrics_port(9100, i) for i in range(3)], [9100, 9101, 9102]
+        )
+        self.assertEqual(worker_metrics_port(0, 2), 0)
+
+
+class TestRunWebhook(unittest.TestCase):
+    @patch("webhook.set_webhook")
+    def test_workers_require_shared_storage(self, mock_set_webhook):
+        # Состояние FSM в памяти процесса не видно другим воркерам
+        with self.assertRaises(ValueError):
+            run_webhook(dp, bot, workers=2)
+        mock_set_webhook.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import (SimpleRequestHandler,
+                                            setup_application)
+from aiohttp import web
+
+import metrics
+from config import (METRICS_HOST, METRICS_PORT, WEB_SERVER_HOST,
+                    WEB_SERVER_PORT, WEB_WORKERS, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBHOOK_URL)
+
+# Сервер метрик воркера в состоянии веб-приложения
+METRICS_RUNNER = web.AppKey("metrics_runner", web.AppRunner)
+
+
+def create_app(
+    dispatcher,
+    bot,
+    path=WEBHOOK_PATH,
+    secret_token=WEBHOOK_SECRET,
+    handle_in_background=True,
+    metrics_port=None,
+):
+    """
+    Веб-приложение aiohttp, принимающее обновления Telegram по вебхуку.
+
+    :param dispatcher: Диспетчер aiogram;
+    :param bot: Объект бота;
+    :param path: Путь вебхука;
+    :param secret_token: Секрет из заголовка
+     `X-Telegram-Bot-Api-Secret-Token`, None - без проверки;
+    :param handle_in_background: Отвечать Telegram сразу, не дожидаясь
+     окончания обработки обновления;
+    :param metrics_port: Порт отдельного сервера метрик воркера; None -
+     `/metrics` на порту веб-сервера, 0 - без метрик;
+    :return: Приложение `aiohttp.web.Application`.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=handle_in_background,
+        secret_token=secret_token,
+    ).register(app, path=path)
+    if metrics_port is None:
+        metrics.add_routes(app)
+    elif metrics_port:
+        # Несколько воркеров делят порт веб-сервера, и `/metrics` отдал бы
+        # случайный из них: у каждого воркера свой порт метрик
+        async def start_metrics(app):
+            app[METRICS_RUNNER] = await metrics.start_server(
+                METRICS_HOST, metrics_port
+            )
+
+        async def stop_metrics(app):
+            await app[METRICS_RUNNER].cleanup()
+
+        app.on_startup.append(start_metrics)
+        app.on_cleanup.append(stop_metrics)
+    # Запуск и остановка диспетчера вместе с веб-приложением
+    setup_application(app, dispatcher, bot=bot)
+
+    async def on_cleanup(app):
+        await dispatcher.storage.close()
+        await bot.session.close()
+
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def worker_metrics_port(metrics_port, index):
+    """
+    Порт метрик воркера номер `index` (с нуля) или 0, если метрики выключены.
+    """
+    return metrics_port + index if metrics_port else 0
+
+
+async def set_webhook(bot, url=WEBHOOK_URL, path=WEBHOOK_PATH):
+    """
+    Регистрация вебхука в Telegram (один раз, до запуска воркеров).
+    """
+    await bot.set_webhook(
+        f"{url}{path}", secret_token=WEBHOOK_SECRET, drop_pending_updates=True
+    )
+    await bot.session.close()
+
+
+def serve(dispatcher, bot, host, port, reuse_port, metrics_port=None):
+    """
+    Запуск веб-сервера в текущем процессе до SIGINT/SIGTERM.
+    """
+    web.run_app(
+        create_app(dispatcher, bot, metrics_port=metrics_port),
+        host=host,
+        port=port,
+        reuse_port=reuse_port,
+        print=None,
+    )
+
+
+def run_webhook(
+    dispatcher,
+    bot,
+    host=WEB_SERVER_HOST,
+    port=WEB_SERVER_PORT,
+    workers=WEB_WORKERS,
+    metrics_port=METRICS_PORT,
+):
+    """
+    Режим вебхука: регистрирует вебхук и запускает `workers` процессов,
+    которые слушают один порт (SO_REUSEPORT) и делят входящие обновления.
+    Один воркер отдает метрики на `/metrics` веб-сервера, несколько -
+    каждый на своем порту `metrics_port + номер воркера`.
+
+    :param dispatcher: Диспетчер aiogram;
+    :param bot: Объект бота;
+    :param host: Адрес веб-сервера;
+    :param port: Порт веб-сервера;
+    :param workers: Число процессов-воркеров;
+    :param metrics_port: Порт метрик первого воркера (0 - без метрик).
+    """
+    if workers > 1 and isinstance(dispatcher.storage, MemoryStorage):
+        # Следующее сообщение пользователя может попасть в другой воркер,
+        # который не знает его состояния
+        raise ValueError(
+            "WEB_WORKERS > 1 requires a shared FSM storage, set FSM_STORAGE_URL"
+        )
+    asyncio.run(set_webhook(bot))
+    if workers == 1:
+        serve(dispatcher, bot, host, port, reuse_port=False)
+        return
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=serve,
+            args=(
+                dispatcher,
+                bot,
+                host,
+                port,
+                True,
+                worker_metrics_port(metrics_port, i),
+            ),
+            name=f"web-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logging.info("Webhook server: %s workers on %s:%s", workers, host, port)
+
+    def stop(*args):
+        # Воркеры получают SIGTERM и корректно завершают обработку
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop()
+        for process in processes:
+            process.join()